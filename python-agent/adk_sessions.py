@@ -0,0 +1,334 @@
+"""
+Bounded session service for the ADK Runner
+Each client conversation gets its own ADK session, keyed by (userId,
+sessionId). Sessions are held in memory with idle TTL and LRU eviction
+(SESSION_TTL, SESSION_MAX_SESSIONS), and each keeps at most
+ADK_SESSION_MAX_EVENTS events: whole turns are dropped from the front, so the
+history the agent sends to the model stays bounded.
+With ADK_SESSION_DB set to a file path, sessions are written through to
+SQLite (WAL mode), so they survive restarts and instances sharing the file see
+each other's turns. The memory copy is then a cache, reloaded when the file
+has newer events. app: and user: state keys are stored with the session like
+any other key. The file is opened per process on first use, so the service is
+safe to create before a pre-fork server forks its workers; with a SQLite
+SHARED_STATE_URL (shared_state.py) it defaults to that file. Database work
+runs in a worker thread, so a writer waiting on the file lock does not stall
+the event loop the ADK turns run on.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session, State
+from google.adk.sessions.base_session_service import ListSessionsResponse
+
+from session_store import SESSION_MAX_SESSIONS, SESSION_TTL
+from shared_state import SHARED_STATE_URL, run_blocking, sqlite_path
+
+logger = logging.getLogger(__name__)
+
+ADK_SESSION_MAX_EVENTS = int(os.getenv('ADK_SESSION_MAX_EVENTS', 50))
+ADK_SESSION_DB = os.getenv('ADK_SESSION_DB') or sqlite_path(SHARED_STATE_URL)
+
+# Expired sessions are deleted from the database at most this often (seconds)
+PRUNE_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    last_update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (last_update_time);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_session ON events (app_name, user_id, session_id, seq);
+"""
+
+
+def turn_start(events, max_events):
+    """Index of the first event to keep so at most max_events remain, cutting only at user turns"""
+    excess = len(events) - max_events
+    if excess <= 0:
+        return 0
+    for i in range(excess, len(events)):
+        if events[i].author == 'user':
+            return i
+    # The latest turn alone is over the cap: keep it whole rather than split a tool call
+    for i in range(excess - 1, 0, -1):
+        if events[i].author == 'user':
+            return i
+    return 0
+
+
+class BoundedSessionService(BaseSessionService):
+    """ADK session service with LRU / idle-TTL eviction, an event cap and optional SQLite persistence"""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl=SESSION_TTL,
+                 max_events=ADK_SESSION_MAX_EVENTS, path=ADK_SESSION_DB):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_events = max_events
+        self.path = path
+        # (app_name, user_id, session_id) -> [Session, last access (monotonic)]
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._pruned_at = 0.0
+        self.evictions = 0
+        self.expired = 0
+        self.trimmed_events = 0
+        self.reloads = 0
+        if path:
+            logger.info(f"ADK sessions persisted to {path}")
+
+    @property
+    def _db(self):
+        """This process's connection (None without a path); one inherited across fork is not used"""
+        if self.path and self._pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA busy_timeout=5000')
+            db.executescript(SCHEMA)
+            self._conn, self._pid = db, os.getpid()
+        return self._conn
+
+    async def create_session(self, *, app_name, user_id, state=None, session_id=None):
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        session = Session(app_name=app_name, user_id=user_id, id=session_id,
+                          state=state or {}, last_update_time=time.time())
+        return await run_blocking(self.path, self._create, session)
+
+    async def get_session(self, *, app_name, user_id, session_id, config=None):
+        copied = await run_blocking(self.path, self._get, (app_name, user_id, session_id))
+        if copied is None:
+            return None
+        if config:
+            if config.num_recent_events:
+                copied.events = copied.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                copied.events = [e for e in copied.events if e.timestamp >= config.after_timestamp]
+        return copied
+
+    async def ensure_session(self, *, app_name, user_id, session_id):
+        """Create the session unless it exists (cheaper than get_session: nothing is copied)"""
+        if await run_blocking(self.path, self._exists, (app_name, user_id, session_id)):
+            return
+        await self.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def list_sessions(self, *, app_name, user_id):
+        return ListSessionsResponse(sessions=await run_blocking(self.path, self._list, app_name, user_id))
+
+    async def delete_session(self, *, app_name, user_id, session_id):
+        await run_blocking(self.path, self._delete, (app_name, user_id, session_id))
+
+    async def append_event(self, session, event):
+        # Updates the caller's copy (state delta, events); partial stream chunks are not stored
+        await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+        session.last_update_time = event.timestamp
+        await run_blocking(self.path, self._append, session, event)
+        return event
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'maxSessions': self.max_sessions,
+                'maxEvents': self.max_events,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'trimmedEvents': self.trimmed_events,
+                'reloads': self.reloads,
+                'persistent': bool(self.path),
+            }
+
+    # The methods below may touch the database and run in a worker thread when there is one
+
+    def _create(self, session):
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            self._cache(key, session)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('BEGIN')
+                    self._delete_rows(*key)
+                    self._write_session(session)
+                self._prune()
+            return self._copy(session)
+
+    def _get(self, key):
+        with self._lock:
+            session = self._lookup(key)
+            return self._copy(session) if session is not None else None
+
+    def _exists(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _list(self, app_name, user_id):
+        with self._lock:
+            if self._db is not None:
+                rows = self._db.execute(
+                    'SELECT session_id, state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ?',
+                    (app_name, user_id)
+                ).fetchall()
+                sessions = [Session(app_name=app_name, user_id=user_id, id=sid, state=json.loads(state),
+                                    last_update_time=updated) for sid, state, updated in rows]
+            else:
+                sessions = [
+                    Session(app_name=app_name, user_id=user_id, id=s.id, state=dict(s.state),
+                            last_update_time=s.last_update_time)
+                    for (app, user, _), (s, _) in self._sessions.items() if app == app_name and user == user_id
+                ]
+        return sessions
+
+    def _delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('BEGIN')
+                    self._delete_rows(*key)
+
+    def _append(self, session, event):
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            stored = self._lookup(key)
+            if stored is None:
+                # Evicted or expired while the turn was running: keep the caller's copy
+                stored = self._cache(key, self._copy(session))[0]
+                fresh = True
+            else:
+                if event.actions and event.actions.state_delta:
+                    stored.state.update({k: v for k, v in event.actions.state_delta.items()
+                                         if not k.startswith(State.TEMP_PREFIX)})
+                stored.events.append(event)
+                stored.last_update_time = event.timestamp
+                fresh = False
+            start = turn_start(stored.events, self.max_events)
+            dropped = stored.events[:start]
+            if start:
+                del stored.events[:start]
+                self.trimmed_events += start
+            if self._db is not None:
+                with self._db:
+                    self._db.execute('BEGIN')
+                    self._db.executemany(
+                        'INSERT INTO events (app_name, user_id, session_id, event_id, data) VALUES (?, ?, ?, ?, ?)',
+                        [key + (e.id, e.model_dump_json(exclude_none=True))
+                         for e in (stored.events if fresh else [event])]
+                    )
+                    if dropped:
+                        self._db.execute(
+                            f"DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? "
+                            f"AND event_id IN ({','.join('?' * len(dropped))})",
+                            key + tuple(e.id for e in dropped)
+                        )
+                    self._write_session(stored)
+
+    def _copy(self, session):
+        # Events are not mutated once stored, so a shallow copy of the list is enough
+        return session.model_copy(update={'events': list(session.events), 'state': dict(session.state)})
+
+    def _cache(self, key, session):
+        """Insert as most recently used, evicting expired then least recently used entries"""
+        now = time.monotonic()
+        entry = self._sessions[key] = [session, now]
+        self._sessions.move_to_end(key)
+        self._evict(now)
+        return entry
+
+    def _lookup(self, key):
+        """Stored session for key (memory, else the database), or None; refreshes its LRU position"""
+        now = time.monotonic()
+        self._evict(now)
+        entry = self._sessions.get(key)
+        if self._db is not None:
+            row = self._db.execute(
+                'SELECT last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?', key
+            ).fetchone()
+            if row is None:
+                self._sessions.pop(key, None)
+                return None
+            if entry is None or entry[0].last_update_time < row[0]:
+                # Not cached here, or another instance has appended since
+                if entry is not None:
+                    self.reloads += 1
+                entry = self._cache(key, self._load(key))
+        if entry is None:
+            return None
+        entry[1] = now
+        self._sessions.move_to_end(key)
+        return entry[0]
+
+    def _evict(self, now):
+        while self._sessions:
+            key, (_, touched) = next(iter(self._sessions.items()))
+            if now - touched < self.ttl:
+                break
+            del self._sessions[key]
+            self.expired += 1
+        while len(self._sessions) > self.max_sessions:
+            # With a database the session is only dropped from the cache
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key):
+        state, updated = self._db.execute(
+            'SELECT state, last_update_time FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?', key
+        ).fetchone()
+        events = [Event.model_validate_json(data) for (data,) in self._db.execute(
+            'SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq', key
+        )]
+        return Session(app_name=key[0], user_id=key[1], id=key[2], state=json.loads(state),
+                       events=events, last_update_time=updated)
+
+    def _write_session(self, session):
+        self._db.execute(
+            'INSERT OR REPLACE INTO sessions (app_name, user_id, session_id, state, last_update_time) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (session.app_name, session.user_id, session.id,
+             json.dumps(session.state, default=str), session.last_update_time)
+        )
+
+    def _delete_rows(self, app_name, user_id, session_id):
+        key = (app_name, user_id, session_id)
+        self._db.execute('DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?', key)
+        self._db.execute('DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?', key)
+
+    def _prune(self):
+        """Delete sessions idle for longer than the TTL from the database"""
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        cutoff = time.time() - self.ttl
+        with self._db:
+            self._db.execute('BEGIN')
+            self._db.execute(
+                'DELETE FROM events WHERE (app_name, user_id, session_id) IN '
+                '(SELECT app_name, user_id, session_id FROM sessions WHERE last_update_time < ?)', (cutoff,)
+            )
+            deleted = self._db.execute('DELETE FROM sessions WHERE last_update_time < ?', (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} expired ADK sessions from {self.path}")
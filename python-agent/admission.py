@@ -0,0 +1,347 @@
+"""
+Admission control for the chat endpoints
+Every /chat request can become a paid upstream call, so requests are admitted
+in two steps before any work is done:
+1. A per-client token bucket (RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST) keyed by
+   API key, IP or session; an empty bucket is a 429 with Retry-After.
+2. A global cap on concurrent chat requests (MAX_CONCURRENT_REQUESTS). Above
+   the cap requests wait in a bounded queue (ADMISSION_MAX_QUEUE) for at most
+   ADMISSION_MAX_WAIT_MS; a full queue or an expired wait is a 503 with
+   Retry-After.
+Both steps are O(1) per request, and the bucket table is an LRU bounded by
+RATE_LIMIT_MAX_CLIENTS, so memory stays flat however many clients appear.
+With a shared store (shared_state.py) the buckets live there, so a client gets
+the same limit however many workers serve it. The concurrency cap is per
+worker process.
+
+Admission is opt-in (ADMISSION_ENABLED=true): keyed by the socket address, every
+user behind the Next.js proxy or the Cloud Run front end would share a single
+bucket. Enable it once clients are told apart: an API key the proxy sends,
+ADMISSION_PROXY_HOPS for a trusted X-Forwarded-For, or RATE_LIMIT_KEY=session.
+"""
+
+from collections import OrderedDict
+import asyncio
+import functools
+import hashlib
+import math
+import os
+import threading
+import time
+import weakref
+
+from shared_state import failed, run_blocking
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'false').lower() == 'true'
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 30))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 10))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv('RATE_LIMIT_MAX_CLIENTS', 10000))
+# api_key: API key, else IP. ip: always IP. session: API key, else sessionId, else IP
+# (for deployments where every request arrives from the Next.js proxy's address)
+RATE_LIMIT_KEY = os.getenv('RATE_LIMIT_KEY', 'api_key')
+# Number of trusted proxies appending to X-Forwarded-For (0 = use the socket address)
+ADMISSION_PROXY_HOPS = int(os.getenv('ADMISSION_PROXY_HOPS', 0))
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 50))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 100))
+ADMISSION_MAX_WAIT_MS = float(os.getenv('ADMISSION_MAX_WAIT_MS', 5000))
+
+
+def client_key(headers, remote_addr, data=None, mode=RATE_LIMIT_KEY, proxy_hops=ADMISSION_PROXY_HOPS):
+    """Rate-limit key for a request; API keys are hashed so they are not kept in memory"""
+    api_key = headers.get('X-API-Key')
+    auth = headers.get('Authorization', '')
+    if not api_key and auth.startswith('Bearer '):
+        api_key = auth[7:]
+    if api_key and mode != 'ip':
+        return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    if mode == 'session' and isinstance(data, dict) and isinstance(data.get('sessionId'), str):
+        return 'session:' + data['sessionId'][:128]
+    ip = remote_addr
+    if proxy_hops > 0:
+        hops = [h.strip() for h in headers.get('X-Forwarded-For', '').split(',') if h.strip()]
+        if hops:
+            ip = hops[-min(proxy_hops, len(hops))]
+    return f"ip:{ip}"
+
+
+class RateLimiter:
+    """Per-client token buckets, least recently seen clients evicted past max_clients"""
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS,
+                 shared=None):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.shared = shared
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def _take(self, bucket, now, cost=1):
+        """
+        Refill a [tokens, updated] bucket to now and take cost tokens; returns the wait (0 = allowed)
+
+        A request is let in if one token is left; a costlier one (a batch) leaves
+        the bucket in debt, which the client's next requests wait out.
+        """
+        tokens = min(self.burst, bucket[0] + max(0.0, now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - cost
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def acquire(self, key, cost=1):
+        """Take cost tokens; returns 0 if allowed, else seconds until a token is available"""
+        if self.shared is not None:
+            return self._shared_acquire(key, cost)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = self._take(bucket, now, cost)
+            if wait:
+                self.limited += 1
+            return wait
+
+    def _shared_acquire(self, key, cost=1):
+        # Wall-clock time: the bucket is refilled by whichever process sees it next
+        wait = []
+
+        def take(bucket):
+            bucket = bucket or [self.burst, time.time()]
+            wait[:] = [self._take(bucket, time.time(), cost)]
+            return bucket
+        try:
+            # A bucket left alone until it is full again is the same as no bucket
+            self.shared.update('ratelimit', key, take, self.burst / self.rate + 1 if self.rate > 0 else 60.0)
+        except Exception as e:
+            # Fail open: an unreachable store must not turn every request away
+            failed(self.shared, 'rate limit', e)
+            return 0
+        with self._lock:
+            if wait[0]:
+                self.limited += 1
+        return wait[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._buckets),
+                'shared': self.shared is not None,
+                'perMinute': self.rate * 60,
+                'burst': self.burst,
+                'limited': self.limited,
+            }
+
+
+class ConcurrencyLimiter:
+    """Thread-based concurrency cap with a bounded FIFO-ish wait queue"""
+
+    def __init__(self, limit=MAX_CONCURRENT_REQUESTS, max_queue=ADMISSION_MAX_QUEUE, max_wait_ms=ADMISSION_MAX_WAIT_MS):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self.timeouts = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """True once a slot is held; False if the queue is full or the wait timed out"""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def try_acquire(self):
+        """Take a slot only if one is free and nobody is queued for it (never waits)"""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return True
+            return False
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'maxQueue': self.max_queue,
+            'shed': self.shed,
+            'timeouts': self.timeouts,
+        }
+
+
+class AsyncConcurrencyLimiter(ConcurrencyLimiter):
+    """asyncio counterpart of ConcurrencyLimiter (one event loop; the semaphore wakes waiters in order)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if not self._semaphore.locked() and not self.waiting:
+            await self._semaphore.acquire()
+            self.active += 1
+            return True
+        if self.waiting >= self.max_queue:
+            self.shed += 1
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return False
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class Ticket:
+    """An admitted request's concurrency slot; release() is idempotent (no-op without a limiter)"""
+
+    __slots__ = ('limiter', 'released')
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter
+        self.released = limiter is None
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter.release()
+
+
+class AdmissionController:
+    def __init__(self, rate_limiter=None, limiter=None, enabled=ADMISSION_ENABLED):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.limiter = limiter or ConcurrencyLimiter()
+        self.enabled = enabled
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'rateLimit': self.rate_limiter.stats(),
+            'concurrency': self.limiter.stats(),
+        }
+
+
+def _rejection(status, retry_after):
+    message = 'Too many requests, slow down' if status == 429 else 'Server is overloaded, try again shortly'
+    seconds = max(1, math.ceil(retry_after))
+    return {'error': message, 'retryAfter': seconds}, status, {'Retry-After': str(seconds)}
+
+
+def _overloaded(controller):
+    # A waiter gives up after max_wait, so that is when a slot is expected to free up
+    return _rejection(503, controller.limiter.max_wait or 1)
+
+
+def flask_admitted(controller, cost=None):
+    """
+    Decorator for Flask views: rate limit, then hold a concurrency slot
+
+    The slot is released when the response is returned, or for a streamed
+    response when the WSGI server closes it. cost(body) is the number of
+    rate-limit tokens a request takes (default 1), e.g. one per batch item.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import g, jsonify, make_response, request
+            if not controller.enabled:
+                g.admission = Ticket()
+                return view(*args, **kwargs)
+            data = request.get_json(silent=True) if RATE_LIMIT_KEY == 'session' or cost else None
+            key = client_key(request.headers, request.remote_addr, data)
+            retry_after = controller.rate_limiter.acquire(key, max(1, cost(data)) if cost else 1)
+            if retry_after:
+                body, status, headers = _rejection(429, retry_after)
+                return jsonify(body), status, headers
+            if not controller.limiter.acquire():
+                body, status, headers = _overloaded(controller)
+                return jsonify(body), status, headers
+            ticket = g.admission = Ticket(controller.limiter)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+        return wrapper
+    return decorator
+
+
+def quart_admitted(controller):
+    """Async counterpart of flask_admitted; a streaming view's body generator calls g.admission.release()"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            from quart import g, jsonify, make_response, request
+            if not controller.enabled:
+                g.admission = Ticket()
+                return await view(*args, **kwargs)
+            data = await request.get_json(silent=True) if RATE_LIMIT_KEY == 'session' else None
+            key = client_key(request.headers, request.remote_addr, data)
+            retry_after = await run_blocking(controller.rate_limiter.shared, controller.rate_limiter.acquire, key)
+            if retry_after:
+                body, status, headers = _rejection(429, retry_after)
+                return jsonify(body), status, headers
+            if not await controller.limiter.acquire():
+                body, status, headers = _overloaded(controller)
+                return jsonify(body), status, headers
+            ticket = g.admission = Ticket(controller.limiter)
+            try:
+                response = await make_response(await view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if response.mimetype != 'text/event-stream':
+                ticket.release()
+            else:
+                # Backstop if the body is never iterated (client gone before the first chunk)
+                weakref.finalize(response, ticket.release)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,212 @@
+"""
+Structured risk analysis for /analyze
+ANALYSIS MODE answers from /chat are free text: the frontend cannot reuse a
+score, and every user asking about the same contract costs another completion.
+/analyze takes {chain, address | project} and returns one JSON document that is
+validated against ANALYSIS_SCHEMA. Results are cached by (chain, checksummed
+address or project name, language, prompt version) for ANALYZE_CACHE_TTL and
+coalesced while in flight, so a trending token costs one completion per TTL
+window however many users ask.
+"""
+
+from collections import namedtuple
+import json
+import os
+import re
+import time
+
+from evm_utils import has_valid_checksum, is_address, to_checksum_address
+from prompt_sections import Section, build_structured_prompt
+from whale_registry import whale_registry
+
+ANALYZE_CACHE_TTL = float(os.getenv('ANALYZE_CACHE_TTL', 3600))
+ANALYZE_CACHE_MAX_ENTRIES = int(os.getenv('ANALYZE_CACHE_MAX_ENTRIES', 10000))
+
+CATEGORIES = ('large', 'defi', 'small', 'meme', 'airdrop')
+RISK_LEVELS = ('low', 'medium', 'high')
+SCAM_FLAGS = (
+    'liquidity_unlocked', 'unlimited_mint', 'honeypot', 'unverified_contract', 'ownership_not_renounced',
+    'unclear_tokenomics', 'privileged_functions', 'holder_concentration', 'dangerous_approvals',
+    'seed_phrase_request',
+)
+LANGUAGES = {'id': 'Indonesian', 'en': 'English'}
+MAX_PROJECT_CHARS = 100
+
+ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'additionalProperties': False,
+    'required': ['summary', 'category', 'score', 'riskLevel', 'keyFindings', 'scamFlags'],
+    'properties': {
+        'summary': {'type': 'string', 'maxLength': 600},
+        'category': {'type': 'string', 'enum': list(CATEGORIES)},
+        'score': {'type': ['integer', 'null'], 'minimum': 0, 'maximum': 100},
+        'riskLevel': {'type': 'string', 'enum': list(RISK_LEVELS)},
+        'keyFindings': {'type': 'array', 'maxItems': 8, 'items': {'type': 'string', 'maxLength': 300}},
+        'scamFlags': {'type': 'array', 'uniqueItems': True, 'items': {'type': 'string', 'enum': list(SCAM_FLAGS)}},
+    },
+}
+
+OUTPUT_FORMAT = Section('analysis_json', 1, f"""RESPONSE FORMAT (STRUCTURED ANALYSIS):
+Answer with a single JSON object and nothing else (no prose, no markdown, no code fences) matching this JSON schema:
+{json.dumps(ANALYSIS_SCHEMA)}
+
+Field rules:
+- category: large (established coin / Layer-1), defi (established DeFi protocol), small (small-cap or new token), meme, airdrop
+- score: 0-100 following the scoring rubric for large and defi projects; null when the rubric does not apply
+- riskLevel: low, medium or high following the risk classification; high if any scamFlags apply or key data is missing
+- keyFindings: at most 8 short factual findings, including what could not be verified
+- scamFlags: every anti-scam condition detected, or an empty list
+- summary: 1-2 neutral, factual sentences
+Write summary and keyFindings in the language the user asks for.""")
+
+# What to analyze: address is checksummed, project is None for contracts (and vice versa)
+Target = namedtuple('Target', ['chain', 'address', 'project', 'lang'])
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+_TYPES = {
+    'object': dict, 'array': list, 'string': str, 'integer': int, 'number': (int, float),
+    'boolean': bool, 'null': type(None),
+}
+
+
+class InvalidAnalysis(ValueError):
+    """The model's answer is not a valid analysis document"""
+
+
+def schema_errors(value, schema, path='$'):
+    """Violations of the JSON Schema subset used by ANALYSIS_SCHEMA (an empty list if valid)"""
+    types = schema.get('type')
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        # bool is an int in Python but not in JSON
+        if (isinstance(value, bool) and 'boolean' not in types) or not isinstance(value, tuple(_TYPES[t] for t in types)):
+            return [f"{path}: expected {' or '.join(types)}"]
+    if 'enum' in schema and value not in schema['enum']:
+        return [f"{path}: {value!r} is not one of {schema['enum']}"]
+    errors = []
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum'] or 'maximum' in schema and value > schema['maximum']:
+            errors.append(f"{path}: {value} is out of range")
+    if isinstance(value, str) and len(value) > schema.get('maxLength', len(value)):
+        errors.append(f"{path}: longer than {schema['maxLength']} characters")
+    if isinstance(value, list):
+        if len(value) > schema.get('maxItems', len(value)):
+            errors.append(f"{path}: more than {schema['maxItems']} items")
+        if schema.get('uniqueItems') and len(set(map(json.dumps, value))) != len(value):
+            errors.append(f"{path}: items are not unique")
+        for i, item in enumerate(value):
+            errors += schema_errors(item, schema.get('items', {}), f"{path}[{i}]")
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        errors += [f"{path}: missing {name}" for name in schema.get('required', ()) if name not in value]
+        if schema.get('additionalProperties') is False:
+            errors += [f"{path}: unexpected {name}" for name in value if name not in properties]
+        for name, subschema in properties.items():
+            if name in value:
+                errors += schema_errors(value[name], subschema, f"{path}.{name}")
+    return errors
+
+
+def parse_target(data):
+    """
+    (Target, error) for an /analyze body: {"chain", "address" | "project", "lang"}
+
+    A contract address needs a supported chain and, if mixed-case, a valid
+    EIP-55 checksum (a wrong one is usually a typo). A project name may come
+    without a chain.
+    """
+    if not isinstance(data, dict):
+        return None, {'error': 'JSON body with chain and address or project is required'}
+    address, project = data.get('address'), data.get('project')
+    if (address is None) == (project is None):
+        return None, {'error': 'Send either address or project'}
+    chain = data.get('chain')
+    if chain is not None:
+        if not isinstance(chain, str):
+            return None, {'error': 'chain must be a string'}
+        chain = chain.strip().lower()
+        if chain not in whale_registry.chains:
+            return None, {'error': f"Unknown chain: {chain}", 'supportedChains': list(whale_registry.chains)}
+    lang = data.get('lang', 'id')
+    if not isinstance(lang, str) or lang not in LANGUAGES:
+        return None, {'error': f"lang must be one of {list(LANGUAGES)}"}
+    if address is not None:
+        if chain is None:
+            return None, {'error': 'chain is required with an address'}
+        if not is_address(address):
+            return None, {'error': 'address must be a 0x-prefixed 40-character hex string'}
+        if not has_valid_checksum(address):
+            return None, {'error': 'address has an invalid EIP-55 checksum'}
+        return Target(chain, to_checksum_address(address), None, lang), None
+    project = _WHITESPACE_RE.sub(' ', project).strip() if isinstance(project, str) else ''
+    if not project or len(project) > MAX_PROJECT_CHARS:
+        return None, {'error': f'project must be 1-{MAX_PROJECT_CHARS} characters'}
+    return Target(chain, None, project, lang), None
+
+
+def analysis_prompt():
+    return build_structured_prompt(OUTPUT_FORMAT)
+
+
+def analysis_key(target, model, prompt_version):
+    """Cache key: same contract (any address case) or project (any case) -> same key"""
+    subject = target.address or 'project:' + target.project.lower()
+    return f"{model}:{prompt_version}:{target.lang}:{target.chain or '-'}:{subject}"
+
+
+def build_analysis_messages(target, prompt, facts=None):
+    if target.address:
+        subject = f"the token contract {target.address} on {whale_registry.chains[target.chain]}"
+    else:
+        subject = f'the project "{target.project}"'
+        if target.chain:
+            subject += f" on {whale_registry.chains[target.chain]}"
+    messages = [{"role": "system", "content": prompt.text}]
+    if facts:
+        messages.append({"role": "system", "content": facts})
+    messages.append({"role": "user", "content": f"Analyze the risk of {subject}. Answer in {LANGUAGES[target.lang]}."})
+    return messages
+
+
+def score_risk_level(score):
+    """Risk level of a 0-100 score under the SCORING rubric"""
+    return 'low' if score >= 80 else 'medium' if score >= 60 else 'high'
+
+
+def parse_analysis(text):
+    """
+    Validated analysis document from the model's answer; raises InvalidAnalysis
+
+    The risk level is never lower than the score or the scam flags imply: any
+    anti-scam flag means high risk, whatever the model wrote.
+    """
+    try:
+        document = json.loads(_FENCE_RE.sub('', text.strip()))
+    except ValueError as e:
+        raise InvalidAnalysis(f"not JSON: {e}")
+    errors = schema_errors(document, ANALYSIS_SCHEMA)
+    if errors:
+        raise InvalidAnalysis('; '.join(errors[:5]))
+    levels = [document['riskLevel']]
+    if document['score'] is not None:
+        levels.append(score_risk_level(document['score']))
+    if document['scamFlags']:
+        levels.append('high')
+    document['riskLevel'] = max(levels, key=RISK_LEVELS.index)
+    return document
+
+
+def analysis_result(target, document, model, prompt_version):
+    """Response body: the target, the analysis and when / with which prompt it was made"""
+    subject = {'address': target.address} if target.address else {'project': target.project}
+    return {
+        'chain': target.chain,
+        **subject,
+        'lang': target.lang,
+        **document,
+        'model': model,
+        'promptVersion': prompt_version,
+        'analyzedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
@@ -0,0 +1,68 @@
+"""
+Shared asyncio loop for the sync Flask servers
+One event loop runs forever in a daemon thread, so async code (provider
+streams, hedged races, pooled async HTTP clients) can be driven from Flask
+request threads without creating and tearing down a loop per request.
+"""
+
+import asyncio
+import os
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The loop thread does not survive a fork (pre-fork workers): each child starts its own
+    global _loop, _lock
+    _loop = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+_DONE = object()
+
+
+def get_loop():
+    """The process-wide background loop (started on first use)"""
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='background-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the background loop and block the calling thread for its result"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        # Timed out or the caller was interrupted: do not leave the coroutine running
+        future.cancel()
+        raise
+
+
+async def _next(iterator):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _DONE
+
+
+def iterate(iterator):
+    """Consume an async iterator from a sync thread, one item per loop round-trip"""
+    try:
+        while True:
+            item = run(_next(iterator))
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            run(aclose())
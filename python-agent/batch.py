@@ -0,0 +1,164 @@
+"""
+Batch chat: many independent prompts in one request
+Back-office jobs explain the risk of hundreds of tokens at once. Rather than
+one HTTP round trip per token, /chat/batch takes them all, answers duplicates
+once, runs the rest concurrently on the shared upstream client (at most
+BATCH_CONCURRENCY at a time) and streams one NDJSON line per item as soon as
+it is answered, so the batch takes about as long as its slowest item rather
+than the sum of all of them. An item that fails gets an error line; the other
+items are unaffected.
+
+For admission control a batch costs one rate-limit token per unique item
+(batch_cost), and every item holds a concurrency slot while it runs, so a batch
+cannot get around the per-client and global limits /chat is held to.
+"""
+
+from collections import OrderedDict
+import asyncio
+import json
+import os
+
+from resilience import Deadline
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+# Upstream calls in flight per batch (a request may ask for fewer)
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 16))
+# Seconds between checks for a free admission slot
+SLOT_POLL_INTERVAL = 0.05
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def parse_batch(data, fields=()):
+    """
+    (items, concurrency, ordered, error) for a /chat/batch body
+
+    Items are message strings or objects with "message", an optional "id"
+    echoed back and the given per-item fields (e.g. conversationHistory).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list) or not data['items']:
+        return None, None, None, {'error': 'items must be a non-empty list'}
+    if len(data['items']) > BATCH_MAX_ITEMS:
+        return None, None, None, {'error': f'At most {BATCH_MAX_ITEMS} items per batch'}
+    items = []
+    for index, item in enumerate(data['items']):
+        if isinstance(item, str):
+            item = {'message': item}
+        if not isinstance(item, dict) or not isinstance(item.get('message'), str) or not item['message']:
+            return None, None, None, {'error': f'items[{index}] needs a message'}
+        items.append({key: item[key] for key in ('id', 'message', *fields) if key in item})
+    concurrency = data.get('concurrency', BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        return None, None, None, {'error': 'concurrency must be a positive integer'}
+    return items, min(concurrency, BATCH_CONCURRENCY), bool(data.get('ordered')), None
+
+
+def batch_cost(data):
+    """Rate-limit tokens for a batch body: one per distinct item (1 if the body is invalid)"""
+    if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+        return 1
+    items = data['items'][:BATCH_MAX_ITEMS]
+    return len({json.dumps(item, sort_keys=True, default=str) for item in items}) or 1
+
+
+class Overloaded(Exception):
+    """No concurrency slot freed up for a batch item in time"""
+
+
+async def acquire_slot(limiter):
+    """
+    Take a slot of a thread-based limiter without blocking the event loop
+
+    Polls for up to the limiter's max wait; /chat requests queued for a slot
+    go first, so batch items yield to interactive traffic.
+    """
+    loop = asyncio.get_running_loop()
+    give_up = loop.time() + limiter.max_wait
+    while not limiter.try_acquire():
+        if loop.time() >= give_up:
+            limiter.timeouts += 1
+            return False
+        await asyncio.sleep(SLOT_POLL_INTERVAL)
+    return True
+
+
+def group_duplicates(keys):
+    """OrderedDict of key -> input indexes, in first-seen order"""
+    groups = OrderedDict()
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    return groups
+
+
+async def fan_out(jobs, run, concurrency, timeout, limiter=None):
+    """
+    Run run(job, deadline) for every (key, job), at most concurrency at a time
+
+    Yields (key, result, error) as each job finishes. Each job gets its own
+    deadline of timeout seconds, counted from when it starts rather than from
+    when the batch arrived, so items queued behind others are not cut short.
+    With an admission limiter every running job also holds one of its slots;
+    a job that cannot get one in time fails with Overloaded.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(key, job):
+        async with semaphore:
+            if limiter is not None and not await acquire_slot(limiter):
+                return key, None, Overloaded('Server is overloaded, try again shortly')
+            try:
+                return key, await run(job, Deadline(timeout)), None
+            except Exception as e:
+                return key, None, e
+            finally:
+                if limiter is not None:
+                    limiter.release()
+
+    tasks = [asyncio.ensure_future(one(key, job)) for key, job in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client gone: stop the items still running or waiting for a slot
+        for task in tasks:
+            task.cancel()
+
+
+class BatchWriter:
+    """
+    NDJSON lines for answered items, in completion order or (ordered) input order
+
+    Every line carries the item's input index and id. In input order an
+    answer is held back until all earlier items have been answered.
+    """
+
+    def __init__(self, items, ordered=False):
+        self.items = items
+        self.ordered = ordered
+        self.failed = 0
+        self._held = {}
+        self._next = 0
+
+    def add(self, indexes, result, error=False):
+        """Lines to send now for one answer shared by the given input indexes"""
+        if error:
+            self.failed += len(indexes)
+        ready = []
+        for index in indexes:
+            line = {'index': index}
+            if 'id' in self.items[index]:
+                line['id'] = self.items[index]['id']
+            line.update(result)
+            if not self.ordered:
+                ready.append(line)
+                continue
+            self._held[index] = line
+            while self._next in self._held:
+                ready.append(self._held.pop(self._next))
+                self._next += 1
+        return [json.dumps(line, ensure_ascii=False) + '\n' for line in ready]
+
+    def summary(self, unique, **extra):
+        """Final line: item counts plus whatever the endpoint adds (timings)"""
+        return json.dumps({'done': True, 'items': len(self.items), 'unique': unique,
+                           'failed': self.failed, **extra}) + '\n'
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the local intent router
+Measures per-message classification cost of intent_router.classify()
+against the old keyword if-chain from get_demo_response.
+
+Usage: python bench_intent_router.py [iterations]
+"""
+
+import sys
+import timeit
+
+from intent_router import classify
+
+MESSAGES = [
+    "halo",
+    "Halo, apa itu Middlekid?",
+    "How does this work?",
+    "bagaimana cara lihat posisi defi saya",
+    "token ini aman ga?",
+    "apakah PEPE aman?",
+    "kasih wallet whale di base dong",
+    "0x0c54fccd2e384b4bb6f2e405bf5cbc15a017aafb aman gak? kontraknya udah di-renounce belum",
+    "cek https://example-airdrop.xyz scam gak, disuruh approve semua token",
+    "Can you explain the risk of staking ETH on Lido versus Rocket Pool, and what audits they have?",
+]
+
+
+def legacy_classify(message):
+    """The keyword if-chain the router replaced"""
+    msg_lower = message.lower()
+    if any(word in msg_lower for word in ['help', 'cara', 'bagaimana', 'fitur']):
+        return 'help'
+    elif any(word in msg_lower for word in ['defi', 'staking', 'lp', 'liquidity']):
+        return 'defi'
+    elif any(word in msg_lower for word in ['token', 'analisis', 'kontrak', 'scam', 'aman']):
+        return 'token'
+    return 'default'
+
+
+def bench(fn, iterations):
+    timer = timeit.Timer(lambda: [fn(m) for m in MESSAGES])
+    best = min(timer.repeat(repeat=5, number=iterations))
+    return best / (iterations * len(MESSAGES)) * 1e6
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print("Routes:")
+    for message in MESSAGES:
+        route = classify(message)
+        print(f"  {route.mode:<14} plain={str(route.plain):<5} {route.topic:<9} {message[:60]}")
+
+    print(f"\nintent_router.classify: {bench(classify, iterations):7.2f} µs/message")
+    print(f"legacy if-chain:        {bench(legacy_classify, iterations):7.2f} µs/message")
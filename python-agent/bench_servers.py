@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark for the agent servers
+Starts fake_llm.py and the chosen server as subprocesses on free local ports,
+drives it with loadgen.py and prints latency / TTFT / throughput / overhead.
+No network or API key is needed: the OpenAI servers talk to the fake API
+through OPENAI_BASE_URL, and goodkid_server gets a FakeRunner instead of the
+ADK Runner.
+
+--cold-start N instead starts the server N times and reports how long each
+start takes: process start to the end of module import (startup), to accepting
+connections (/health), to ready (/ready, after warm-up), and the latency of
+the first two /chat requests. Set WARMUP_ENABLED=false to compare without
+warm-up.
+
+Usage: python bench_servers.py --target openai --concurrency 50 --requests 500
+       python bench_servers.py --target asgi --endpoint /chat/stream --rate 40 --duration 20
+       python bench_servers.py --target goodkid --json new.json --baseline old.json --tolerance 0.2
+       python bench_servers.py --target openai --cold-start 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from fake_llm import LatencyProfile, add_profile_args
+from loadgen import MESSAGES, add_load_args, format_report, load_kwargs, run, upstream_seconds
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TARGETS = {
+    'openai': ['openai_agent.py'],
+    'asgi': ['openai_agent_asgi.py'],
+    'goodkid': ['bench_servers.py', '--serve-goodkid'],
+}
+
+# Report fields compared against a baseline: (path, True if higher is better)
+REGRESSION_CHECKS = [
+    (('rps',), True),
+    (('latencyMs', 'p95'), False),
+    (('ttftMs', 'p95'), False),
+    (('overheadMs', 'p50'), False),
+    (('overheadMs', 'p95'), False),
+]
+
+COLD_START_CHECKS = [
+    (('readyMs',), False),
+    (('firstRequestMs',), False),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def profile_argv(args):
+    return [
+        '--ttft-ms', str(args.ttft_ms), '--dist', args.dist, '--jitter', str(args.jitter),
+        '--tokens-per-sec', str(args.tokens_per_sec), '--output-tokens', str(args.output_tokens),
+        '--error-rate', str(args.error_rate),
+    ] + (['--seed', str(args.seed)] if args.seed is not None else [])
+
+
+def spawn(argv, env, log):
+    return subprocess.Popen([sys.executable] + argv, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def wait_ready(url, process, timeout=30.0, interval=0.1):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(interval)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def compare(report, baseline, tolerance, checks=REGRESSION_CHECKS):
+    """List of human-readable regressions beyond tolerance (fraction)"""
+    regressions = []
+    for path, higher_is_better in checks:
+        new, old = report, baseline
+        for key in path:
+            new, old = (new or {}).get(key), (old or {}).get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{'.'.join(path)}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def timed_chat(base_url, n):
+    """(seconds, upstream seconds or None) of one uncached /chat request"""
+    started = time.perf_counter()
+    response = httpx.post(f"{base_url}/chat", json={'message': f"{MESSAGES[0]} (cold {n})"},
+                          headers={'X-Cache-Bypass': '1'}, timeout=120.0)
+    latency = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f"/chat returned {response.status_code}: {response.text[:200]}")
+    return latency, upstream_seconds(response.text)
+
+
+def cold_start(argv, env, log, runs):
+    """Start the server runs times and time each start-up and its first two requests (medians)"""
+    samples = []
+    for n in range(runs):
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        server = spawn(argv, dict(env, PORT=str(port)), log)
+        try:
+            wait_ready(f"{base_url}/health", server, interval=0.01)
+            listening = time.perf_counter() - started
+            wait_ready(f"{base_url}/ready", server, interval=0.01)
+            ready = time.perf_counter() - started
+            status = httpx.get(f"{base_url}/ready").json()
+            first, second = timed_chat(base_url, 2 * n), timed_chat(base_url, 2 * n + 1)
+        finally:
+            stop(server)
+        sample = {
+            'startupMs': status['startupMs'],
+            'listenMs': listening * 1000,
+            'readyMs': ready * 1000,
+            'firstRequestMs': first[0] * 1000,
+            'secondRequestMs': second[0] * 1000,
+        }
+        if first[1] is not None and second[1] is not None:
+            sample['firstOverheadMs'] = (first[0] - first[1]) * 1000
+            sample['secondOverheadMs'] = (second[0] - second[1]) * 1000
+        sample.update({f"stage.{name}": ms for name, ms in status['stages'].items()})
+        samples.append(sample)
+        print(f"  run {n + 1}/{runs}: ready {sample['readyMs']:.0f}ms, first /chat {sample['firstRequestMs']:.0f}ms")
+
+    report = {'runs': runs}
+    for key in samples[0]:
+        values = [s[key] for s in samples if s.get(key) is not None]
+        if values:
+            report[key] = round(statistics.median(values), 1)
+    report['errors'] = {name: error for name, error in status['errors'].items()}
+    return report
+
+
+def format_cold_start(report):
+    lines = [f"{report['target']} cold start [median of {report['runs']} runs]"]
+    for key, label in (('startupMs', 'startup'), ('listenMs', 'listening'), ('readyMs', 'ready'),
+                       ('firstRequestMs', 'first'), ('secondRequestMs', 'second')):
+        line = f"  {label:<10} {report.get(key)}ms"
+        overhead = report.get(key.replace('Request', 'Overhead')) if 'Request' in key else None
+        if overhead is not None:
+            line += f" (overhead {overhead}ms)"
+        lines.append(line)
+    stages = [f"{key[6:]}={value}ms" for key, value in report.items() if key.startswith('stage.')]
+    if stages:
+        lines.append(f"  warm-up    {', '.join(stages)}")
+    for name, error in report['errors'].items():
+        lines.append(f"  failed     {name}: {error}")
+    return "\n".join(lines)
+
+
+def serve_goodkid(args):
+    """Child process: goodkid_server with the ADK Runner replaced by FakeRunner"""
+    import goodkid_server
+    from fake_llm import FakeRunner
+    goodkid_server.llm.get('adk').runner = FakeRunner(LatencyProfile.from_args(args))
+    goodkid_server.start_warm_up()
+    goodkid_server.app.run(host='127.0.0.1', port=int(os.environ['PORT']), debug=False, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--target', choices=sorted(TARGETS), default='openai')
+    parser.add_argument('--baseline', help='report JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression fraction')
+    parser.add_argument('--server-log', default=os.devnull, help='file for server and fake API output')
+    parser.add_argument('--cold-start', type=int, metavar='N',
+                        help='start the server N times and report start-up and first-request latency')
+    parser.add_argument('--serve-goodkid', action='store_true', help=argparse.SUPPRESS)
+    add_profile_args(parser)
+    add_load_args(parser)
+    args = parser.parse_args()
+
+    if args.serve_goodkid:
+        return serve_goodkid(args)
+
+    log = open(args.server_log, 'a')
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    # One client hammering the server is the point here, not something to rate limit
+    env.setdefault('ADMISSION_ENABLED', 'false')
+    processes = []
+    try:
+        fake_url = None
+        if args.target != 'goodkid':
+            fake_port = free_port()
+            fake = spawn(['fake_llm.py', '--port', str(fake_port)] + profile_argv(args), env, log)
+            processes.append(fake)
+            fake_url = f"http://127.0.0.1:{fake_port}"
+            wait_ready(f"{fake_url}/stats", fake)
+            env.update(OPENAI_API_KEY='fake-key', OPENAI_BASE_URL=f"{fake_url}/v1")
+
+        argv = TARGETS[args.target] + (profile_argv(args) if args.target == 'goodkid' else [])
+        if args.cold_start:
+            report = cold_start(argv, env, log, args.cold_start)
+        else:
+            port = free_port()
+            env['PORT'] = str(port)
+            server = spawn(argv, env, log)
+            processes.append(server)
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(f"{base_url}/health", server)
+            report = run(base_url, **load_kwargs(args))
+        report['target'] = args.target
+        report['profile'] = {'ttftMs': args.ttft_ms, 'dist': args.dist, 'jitter': args.jitter,
+                             'tokensPerSec': args.tokens_per_sec, 'outputTokens': args.output_tokens,
+                             'errorRate': args.error_rate}
+        if fake_url:
+            report['upstreamCalls'] = httpx.get(f"{fake_url}/stats").json()['requests']
+    finally:
+        for process in reversed(processes):
+            stop(process)
+        log.close()
+
+    print(format_cold_start(report) if args.cold_start else format_report(report))
+    if 'upstreamCalls' in report:
+        print(f"  upstream   {report['upstreamCalls']} calls to the fake API")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance,
+                                  COLD_START_CHECKS if args.cold_start else REGRESSION_CHECKS)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
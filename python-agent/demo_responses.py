@@ -0,0 +1,83 @@
+"""
+Canned answers used when no LLM answer can be had
+Demo mode (no provider configured) and degraded mode (deadline exceeded or
+every provider's circuit open) both answer from here, without upstream calls.
+"""
+
+from intent_router import classify, ANALYSIS, CLARIFICATION, INFORMATION, WHALE_LIST
+
+# Fallback demo responses (OpenAI key not configured), keyed by router topic
+DEMO_RESPONSES = {
+    'help': """Middlekid adalah aplikasi portfolio tracker untuk Base chain yang membantu Anda:
+
+💰 **Track Token Holdings** - Lihat semua token Anda di 17+ blockchain
+🖼️ **View NFT Collections** - Galeri NFT Anda
+📊 **Monitor DeFi Positions** - Posisi staking, LP, lending
+⚡ **Real-time Analytics** - Data portfolio real-time
+
+Masukkan wallet address di search bar untuk memulai!""",
+
+    'defi': """DeFi Positions menampilkan posisi DeFi Anda seperti:
+
+• **Staking positions** - Token yang di-stake
+• **Liquidity pool positions** - LP token Anda
+• **Lending/borrowing** - Posisi di Aave, Compound, dll
+
+Anda bisa melihatnya di tab "DeFi" setelah memasukkan wallet address.
+
+App ini otomatis mendeteksi DeFi positions di Stargate, Beethoven X, dan protokol lainnya.""",
+
+    'analysis': """Untuk analisis token lengkap, saya perlu OpenAI API key.
+
+Dalam mode lengkap, saya bisa:
+• Cek keamanan smart contract
+• Analisis risiko token (score 0-100)
+• Deteksi honeypot dan scam
+• Review tokenomics
+• Verifikasi team & project
+
+**Setup OpenAI API:**
+1. Dapatkan key di https://platform.openai.com
+2. Set environment variable: `OPENAI_API_KEY=sk-...`
+3. Restart server
+
+Cost: ~$0.01 per conversation""",
+
+    'greeting': """Halo! Saya Kid, asisten AI untuk Middlekid. 👋
+
+Saya bisa bantu dengan:
+• Penjelasan fitur Middlekid
+• Cara pakai app
+• Informasi DeFi positions
+• Analisis token (perlu OpenAI API key)
+
+Ada yang bisa saya bantu?""",
+}
+
+# Degraded mode: the AI is configured but currently too slow or failing, keyed by language
+DEGRADED_RESPONSES = {
+    'id': """Maaf, layanan AI sedang lambat atau mengalami gangguan, jadi analisis lengkap belum bisa saya berikan sekarang. ⏳
+
+Silakan coba lagi dalam satu menit. Sementara itu, Anda tetap bisa melihat token, NFT, dan posisi DeFi dengan memasukkan wallet address di search bar.""",
+
+    'en': """Sorry, the AI service is slow or having trouble right now, so I can't give a full analysis at the moment. ⏳
+
+Please try again in a minute. Meanwhile you can still view tokens, NFTs and DeFi positions by entering a wallet address in the search bar.""",
+}
+
+def get_demo_response(message, degraded=False):
+    """
+    Fallback demo responses if OpenAI key not configured
+
+    With degraded=True (LLM configured but unavailable) anything that needs
+    the model gets a "try again shortly" answer instead of setup instructions.
+    """
+    route = classify(message)
+    
+    if route.mode == INFORMATION:
+        return DEMO_RESPONSES[route.topic]
+    if degraded:
+        return DEGRADED_RESPONSES.get(route.lang, DEGRADED_RESPONSES['id'])
+    if route.mode in (ANALYSIS, CLARIFICATION, WHALE_LIST) and route.topic != 'unknown':
+        return DEMO_RESPONSES['analysis']
+    return DEMO_RESPONSES['greeting']
@@ -0,0 +1,103 @@
+"""
+EVM address helpers
+Checksummed (EIP-55) addresses are the canonical form of a contract address,
+so "0xabc..." and "0xABC..." name the same contract in cache keys. EIP-55 needs
+Keccak-256, which is not hashlib's sha3_256 (different padding), so a small
+pure-Python Keccak is included; addresses are short and checksums are cached.
+"""
+
+from functools import lru_cache
+import re
+
+ADDRESS_RE = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+_MASK = (1 << 64) - 1
+_RATE = 136  # bytes absorbed per permutation for Keccak-256
+
+_ROUND_CONSTANTS = (
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+)
+
+# Rotation offsets, indexed [x + 5 * y]
+_ROTATIONS = (
+    0, 1, 62, 28, 27,
+    36, 44, 6, 55, 20,
+    3, 10, 43, 25, 39,
+    41, 45, 15, 21, 8,
+    18, 2, 61, 56, 14,
+)
+
+
+def _rotl(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & _MASK if shift else value
+
+
+def _keccak_f(state):
+    """Keccak-f[1600] permutation of 25 lanes, in place"""
+    for constant in _ROUND_CONSTANTS:
+        # theta
+        c = [state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotl(c[(x + 1) % 5], 1) for x in range(5)]
+        for i in range(25):
+            state[i] ^= d[i % 5]
+        # rho and pi
+        b = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                b[y + 5 * ((2 * x + 3 * y) % 5)] = _rotl(state[x + 5 * y], _ROTATIONS[x + 5 * y])
+        # chi
+        for y in range(0, 25, 5):
+            row = b[y:y + 5]
+            for x in range(5):
+                state[y + x] = row[x] ^ (~row[(x + 1) % 5] & row[(x + 2) % 5])
+        # iota
+        state[0] ^= constant
+
+
+def keccak256(data):
+    """Keccak-256 digest (the Ethereum hash, not NIST SHA3-256) of bytes"""
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(b'\x00' * (-len(padded) % _RATE))
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for offset in range(0, len(padded), _RATE):
+        block = padded[offset:offset + _RATE]
+        for i in range(_RATE // 8):
+            state[i] ^= int.from_bytes(block[8 * i:8 * i + 8], 'little')
+        _keccak_f(state)
+    return b''.join(lane.to_bytes(8, 'little') for lane in state[:4])
+
+
+def is_address(value):
+    """True for a 0x-prefixed 20-byte hex string (any case)"""
+    return isinstance(value, str) and bool(ADDRESS_RE.match(value))
+
+
+@lru_cache(maxsize=65536)
+def to_checksum_address(address):
+    """EIP-55 checksummed form of an address; raises ValueError if it is not one"""
+    if not is_address(address):
+        raise ValueError(f"Not an EVM address: {address!r}")
+    hex_address = address[2:].lower()
+    digest = keccak256(hex_address.encode('ascii')).hex()
+    return '0x' + ''.join(
+        char.upper() if int(digest[i], 16) >= 8 else char for i, char in enumerate(hex_address)
+    )
+
+
+def has_valid_checksum(address):
+    """
+    False only for a mixed-case address whose EIP-55 checksum is wrong (likely a typo)
+
+    All-lowercase and all-uppercase addresses carry no checksum and are accepted.
+    """
+    body = address[2:]
+    if body == body.lower() or body == body.upper():
+        return True
+    return to_checksum_address(address) == address
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Offline stand-ins for the upstream model
+FakeOpenAIServer speaks the OpenAI chat-completions API (plain and SSE streaming)
+on localhost; FakeRunner replaces the Google ADK Runner in goodkid_server. Both
+draw latency, token rate and failures from a LatencyProfile, so the servers can
+be load-tested with no network or API key.
+
+Every answer ends with an "upstream_ms=<n>" marker holding the simulated
+upstream time, which loadgen.py subtracts to get per-request server overhead.
+Requests for JSON output (response_format) get FAKE_ANALYSIS instead.
+
+Usage: python fake_llm.py --port 8090 --ttft-ms 400 --tokens-per-sec 80
+       OPENAI_BASE_URL=http://127.0.0.1:8090/v1 OPENAI_API_KEY=fake python openai_agent.py
+"""
+
+from http import HTTPStatus
+from types import SimpleNamespace
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+
+UPSTREAM_MARKER = "upstream_ms="
+
+# Answer to JSON-mode requests (/analyze), valid against analysis.ANALYSIS_SCHEMA
+FAKE_ANALYSIS = {
+    'summary': 'Kontrak terverifikasi, namun likuiditas belum dikunci.',
+    'category': 'small',
+    'score': None,
+    'riskLevel': 'high',
+    'keyFindings': ['Kontrak terverifikasi', 'Likuiditas belum dikunci', 'Owner belum renounce'],
+    'scamFlags': ['liquidity_unlocked', 'ownership_not_renounced'],
+}
+
+FILLER_WORDS = (
+    "Kontrak ini terlihat wajar tetapi tetap cek likuiditas holder dan izin owner "
+    "sebelum membeli token apa pun risiko selalu ada di pasar kripto"
+).split()
+
+
+class LatencyProfile:
+    """
+    Simulated upstream behaviour
+
+    ttft_ms is the median time to first token. dist is 'fixed', 'uniform'
+    (ttft_ms +/- jitter fraction) or 'lognormal' (sigma = jitter). Tokens then
+    arrive at tokens_per_sec; error_rate is the fraction of calls that fail.
+    """
+
+    def __init__(self, ttft_ms=400.0, dist='lognormal', jitter=0.3,
+                 tokens_per_sec=80.0, output_tokens=120, error_rate=0.0, seed=None):
+        if dist not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution '{dist}'")
+        self.ttft_ms = ttft_ms
+        self.dist = dist
+        self.jitter = jitter
+        self.tokens_per_sec = tokens_per_sec
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.ttft_ms, args.dist, args.jitter, args.tokens_per_sec,
+                   args.output_tokens, args.error_rate, args.seed)
+
+    def sample_ttft(self):
+        """Seconds until the first token"""
+        with self._lock:
+            if self.dist == 'fixed':
+                ms = self.ttft_ms
+            elif self.dist == 'uniform':
+                ms = self._random.uniform(self.ttft_ms * (1 - self.jitter), self.ttft_ms * (1 + self.jitter))
+            else:
+                ms = self.ttft_ms * self._random.lognormvariate(0.0, self.jitter)
+        return max(ms, 0.0) / 1000
+
+    def token_interval(self):
+        return 1 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def words(self, body=None):
+        """Answer chunks: filler words, or FAKE_ANALYSIS for a JSON-mode request"""
+        if body and body.get('response_format'):
+            document = json.dumps(FAKE_ANALYSIS)
+            size = max(1, len(document) // max(1, self.output_tokens))
+            return [document[i:i + size] for i in range(0, len(document), size)]
+        return [FILLER_WORDS[i % len(FILLER_WORDS)] + ' ' for i in range(self.output_tokens)]
+
+
+def add_profile_args(parser):
+    """LatencyProfile flags shared by fake_llm.py and bench_servers.py"""
+    parser.add_argument('--ttft-ms', type=float, default=400.0, help='median time to first token')
+    parser.add_argument('--dist', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    parser.add_argument('--jitter', type=float, default=0.3, help='uniform spread fraction or lognormal sigma')
+    parser.add_argument('--tokens-per-sec', type=float, default=80.0)
+    parser.add_argument('--output-tokens', type=int, default=120)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def marker(started):
+    return f"{UPSTREAM_MARKER}{(time.perf_counter() - started) * 1000:.1f}"
+
+
+def answer(profile, body, started):
+    """Whole non-streamed answer; JSON documents get no marker so they stay parseable"""
+    if body.get('response_format'):
+        return ''.join(profile.words(body))
+    return ''.join(profile.words()) + marker(started)
+
+
+def _error(message, error_type):
+    return {'error': {'message': message, 'type': error_type}}
+
+
+class FakeOpenAIServer:
+    """
+    Local /v1/chat/completions endpoint driven by a LatencyProfile
+
+    Runs on its own asyncio loop (HTTP/1.1 keep-alive, chunked SSE) so hundreds
+    of concurrent token streams cost the fake almost nothing and the numbers
+    reflect the server under test.
+    """
+
+    def __init__(self, profile, host='127.0.0.1', port=0):
+        self.profile = profile
+        self.requests = 0
+        # Bind now so the port is known before serving starts
+        self._sock = socket.create_server((host, port), backlog=1024)
+        self.server_address = self._sock.getsockname()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def serve(self):
+        server = await asyncio.start_server(self._connection, sock=self._sock)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, name='fake-openai', daemon=True).start()
+        return self
+
+    async def _connection(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            # Token chunks are tiny writes; without TCP_NODELAY they stall on delayed ACKs
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                raw = await reader.readexactly(length) if length else b''
+                await self._dispatch(method, path, raw, writer)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, raw, writer):
+        if method == 'GET' and path == '/stats':
+            return await self._json(writer, 200, {'requests': self.requests})
+        if method == 'GET' and '/models/' in path:
+            # Model lookup the servers' warm-up uses to open a connection
+            return await self._json(writer, 200, {'id': path.rsplit('/', 1)[1], 'object': 'model',
+                                                  'created': 0, 'owned_by': 'fake'})
+        if method != 'POST' or not path.rstrip('/').endswith('/chat/completions'):
+            return await self._json(writer, 404, _error('Not found', 'invalid_request_error'))
+        body = json.loads(raw or b'{}')
+        profile = self.profile
+        self.requests += 1
+        started = time.perf_counter()
+        await asyncio.sleep(profile.sample_ttft())
+        if profile.should_fail():
+            return await self._json(writer, 500, _error('Simulated upstream failure', 'server_error'))
+        prompt_tokens = len(raw) // 4
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': profile.output_tokens,
+            'total_tokens': prompt_tokens + profile.output_tokens,
+        }
+        if body.get('stream'):
+            return await self._stream(writer, body, profile, started, usage)
+        await asyncio.sleep(profile.output_tokens * profile.token_interval())
+        await self._json(writer, 200, {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': answer(profile, body, started)},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+    async def _json(self, writer, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data
+        )
+        await writer.drain()
+
+    def _chunk(self, writer, payload):
+        data = f"data: {payload}\n\n".encode('utf-8')
+        writer.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+    async def _stream(self, writer, body, profile, started, usage):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        prefix = json.dumps({'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk',
+                             'created': int(time.time()), 'model': body.get('model', 'fake')})[:-1]
+        loop = asyncio.get_running_loop()
+        interval = profile.token_interval()
+        next_at = loop.time()
+        for word in profile.words(body):
+            delta = json.dumps([{'index': 0, 'delta': {'content': word}, 'finish_reason': None}])
+            self._chunk(writer, f'{prefix}, "choices": {delta}}}')
+            # Pace against a deadline and only yield when >=2ms ahead: per-token sub-ms
+            # sleeps would make the fake, not the server under test, the bottleneck
+            next_at += interval
+            delay = next_at - loop.time()
+            if delay >= 0.002:
+                await writer.drain()
+                await asyncio.sleep(delay)
+        tail = '' if body.get('response_format') else marker(started)
+        delta = json.dumps([{'index': 0, 'delta': {'content': tail}, 'finish_reason': 'stop'}])
+        self._chunk(writer, f'{prefix}, "choices": {delta}}}')
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self._chunk(writer, f'{prefix}, "choices": [], "usage": {json.dumps(usage)}}}')
+        self._chunk(writer, '[DONE]')
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class FakeRunner:
+    """Drop-in for google.adk.runners.Runner.run_async with simulated latency"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.requests = 0
+
+    async def run_async(self, user_id, session_id, new_message, run_config=None):
+        """One final event, or with a run_config (streaming) one partial event per word first"""
+        self.requests += 1
+        started = time.perf_counter()
+        await asyncio.sleep(self.profile.sample_ttft())
+        if self.profile.should_fail():
+            raise RuntimeError("Simulated agent failure")
+        words = self.profile.words()
+        if run_config is None:
+            await asyncio.sleep(self.profile.output_tokens * self.profile.token_interval())
+        else:
+            for word in words:
+                yield SimpleNamespace(content=word, partial=True)
+                await asyncio.sleep(self.profile.token_interval())
+            yield SimpleNamespace(content=marker(started), partial=True)
+        yield SimpleNamespace(
+            content=''.join(words) + marker(started),
+            partial=False,
+            usage_metadata=SimpleNamespace(prompt_token_count=len(str(new_message)) // 4),
+        )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_profile_args(parser)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(LatencyProfile.from_args(args), args.host, args.port)
+    print(f"Fake OpenAI API on {server.base_url} (ttft {args.ttft_ms}ms {args.dist}, "
+          f"{args.tokens_per_sec} tok/s, errors {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
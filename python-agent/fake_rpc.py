@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for EVM JSON-RPC nodes
+FakeRPCServer answers the reads onchain.py makes (eth_getCode, eth_call,
+eth_getStorageAt, single or batched) from a few in-memory contracts, after a
+latency drawn from a LatencyProfile per HTTP request, so the on-chain
+prefetch can be tried and timed with no node or network. The last path segment
+is the chain: http://127.0.0.1:8545/base serves CONTRACTS['base'], any other
+chain has no contracts.
+
+Usage: python fake_rpc.py --port 8545 --ttft-ms 80
+       ONCHAIN_RPC_URLS="base=http://127.0.0.1:8545/base,ethereum=http://127.0.0.1:8545/ethereum" python openai_agent.py
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fake_llm import FakeOpenAIServer, LatencyProfile, add_profile_args
+from onchain import EIP1967_IMPLEMENTATION_SLOT, READS, ZERO_ADDRESS, selector
+
+# Contracts per chain: lowercase address -> what its reads return (missing fields revert)
+CONTRACTS = {
+    'base': {
+        # Mintable, pausable token with an active owner
+        '0x4200000000000000000000000000000000000a11': {
+            'functions': ('mint(address,uint256)', 'pause()', 'transfer(address,uint256)'),
+            'name': 'Moon Pepe', 'symbol': 'MPEPE', 'decimals': 18, 'totalSupply': 420_690_000_000 * 10 ** 18,
+            'owner': '0x9f3a5b2c7d1e4f60718293a4b5c6d7e8f9012345',
+        },
+        # Plain token, ownership renounced
+        '0x4200000000000000000000000000000000000b0b': {
+            'functions': ('transfer(address,uint256)', 'approve(address,uint256)'),
+            'name': 'Base Cat', 'symbol': 'BCAT', 'decimals': 9, 'totalSupply': 1_000_000_000 * 10 ** 9,
+            'owner': ZERO_ADDRESS,
+        },
+        # Upgradeable proxy with no owner() of its own
+        '0x4200000000000000000000000000000000000c0c': {
+            'functions': ('upgradeTo(address)', 'transfer(address,uint256)'),
+            'name': 'Bridged USD', 'symbol': 'bUSD', 'decimals': 6, 'totalSupply': 25_000_000 * 10 ** 6,
+            'implementation': '0x4200000000000000000000000000000000000d0d',
+        },
+    },
+}
+
+
+def _word(value):
+    return f"{value:064x}"
+
+
+def _encode(field, value):
+    """ABI-encoded return value of a READS call"""
+    if field in ('name', 'symbol'):
+        data = value.encode('utf-8')
+        return '0x' + _word(32) + _word(len(data)) + data.hex().ljust(-(-len(data) // 32) * 64, '0')
+    if field == 'owner':
+        return '0x' + value[2:].lower().rjust(64, '0')
+    return '0x' + _word(value)
+
+
+def _bytecode(functions):
+    """Dispatcher-like bytecode: PUSH4 <selector> EQ PUSH2 <dest> JUMPI per function"""
+    return '0x608060405234801561001057600080fd5b50' + ''.join(
+        f"63{selector(signature)}14610{i:03x}57" for i, signature in enumerate(functions)
+    ) + '600080fd'
+
+
+class FakeRPCServer(FakeOpenAIServer):
+    """Local JSON-RPC endpoint per chain (POST /<chain>), driven by a LatencyProfile"""
+
+    def __init__(self, profile, host='127.0.0.1', port=0, contracts=None):
+        super().__init__(profile, host, port)
+        self.contracts = CONTRACTS if contracts is None else contracts
+        self.calls = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, chain):
+        return f"{self.base_url}/{chain}"
+
+    def _call(self, chain, method, params):
+        """(result, error) of one JSON-RPC call"""
+        contracts = self.contracts.get(chain, {})
+        if method == 'eth_chainId':
+            return hex(sorted(self.contracts).index(chain) + 1 if chain in self.contracts else 1337), None
+        if method == 'eth_blockNumber':
+            return hex(int(time.time()) // 2), None
+        if method == 'eth_getCode':
+            contract = contracts.get(str(params[0]).lower())
+            return (_bytecode(contract['functions']) if contract else '0x'), None
+        if method == 'eth_getStorageAt':
+            contract = contracts.get(str(params[0]).lower()) or {}
+            if params[1] == EIP1967_IMPLEMENTATION_SLOT and 'implementation' in contract:
+                return '0x' + contract['implementation'][2:].lower().rjust(64, '0'), None
+            return '0x' + _word(0), None
+        if method == 'eth_call':
+            call = params[0]
+            contract = contracts.get(str(call.get('to')).lower())
+            if contract is None:
+                # A call to an address without code succeeds with no data
+                return '0x', None
+            for field, data in READS.items():
+                if call.get('input', call.get('data')) == data and field in contract:
+                    return _encode(field, contract[field]), None
+            return None, {'code': 3, 'message': 'execution reverted'}
+        return None, {'code': -32601, 'message': f"the method {method} does not exist/is not available"}
+
+    def _reply(self, chain, call):
+        self.calls += 1
+        if not isinstance(call, dict) or 'method' not in call:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'Invalid request'}}
+        result, error = self._call(chain, call['method'], call.get('params') or [])
+        reply = {'jsonrpc': '2.0', 'id': call.get('id')}
+        if error is not None:
+            reply['error'] = error
+        else:
+            reply['result'] = result
+        return reply
+
+    async def _dispatch(self, method, path, raw, writer):
+        if method == 'GET' and path == '/stats':
+            return await self._json(writer, 200, {'requests': self.requests, 'calls': self.calls})
+        if method != 'POST':
+            return await self._json(writer, 404, {'error': 'Not found'})
+        chain = path.strip('/').rsplit('/', 1)[-1]
+        self.requests += 1
+        await asyncio.sleep(self.profile.sample_ttft())
+        if self.profile.should_fail():
+            return await self._json(writer, 503, {'error': 'Simulated node failure'})
+        try:
+            body = json.loads(raw or b'null')
+        except ValueError:
+            return await self._json(writer, 200, {'jsonrpc': '2.0', 'id': None,
+                                                  'error': {'code': -32700, 'message': 'Parse error'}})
+        if isinstance(body, list):
+            return await self._json(writer, 200, [self._reply(chain, call) for call in body])
+        await self._json(writer, 200, self._reply(chain, body))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8545)
+    add_profile_args(parser)
+    parser.set_defaults(ttft_ms=80.0)
+    args = parser.parse_args()
+    server = FakeRPCServer(LatencyProfile.from_args(args), args.host, args.port)
+    print(f"Fake JSON-RPC nodes on {server.base_url}/<chain> (latency {args.ttft_ms}ms {args.dist}, "
+          f"contracts on {', '.join(server.contracts)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
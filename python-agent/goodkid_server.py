@@ -3,18 +3,33 @@ GoodKid Agent Server - Flask wrapper for the GoodKid AI agent
 FIXED VERSION - Compatible with Google ADK latest API
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import json
 import logging
-import asyncio
 
 # Import the GoodKid agent
 from good_kid_agent import root_agent
+from single_flight import IdempotencyStore, SingleFlight, flask_idempotent
+from llm_providers import ChatRequest, Progress, ProviderRouter
+from resilience import UpstreamUnavailable, request_deadline
+from demo_responses import get_demo_response
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, QUEUE_DEPTH, flask_observed, render as render_metrics
+from tracing import exporter as trace_exporter, flask_traced
+from admission import AdmissionController, RateLimiter, flask_admitted
+from intent_router import classify
+from onchain import OnChainContext, render_facts
+from batch import NDJSON_MIMETYPE, BatchWriter, batch_cost, fan_out, group_duplicates, parse_batch
+from shared_state import shared_state
+from adk_sessions import BoundedSessionService
+from tool_cache import tool_cache
+from session_store import is_valid_session_id
+from warmup import WarmUp, local_stages, onchain_stages, provider_stages
+import background_loop
 
 # Import Google ADK runner components
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,119 +42,401 @@ CORS(app, resources={
     r"/*": {
         "origins": os.getenv("ALLOWED_ORIGINS", "*").split(","),
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Idempotency-Key", "X-Request-Timeout-Ms", "X-API-Key"]
     }
 })
 
-# Initialize session service and runner
-session_service = InMemorySessionService()
+# One ADK session per client conversation: bounded in memory, optionally persisted (ADK_SESSION_DB)
+session_service = BoundedSessionService()
 runner = Runner(
     agent=root_agent,
     session_service=session_service,
     app_name="GoodKid-MiddleKid"
 )
 
+# Upstream model(s): the ADK agents first; LLM_PROVIDERS="adk,openai" adds OpenAI as failover/hedge target
+llm = ProviderRouter.from_env('adk', adk={'runner': runner})
+
+# Identical messages in flight for the same conversation share one agent run
+agent_flights = SingleFlight()
+
+# Completed /chat responses by Idempotency-Key, replayed to retries
+idempotency_store = IdempotencyStore(shared=shared_state)
+idempotency_flights = SingleFlight()
+
+# Contract facts read over JSON-RPC and handed to the agent with the message (ONCHAIN_RPC_URLS)
+onchain = OnChainContext(shared=shared_state)
+
+# Per-client rate limits and a cap on concurrent agent runs
+admission = AdmissionController(rate_limiter=RateLimiter(shared=shared_state))
+
+QUEUE_DEPTH.labels('admission').set_function(lambda: admission.limiter.waiting)
+QUEUE_DEPTH.labels('coalesced').set_function(lambda: agent_flights.waiting)
+
+# Tokenizer, prompts and the agents' model client, built before /ready reports ready
+warm_up = WarmUp()
+
+def warm_up_stages():
+    return (local_stages(include_whales=False, include_tools=True) + provider_stages(llm, run=background_loop.run)
+            + onchain_stages(onchain, run=background_loop.run))
+
+def start_warm_up():
+    """Warm up on a background thread (once per process; gunicorn.conf.py calls it in each worker)"""
+    warm_up.start(warm_up_stages())
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
         'service': 'GoodKid Agent',
-        'version': '1.1.0-fixed'
+        'version': '1.1.0-fixed',
+        'singleFlight': agent_flights.stats(),
+        'idempotency': idempotency_store.stats(),
+        'llm': llm.stats(),
+        'sessions': session_service.stats(),
+        'toolCache': tool_cache.stats(),
+        'onchain': onchain.stats(),
+        'admission': admission.stats(),
+        'tracing': trace_exporter.stats(),
+        'sharedState': shared_state.stats() if shared_state is not None else None
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until warm-up has finished (starts it under other WSGI servers)"""
+    start_warm_up()
+    return jsonify(warm_up.status()), 200 if warm_up.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+def conversation_ids(data):
+    """(user_id, session_id, error) from a chat request body; session_id None = one-off session"""
+    session_id = data.get('sessionId')
+    user_id = data.get('userId', 'anonymous')
+    for field, value in (('sessionId', session_id), ('userId', user_id)):
+        if value is not None and not is_valid_session_id(value):
+            return None, None, {'error': f'{field} must be 1-128 characters of [A-Za-z0-9_-:.]'}
+    return user_id, session_id, None
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def with_onchain_facts(user_message, trace=None):
+    """
+    The message as the agent sees it: on-chain facts about the contracts it
+    names come first, so the agent does not have to search for them
+    """
+    targets = onchain.route_targets(classify(user_message))
+    if not targets:
+        return user_message
+    if trace is not None:
+        trace.stage('onchain', targets=len(targets))
+    facts = render_facts(onchain.lookup(targets, background_loop.run))
+    return f"{facts}\n\n{user_message}" if facts else user_message
+
+def run_agent_turn(user_message, user_id, session_id, deadline, observation):
+    """Run one agent turn within the deadline; returns (response_text, prompt_tokens, completion)"""
+    # Without a sessionId the agent gets a one-off session
+    llm_req = ChatRequest(messages=None, user_message=user_message, user_id=user_id, session_id=session_id)
+    
+    # Run on the shared background loop, where the Runner and its HTTP clients live across requests
+    completion = background_loop.run(llm.complete(llm_req, deadline), timeout=deadline.remaining() + 1)
+    
+    observation.upstream(completion)
+    response_text = completion.text
+    
+    # Fallback if no response extracted
+    if not response_text:
+        response_text = "Agent responded but content could not be extracted"
+    
+    # Prompt tokens as reported by the model for every LLM call in this turn
+    prompt_tokens = (completion.usage or {}).get('prompt_tokens') or 0
+    return response_text, prompt_tokens, completion
+
 @app.route('/chat', methods=['POST'])
+@flask_observed('/chat', llm.providers[0].model)
+@flask_traced
+@flask_admitted(admission)
+@flask_idempotent(idempotency_store, idempotency_flights)
 def chat():
     """
     Chat endpoint - receives messages and returns agent responses
     
     FIXED: Removes dependency on google.adk.messages which doesn't exist
-    Uses string message directly with runner.run_async
+    Runs the agent through the LLM provider router (ADK first)
+    Expects: {"message": "...", "sessionId": "optional", "userId": "optional"}
+    With a sessionId the agent keeps the conversation in that (userId,
+    sessionId) session; without one every message starts a fresh session.
+    Identical messages already in flight share one agent run; an optional
+    Idempotency-Key header replays the first response to retries.
+    Past the deadline (X-Request-Timeout-Ms) or with every provider's circuit
+    open, a fallback answer is returned with "degraded" set.
+    Stage timings are returned in the Server-Timing header.
     """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    observation.mode = 'agent'
+    trace = g.trace
     try:
+        trace.stage('parse')
         data = request.get_json()
         
         if not data or 'message' not in data:
             return jsonify({'error': 'Message is required'}), 400
         
         user_message = data['message']
+        user_id, session_id, error = conversation_ids(data)
+        if error:
+            return jsonify(error), 400
         logger.info(f"Received message: {user_message[:100]}...")
         
-        # Execute agent using run_async method
-        session_id = "demo_session"
-        user_id = "demo_user"
-        
-        async def run_agent():
-            """Run agent and collect response"""
-            events = []
-            try:
-                # FIXED: Pass string directly instead of Message object
-                # The runner should accept strings in newer versions
-                async for event in runner.run_async(
-                    user_id=user_id,
-                    session_id=session_id,
-                    new_message=user_message  # Pass string directly
-                ):
-                    logger.info(f"Event type: {type(event)}")
-                    events.append(event)
-                
-                logger.info(f"Collected {len(events)} events")
-                return events
-            except Exception as e:
-                logger.error(f"Error in run_agent: {str(e)}", exc_info=True)
-                raise
-        
-        # Run async function
+        agent_message = with_onchain_facts(user_message, trace)
+        upstream = trace.stage('upstream')
+        flight_key = (user_id, session_id, user_message) if session_id else user_message
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            events = loop.run_until_complete(run_agent())
-            loop.close()
+            (response_text, prompt_tokens, completion), shared = agent_flights.do(
+                flight_key, lambda: run_agent_turn(agent_message, user_id, session_id, deadline, observation)
+            )
+        except UpstreamUnavailable as e:
+            logger.warning(f"Serving degraded answer ({e.reason}): {e}")
+            observation.source = 'degraded'
+            observation.error(e.reason)
+            body = {'response': get_demo_response(user_message, degraded=True), 'degraded': e.reason}
+            if session_id:
+                body['sessionId'] = session_id
+            return jsonify(body), 200, {'X-Degraded': e.reason, 'Cache-Control': 'no-store'}
         except Exception as e:
             logger.error(f"Asyncio error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
             return jsonify({
                 'error': 'Agent execution failed',
                 'details': str(e)
             }), 500
         
-        # Extract response from events
-        response_text = ""
-        
-        for event in events:
-            try:
-                # Try multiple ways to extract content
-                if hasattr(event, 'content'):
-                    response_text += str(event.content)
-                elif hasattr(event, 'text'):
-                    response_text += str(event.text)
-                elif hasattr(event, 'message'):
-                    response_text += str(event.message)
-                elif isinstance(event, dict):
-                    for key in ['content', 'text', 'message', 'response']:
-                        if key in event:
-                            response_text += str(event[key])
-                            break
-                elif isinstance(event, str):
-                    response_text += event
-            except Exception as e:
-                logger.warning(f"Error processing event: {e}")
-                continue
-        
-        # Fallback if no response extracted
-        if not response_text:
-            response_text = "Agent responded but content could not be extracted"
-        
-        logger.info(f"Returning response: {response_text[:100]}...")
+        observation.source = 'coalesced' if shared else 'llm'
+        observation.model = completion.model
+        trace.upstream(upstream, completion, shared)
+        trace.stage('respond')
+        logger.info(f"Returning {completion.provider} response: {response_text[:100]}... (prompt tokens: {prompt_tokens})")
         
-        return jsonify({'response': response_text})
+        headers = {'X-Prompt-Tokens': str(prompt_tokens), 'X-LLM-Provider': completion.provider}
+        if completion.hedged:
+            headers['X-Hedged'] = 'true'
+        if shared:
+            headers['X-Coalesced'] = 'true'
+        body = {'response': response_text}
+        if session_id:
+            body['sessionId'] = session_id
+        return jsonify(body), 200, headers
         
     except Exception as e:
         logger.error(f"Chat endpoint error: {str(e)}", exc_info=True)
+        observation.error(type(e).__name__)
         return jsonify({
             'error': 'Internal server error',
             'details': str(e)
         }), 500
 
+@app.route('/chat/stream', methods=['POST'])
+@flask_observed('/chat/stream', llm.providers[0].model)
+@flask_traced
+@flask_admitted(admission)
+def chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events)
+    
+    Request: same body as /chat
+    Response: text/event-stream of
+        data: {"delta": "..."}                                   (text as the agent produces it)
+        event: progress
+        data: {"type": "tool_call", "name": "GoodKid_google_search_agent", "subAgent": true, "args": {...}}
+        event: progress
+        data: {"type": "tool_result", "name": "GoodKid_google_search_agent", "subAgent": true, "ms": 2310.4}
+        event: done
+        data: {"finishReason": "stop", "usage": {...}, "timing": {...}}   (final event)
+        event: error
+        data: {"error": "...", "details": "..."}                 (on failure)
+    Agent hand-offs are sent as progress events of type "agent_transfer".
+    If the deadline (X-Request-Timeout-Ms) passes or every provider's circuit is
+    open, the fallback answer is sent as the delta and done carries "degraded".
+    """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    observation.mode = 'agent'
+    observation.streaming = True
+    trace = g.trace
+    trace.stage('parse')
+    data = request.get_json(silent=True)
+    
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    user_message = data['message']
+    user_id, session_id, error = conversation_ids(data)
+    if error:
+        return jsonify(error), 400
+    
+    logger.info(f"Received stream message: {user_message[:100]}...")
+    
+    def generate():
+        done = {'sessionId': session_id} if session_id else {}
+        try:
+            observation.source = 'llm'
+            agent_message = with_onchain_facts(user_message, trace)
+            stream = llm.open(ChatRequest(None, agent_message, user_id, session_id, stream=True), deadline)
+            upstream = trace.stage('upstream')
+            
+            sent_text = False
+            try:
+                # Client disconnects close this generator, which closes the agent run
+                for item in background_loop.iterate(stream):
+                    if isinstance(item, Progress):
+                        yield sse_event({'type': item.type, 'name': item.name, **item.detail}, event='progress')
+                    else:
+                        sent_text = True
+                        yield sse_event({'delta': item})
+            except UpstreamUnavailable as e:
+                logger.warning(f"Serving degraded answer ({e.reason}): {e}")
+                observation.source = 'degraded'
+                observation.error(e.reason)
+                done.update(finishReason='stop', usage=None, degraded=e.reason)
+                if sent_text:
+                    # Cut off mid-answer: end what was sent rather than appending the fallback
+                    done.update(finishReason=e.reason, provider=stream.provider)
+                else:
+                    yield sse_event({'delta': get_demo_response(user_message, degraded=True)})
+                yield sse_event({**done, 'timing': trace.timings()}, event='done')
+                return
+            
+            logger.info(f"{stream.provider} stream finished: {stream.finish_reason}")
+            observation.upstream(stream)
+            observation.model = stream.model
+            trace.upstream(upstream, stream)
+            trace.stage('respond')
+            done.update(
+                finishReason=stream.finish_reason,
+                usage=stream.usage,
+                provider=stream.provider,
+                hedged=stream.hedged,
+                timing=trace.timings()
+            )
+            yield sse_event(done, event='done')
+        
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
+            trace.error = type(e).__name__
+            yield sse_event({
+                'error': 'Agent execution failed',
+                'details': str(e)
+            }, event='error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so text flushes immediately
+        }
+    )
+
+def batch_limiter():
+    """Admission slots for batch items: the batch hands back its own slot and each running item holds one"""
+    g.admission.release()
+    return admission.limiter if admission.enabled else None
+
+@app.route('/chat/batch', methods=['POST'])
+@flask_observed('/chat/batch', llm.providers[0].model)
+@flask_traced
+@flask_admitted(admission, cost=batch_cost)
+def chat_batch():
+    """
+    Batch of independent agent turns, run concurrently
+    
+    Request: {"items": ["message", {"id": "optional", "message": "..."}, ...], "userId": "optional",
+              "concurrency": 8, "ordered": false}       (concurrency and ordered optional)
+    Response: application/x-ndjson, one line per item as soon as it is answered
+        {"index": 0, "id": "...", "response": "...", "provider": "adk"}
+        {"index": 3, "response": "fallback answer", "degraded": "deadline"}
+        {"index": 5, "error": "Agent execution failed", "details": "..."}
+        {"done": true, "items": 6, "unique": 5, "failed": 1, "timing": {...}}    (final line)
+    Every item runs in its own one-off session; identical messages run once.
+    With "ordered": true lines are sent in input order. X-Request-Timeout-Ms
+    applies to each agent run. For admission control every unique item costs
+    a rate-limit token and holds a concurrency slot while it runs.
+    """
+    timeout = request_deadline(request.headers).timeout
+    observation = g.observation
+    observation.mode = 'agent'
+    trace = g.trace
+    trace.stage('parse')
+    data = request.get_json(silent=True)
+    items, concurrency, ordered, error = parse_batch(data)
+    if not error:
+        user_id, _, error = conversation_ids(data)
+    if error:
+        return jsonify(error), 400
+    
+    observation.streaming = True
+    observation.source = 'batch'
+    groups = group_duplicates(item['message'] for item in items)
+    logger.info(f"Received batch of {len(items)} items ({len(groups)} unique)")
+    
+    async def run(agent_message, deadline):
+        return await llm.complete(ChatRequest(None, agent_message, user_id, None), deadline)
+    
+    def generate():
+        writer = BatchWriter(items, ordered)
+        try:
+            # Read every item's contracts up front, at once; the items below find them cached
+            targets = list(dict.fromkeys(
+                target for message in groups for target in onchain.route_targets(classify(message))
+            ))
+            if targets:
+                trace.stage('onchain', targets=len(targets))
+                onchain.lookup(targets, background_loop.run)
+            jobs = [(message, with_onchain_facts(message)) for message in groups]
+            trace.stage('upstream', items=len(groups))
+            for user_message, completion, e in background_loop.iterate(fan_out(jobs, run, concurrency, timeout, batch_limiter())):
+                indexes = groups[user_message]
+                if isinstance(e, UpstreamUnavailable):
+                    observation.error(e.reason)
+                    result = {'response': get_demo_response(user_message, degraded=True), 'degraded': e.reason}
+                    yield from writer.add(indexes, result)
+                elif e is not None:
+                    logger.warning(f"Batch item {indexes[0]} failed: {e}")
+                    observation.error(type(e).__name__)
+                    yield from writer.add(indexes, {'error': 'Agent execution failed', 'details': str(e)}, error=True)
+                else:
+                    observation.upstream(completion)
+                    response_text = completion.text or "Agent responded but content could not be extracted"
+                    yield from writer.add(indexes, {'response': response_text, 'provider': completion.provider})
+            trace.stage('respond')
+            logger.info(f"Batch finished: {len(items)} items, {len(groups)} agent runs, {writer.failed} failed")
+            yield writer.summary(len(groups), timing=trace.timings())
+        
+        except Exception as e:
+            logger.error(f"Chat batch error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
+            trace.error = type(e).__name__
+            yield json.dumps({'error': 'Agent execution failed', 'details': str(e)}) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE,
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so each line flushes when it is ready
+        }
+    )
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
+    start_warm_up()
     app.run(host='0.0.0.0', port=port, debug=False)
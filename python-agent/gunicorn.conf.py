@@ -0,0 +1,41 @@
+"""
+Multi-worker serving with gunicorn (pre-fork, app preloaded)
+
+    gunicorn -c gunicorn.conf.py openai_agent:app
+    gunicorn -c gunicorn.conf.py goodkid_server:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py openai_agent_asgi:app
+
+The app is imported once in the master and forked, so workers share the
+imported modules copy-on-write. With more than one worker, caches, sessions
+and rate limits go to SHARED_STATE_URL (default: a SQLite file under /tmp);
+see shared_state.py. Warm-up runs in each worker after the fork, so no
+client or connection is shared between processes.
+"""
+
+import multiprocessing
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+workers = int(os.getenv('WEB_CONCURRENCY') or multiprocessing.cpu_count())
+# Flask views block on the model, so each worker serves several requests on threads
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+preload_app = True
+# Longer than the slowest agent turn; streams reset the timer with every chunk
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+# Above the Cloud Run / load balancer idle timeout so it closes idle connections first
+keepalive = 75
+accesslog = None
+
+if workers > 1:
+    # Must be set before the app is preloaded, since shared_state reads it at import
+    os.environ.setdefault('SHARED_STATE_URL', 'sqlite:////tmp/goodkid-state.db')
+
+
+def post_worker_init(worker):
+    """Warm up each worker (the ASGI app warms up in before_serving instead)"""
+    module = sys.modules.get(worker.app.app_uri.split(':')[0])
+    start_warm_up = getattr(module, 'start_warm_up', None)
+    if start_warm_up is not None:
+        start_warm_up()
@@ -0,0 +1,109 @@
+"""
+Token-budgeted conversation history
+Selects the newest turns that fit an input-token budget instead of a fixed
+message count. Token counts are cached per message hash, so a history resent
+on every turn is only tokenized once.
+"""
+
+from collections import OrderedDict, namedtuple
+import hashlib
+import os
+import threading
+
+from tokenizer import TOKENS_PER_MESSAGE, count_tokens, get_encoding
+
+# Input tokens available for history (system prompt and the new user message come on top)
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 3000))
+# A single message larger than this is truncated in the middle
+MAX_MESSAGE_TOKENS = int(os.getenv('MAX_MESSAGE_TOKENS', 1200))
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv('TOKEN_COUNT_CACHE_SIZE', 10000))
+
+TRUNCATION_MARKER = "\n\n[... truncated ...]\n\n"
+
+HistoryWindow = namedtuple('HistoryWindow', ['messages', 'tokens', 'kept', 'dropped', 'truncated'])
+
+
+class TokenCountCache:
+    """LRU of content hash -> token count"""
+
+    def __init__(self, max_entries=TOKEN_COUNT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text):
+        key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+        tokens = count_tokens(text)
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+
+token_counts = TokenCountCache()
+
+
+def truncate_middle(text, max_tokens):
+    """Keep the head and tail of an oversized message, dropping the middle"""
+    encoding = get_encoding()
+    marker_tokens = count_tokens(TRUNCATION_MARKER)
+    keep = max(max_tokens - marker_tokens, 2)
+    head, tail = keep - keep // 2, keep // 2
+    if encoding is not None:
+        ids = encoding.encode(text, disallowed_special=())
+        return encoding.decode(ids[:head]) + TRUNCATION_MARKER + encoding.decode(ids[-tail:])
+    # ~4 characters per token without a tokenizer
+    return text[:head * 4] + TRUNCATION_MARKER + text[-tail * 4:]
+
+
+def message_text(content):
+    """Text of a message's content: a string, or the text parts of a content-part list (else None)"""
+    if content is None or isinstance(content, str):
+        return content or ''
+    if isinstance(content, list):
+        return '\n'.join(part['text'] for part in content
+                         if isinstance(part, dict) and isinstance(part.get('text'), str))
+    return None
+
+
+def select_history(conversation_history, budget=HISTORY_TOKEN_BUDGET, max_message_tokens=MAX_MESSAGE_TOKENS):
+    """
+    Newest user/assistant messages that fit the token budget, oldest first
+
+    Walks the history backwards and stops at the first message that no longer
+    fits, so the kept window is always a contiguous suffix of the conversation.
+    Messages whose content is not text are skipped.
+    """
+    selected = []
+    used = 0
+    truncated = 0
+    candidates = [m for m in conversation_history if isinstance(m, dict) and m.get('role') in ('user', 'assistant')]
+    for msg in reversed(candidates):
+        content = message_text(msg.get('content'))
+        if content is None:
+            continue
+        tokens = token_counts.count(content)
+        was_truncated = tokens > max_message_tokens
+        if was_truncated:
+            content = truncate_middle(content, max_message_tokens)
+            tokens = token_counts.count(content)
+        cost = tokens + TOKENS_PER_MESSAGE
+        if used + cost > budget:
+            break
+        selected.append({"role": msg['role'], "content": content})
+        used += cost
+        truncated += was_truncated
+    selected.reverse()
+    return HistoryWindow(
+        messages=selected,
+        tokens=used,
+        kept=len(selected),
+        dropped=len(candidates) - len(selected),
+        truncated=truncated,
+    )
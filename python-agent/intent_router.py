@@ -0,0 +1,292 @@
+"""
+Local intent router
+Classifies each chat turn into a response mode before any LLM call, using one
+precompiled Aho-Corasick automaton over Indonesian/English keyword sets plus
+regex features (0x addresses, URLs). Plain INFORMATION / CLARIFICATION turns can
+then be answered from templates without an upstream call.
+"""
+
+from collections import deque, namedtuple
+import re
+
+from semantic_cache import STOPWORDS
+
+CLARIFICATION = 'CLARIFICATION'
+INFORMATION = 'INFORMATION'
+WHALE_LIST = 'WHALE-LIST'
+ANALYSIS = 'ANALYSIS'
+
+ADDRESS_RE = re.compile(r'\b0x[a-fA-F0-9]{40}\b')
+URL_RE = re.compile(r'https?://\S+|\bwww\.\S+|\b[a-z0-9-]+\.(?:com|io|xyz|org|finance|app|fi|net)\b', re.IGNORECASE)
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# keyword -> (signal, topic). Multi-word phrases are matched as a whole.
+KEYWORDS = {
+    # Middlekid features / how-to
+    'help': ('info', 'help'), 'bantu': ('info', 'help'), 'bantuan': ('info', 'help'), 'fitur': ('info', 'help'),
+    'feature': ('info', 'help'), 'features': ('info', 'help'), 'cara': ('info', 'help'),
+    'how to': ('info', 'help'), 'how does': ('info', 'help'), 'tutorial': ('info', 'help'),
+    'pakai': ('info', 'help'), 'pake': ('info', 'help'), 'menggunakan': ('info', 'help'),
+    'gunakan': ('info', 'help'), 'use': ('info', 'help'), 'work': ('info', 'help'),
+    'kerja': ('info', 'help'), 'middlekid': ('info', 'help'), 'aplikasi': ('info', 'help'),
+    'app': ('info', 'help'), 'portfolio': ('info', 'help'), 'portofolio': ('info', 'help'),
+    'track': ('info', 'help'), 'lacak': ('info', 'help'), 'pantau': ('info', 'help'),
+    'nft': ('info', 'help'), 'lihat': ('info', 'help'), 'cek wallet': ('info', 'help'),
+    'defi': ('info', 'defi'), 'staking': ('info', 'defi'), 'stake': ('info', 'defi'),
+    'lp': ('info', 'defi'), 'liquidity': ('info', 'defi'), 'likuiditas': ('info', 'defi'),
+    'lending': ('info', 'defi'), 'borrowing': ('info', 'defi'), 'posisi': ('info', 'defi'),
+    'position': ('info', 'defi'), 'positions': ('info', 'defi'),
+    # Greetings / small talk
+    'halo': ('info', 'greeting'), 'hallo': ('info', 'greeting'), 'hai': ('info', 'greeting'),
+    'hi': ('info', 'greeting'), 'hello': ('info', 'greeting'), 'hey': ('info', 'greeting'),
+    'pagi': ('info', 'greeting'), 'siang': ('info', 'greeting'), 'sore': ('info', 'greeting'),
+    'malam': ('info', 'greeting'), 'selamat': ('info', 'greeting'), 'who are you': ('info', 'greeting'),
+    'siapa kamu': ('info', 'greeting'), 'terima kasih': ('info', 'greeting'), 'thanks': ('info', 'greeting'),
+    # Whale wallets
+    'whale': ('whale', 'whale'), 'whales': ('whale', 'whale'), 'paus': ('whale', 'whale'),
+    'smart money': ('whale', 'whale'), 'wallet besar': ('whale', 'whale'),
+    'big wallet': ('whale', 'whale'), 'copy trade': ('whale', 'whale'), 'copy trading': ('whale', 'whale'),
+    # Risk / legitimacy questions
+    'aman': ('risk', 'analysis'), 'safe': ('risk', 'analysis'), 'safety': ('risk', 'analysis'),
+    'scam': ('risk', 'analysis'), 'penipuan': ('risk', 'analysis'), 'tipu': ('risk', 'analysis'),
+    'rug': ('risk', 'analysis'), 'rugpull': ('risk', 'analysis'), 'rug pull': ('risk', 'analysis'),
+    'honeypot': ('risk', 'analysis'), 'risiko': ('risk', 'analysis'), 'resiko': ('risk', 'analysis'),
+    'risk': ('risk', 'analysis'), 'risky': ('risk', 'analysis'), 'legit': ('risk', 'analysis'),
+    'audit': ('risk', 'analysis'), 'analisis': ('risk', 'analysis'), 'analisa': ('risk', 'analysis'),
+    'analyze': ('risk', 'analysis'), 'analysis': ('risk', 'analysis'), 'skor': ('risk', 'analysis'),
+    'score': ('risk', 'analysis'), 'kontrak': ('risk', 'analysis'), 'contract': ('risk', 'analysis'),
+    # Generic asset mentions (need an identifier before analysis)
+    'token': ('asset', 'token'), 'tokens': ('asset', 'token'), 'koin': ('asset', 'token'),
+    'coin': ('asset', 'token'), 'crypto': ('asset', 'token'), 'kripto': ('asset', 'token'),
+    'airdrop': ('asset', 'token'), 'project': ('asset', 'token'), 'projek': ('asset', 'token'),
+    'proyek': ('asset', 'token'), 'presale': ('asset', 'token'), 'memecoin': ('asset', 'token'),
+    'meme': ('asset', 'token'),
+    # Chain hints (do not change the mode on their own)
+    'base': ('chain', 'base'), 'ethereum': ('chain', 'ethereum'), 'eth': ('chain', 'ethereum'),
+    'mainnet': ('chain', 'ethereum'), 'arbitrum': ('chain', 'arbitrum'), 'arb': ('chain', 'arbitrum'),
+    'optimism': ('chain', 'optimism'), 'op': ('chain', 'optimism'), 'polygon': ('chain', 'polygon'),
+    'matic': ('chain', 'polygon'), 'bsc': ('chain', 'bsc'), 'bnb': ('chain', 'bsc'),
+    'binance smart chain': ('chain', 'bsc'), 'avalanche': ('chain', 'avalanche'), 'avax': ('chain', 'avalanche'),
+}
+
+# keyword -> project category, used to pick the analysis rubric. These name projects,
+# so they do not make a message "plain" on their own.
+CATEGORY_KEYWORDS = {
+    'bitcoin': 'large', 'btc': 'large', 'ethereum': 'large', 'eth': 'large', 'solana': 'large',
+    'sol': 'large', 'bnb': 'large', 'xrp': 'large', 'cardano': 'large', 'ada': 'large',
+    'avax': 'large', 'layer 1': 'large', 'layer-1': 'large', 'l1': 'large',
+    'aave': 'defi', 'uniswap': 'defi', 'lido': 'defi', 'compound': 'defi', 'curve': 'defi',
+    'maker': 'defi', 'makerdao': 'defi', 'gmx': 'defi', 'stargate': 'defi', 'balancer': 'defi',
+    'pancakeswap': 'defi', 'sushiswap': 'defi', 'beethoven': 'defi', 'rocket pool': 'defi',
+    'protocol': 'defi', 'protokol': 'defi', 'dex': 'defi', 'lending': 'defi',
+    'meme': 'meme', 'memecoin': 'meme', 'pepe': 'meme', 'doge': 'meme', 'dogecoin': 'meme',
+    'shib': 'meme', 'bonk': 'meme', 'wif': 'meme', 'brett': 'meme',
+    'airdrop': 'airdrop', 'claim': 'airdrop', 'klaim': 'airdrop',
+    'presale': 'small', 'token baru': 'small', 'new token': 'small', 'fair launch': 'small',
+    'low cap': 'small', 'lowcap': 'small', 'micro cap': 'small',
+}
+
+# Category keywords that name a specific project, with their aliases folded to one name
+PROJECT_ALIASES = {'btc': 'bitcoin', 'sol': 'solana', 'ada': 'cardano', 'doge': 'dogecoin', 'makerdao': 'maker'}
+PROJECT_NAMES = frozenset(
+    PROJECT_ALIASES.get(k, k) for k in CATEGORY_KEYWORDS
+    if k not in ('layer 1', 'layer-1', 'l1', 'protocol', 'protokol', 'dex', 'lending', 'meme', 'memecoin',
+                 'airdrop', 'claim', 'klaim', 'presale', 'token baru', 'new token', 'fair launch', 'low cap',
+                 'lowcap', 'micro cap')
+)
+
+# Ticker-shaped words outside the vocabulary: $TOSHI, DEGEN
+TICKER_RE = re.compile(r'\$([A-Za-z][A-Za-z0-9]{1,9})\b|\b([A-Z][A-Z0-9]{1,9})\b')
+
+# Filler words that carry no topic of their own (on top of the cache stopwords)
+FILLERS = frozenset("""
+ga gak nggak enggak tidak engga kah dong nya ok oke okay sure yes no wallet wallets
+is it this that whats what's apa sih beneran bener benar ini itu
+""".split())
+
+# Words that only ask for a list ("daftar whale ethereum"); plain for whale-list requests only
+LIST_WORDS = frozenset('daftar tampilkan tunjukkan siapa top semua all'.split())
+
+# Questions asking what a term means ("apa itu rug pull?") get an explanation, not a clarification
+DEFINITION_RE = re.compile(r"\b(?:what\s+(?:is|are)|what'?s|apa\s+itu|apa\s+sih|apaan|arti\s+dari)\b")
+DEFINITION_WORDS = frozenset('jelaskan jelasin explain artinya arti maksudnya maksud pengertian definisi define meaning'.split())
+
+# Function words used to pick the template language (Indonesian unless clearly English)
+ENGLISH_HINTS = frozenset('the is are what how does do can you your this my i who please safe is it'.split())
+INDONESIAN_HINTS = frozenset('apa apakah ini itu yang cara bagaimana gimana saya aku dong aman kah bisa tolong kasih di ke'.split())
+
+# subjects: the recognized project names, ticker-shaped words and chain hints of the message;
+# questions with different subjects never share an answer
+Route = namedtuple('Route', ['mode', 'topic', 'plain', 'lang', 'chains', 'category', 'keywords', 'addresses', 'urls',
+                             'subjects'])
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every keyword occurrence"""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(pattern)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find(self, text):
+        """Yield (start, end, pattern) for every occurrence in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in out[state]:
+                yield index - len(pattern) + 1, index + 1, pattern
+
+
+_MATCHER = AhoCorasick(set(KEYWORDS) | set(CATEGORY_KEYWORDS))
+
+
+def _is_boundary(text, index):
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+def classify(message):
+    """
+    Route a user message to a response mode (and project category for analysis)
+
+    `plain` is True when every content word of the message is a known keyword
+    or filler, i.e. there is no project name or identifier the router could be
+    missing, so a templated answer is safe.
+    """
+    text = message.lower()
+    addresses = ADDRESS_RE.findall(message)
+    urls = URL_RE.findall(message)
+
+    signals = {}
+    topics = []
+    chains = []
+    categories = []
+    names = set()
+    covered = []
+    for start, end, keyword in _MATCHER.find(text):
+        if not (_is_boundary(text, start - 1) and _is_boundary(text, end)):
+            continue
+        category = CATEGORY_KEYWORDS.get(keyword)
+        if category and category not in categories:
+            categories.append(category)
+        if keyword not in KEYWORDS:
+            if PROJECT_ALIASES.get(keyword, keyword) in PROJECT_NAMES:
+                names.add(PROJECT_ALIASES.get(keyword, keyword))
+            continue
+        signal, topic = KEYWORDS[keyword]
+        signals.setdefault(signal, []).append(keyword)
+        if signal == 'chain':
+            if topic not in chains:
+                chains.append(topic)
+        else:
+            topics.append(topic)
+        covered.append((start, end))
+
+    unknown = 0
+    unknown_words = set()
+    listing = 0
+    definition = bool(DEFINITION_RE.search(text))
+    english = indonesian = 0
+    for word in WORD_RE.finditer(text):
+        token = word.group()
+        english += token in ENGLISH_HINTS
+        indonesian += token in INDONESIAN_HINTS
+        if token in DEFINITION_WORDS:
+            definition = True
+            continue
+        # Single letters are contraction leftovers ("what's" -> what, s)
+        if token in STOPWORDS or token in FILLERS or token.isdigit() or len(token) == 1:
+            continue
+        if any(start <= word.start() and word.end() <= end for start, end in covered):
+            continue
+        if token in LIST_WORDS:
+            listing += 1
+            continue
+        unknown += 1
+        unknown_words.add(token)
+
+    lang = 'en' if english > indonesian else 'id'
+    has_identifier = bool(addresses or urls)
+    keywords = tuple(k for matched in signals.values() for k in matched)
+    chains = tuple(chains)
+    tickers = {(dollar or caps).lower() for dollar, caps in TICKER_RE.findall(message)}
+    subjects = tuple(sorted(names | (tickers & unknown_words) | set(chains)))
+    # One clear category selects its rubric; none or several means "use all of them".
+    # An unknown contract address is treated as a small / new token.
+    if len(categories) == 1:
+        category = categories[0]
+    elif not categories and addresses:
+        category = 'small'
+    else:
+        category = None
+
+    if 'whale' in signals:
+        # Only a bare list request ("whale di base dong") is plain; "why are whales selling ETH?"
+        # or "is whale X a scam?" asks something else about whales
+        plain = not has_identifier and unknown == 0 and not definition and signals.keys() <= {'whale', 'chain'}
+        return Route(WHALE_LIST, 'whale', plain, lang, chains, category, keywords, addresses, urls, subjects)
+    # Elsewhere "daftar" (sign up), "semua" ... are ordinary content words
+    unknown += listing
+
+    if has_identifier:
+        return Route(ANALYSIS, 'analysis', False, lang, chains, category, keywords, addresses, urls, subjects)
+
+    if 'risk' in signals or 'asset' in signals:
+        if unknown == 0 and definition:
+            # "What is a honeypot?": explain the term (LLM), no token to ask for
+            return Route(INFORMATION, 'definition', False, lang, chains, category, keywords, addresses, urls, subjects)
+        if unknown == 0:
+            # Risk question about "a token" with nothing to analyze yet
+            return Route(CLARIFICATION, 'token', True, lang, chains, category, keywords, addresses, urls, subjects)
+        # Probably names a project ("apakah PEPE aman?")
+        return Route(ANALYSIS, 'analysis', False, lang, chains, category, keywords, addresses, urls, subjects)
+
+    if 'info' in signals:
+        topic = 'defi' if 'defi' in topics else 'help' if 'help' in topics else 'greeting'
+        return Route(INFORMATION, topic, unknown == 0, lang, chains, category, keywords, addresses, urls, subjects)
+
+    # Nothing recognized: let the model decide
+    return Route(ANALYSIS if unknown else CLARIFICATION, 'unknown', False, lang, chains, category, keywords, addresses, urls, subjects)
+
+
+def prompt_route(route, earlier):
+    """
+    (mode, category) to build the system prompt for, given the earlier user turns of the conversation
+
+    Follow-ups such as "is it safe?", "kasih skor dong" or "what about the
+    liquidity?" do not classify as ANALYSIS on their own; when the earlier
+    turns (or a session summary, passed with them) are an analysis, the turn
+    keeps the analysis sections.
+    """
+    if route.mode in (ANALYSIS, WHALE_LIST) or not earlier:
+        return route.mode, route.category
+    previous = classify('\n'.join(earlier))
+    if previous.mode == ANALYSIS:
+        return ANALYSIS, route.category or previous.category
+    return route.mode, route.category
@@ -0,0 +1,709 @@
+"""
+Pluggable LLM providers with failover and hedged requests
+Both servers call the model through a ProviderRouter instead of a hard-wired
+client. Providers are tried in the configured order (LLM_PROVIDERS, e.g.
+"openai,adk"). If the primary fails before its first token, the secondary is
+started at once (failover). If the primary is merely slow, the secondary is
+started after a hedge delay and the first one to produce a token wins; the
+loser is cancelled. Hedging is capped to a fraction of requests, so the
+average cost stays close to a single call.
+Each provider sits behind a circuit breaker, and a request Deadline bounds the
+whole race and every later read (see resilience.py).
+"""
+
+from collections import deque, namedtuple
+import asyncio
+import inspect
+import logging
+import os
+import time
+import uuid
+import weakref
+
+from resilience import CIRCUIT_SLOW_CALL_MS, CircuitBreaker, CircuitOpenError, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+# Connection pool for the upstream OpenAI API. One process serves hundreds of
+# concurrent slow completions, so keep plenty of warm connections around.
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 200))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 50))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+
+ADK_APP_NAME = "GoodKid-MiddleKid"
+# Sessions already known to exist in the ADK session service (skips a lookup per turn)
+ADK_KNOWN_SESSIONS = 10000
+
+# Hedging: a fixed delay, or (unset) the primary's recent p95 time to first token
+LLM_HEDGING = os.getenv('LLM_HEDGING', 'true').lower() == 'true'
+LLM_HEDGE_AFTER_MS = os.getenv('LLM_HEDGE_AFTER_MS')
+LLM_HEDGE_MIN_MS = float(os.getenv('LLM_HEDGE_MIN_MS', 1000))
+LLM_HEDGE_INITIAL_MS = float(os.getenv('LLM_HEDGE_INITIAL_MS', 3000))
+# At most this fraction of requests (plus a small burst) may send a hedge
+LLM_HEDGE_MAX_RATIO = float(os.getenv('LLM_HEDGE_MAX_RATIO', 0.1))
+HEDGE_BURST = 5
+# Adaptive delay needs this many first-token samples before trusting the p95
+TTFT_MIN_SAMPLES = 20
+TTFT_WINDOW = 200
+
+# One upstream call: OpenAI-style messages (None = provider builds its own prompt),
+# plus the raw user message and conversation ids for agent-style providers
+# (session_id None = a one-off agent session, deleted after the turn).
+# stream=True asks agent-style providers for partial text and Progress items;
+# response_format is passed to chat-completions providers (e.g. {"type": "json_object"})
+ChatRequest = namedtuple('ChatRequest', ['messages', 'user_message', 'user_id', 'session_id', 'stream',
+                                         'response_format'], defaults=(False, None))
+
+# Non-text item of a streamed agent turn: tool_call, tool_result or agent_transfer
+Progress = namedtuple('Progress', ['type', 'name', 'detail'])
+
+# ttft / elapsed: seconds from starting the race to the first / last token
+Completion = namedtuple('Completion', ['text', 'provider', 'finish_reason', 'usage', 'hedged', 'model', 'ttft', 'elapsed'])
+
+
+def make_async_openai_client():
+    """AsyncOpenAI on a tuned keep-alive pool; raises ValueError without an API key"""
+    try:
+        import httpx
+        from openai import AsyncOpenAI
+    except ImportError:
+        raise ImportError("OpenAI package not installed. Run: pip install openai httpx")
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not set")
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+
+def default_messages(user_message):
+    """Mode-aware system prompt plus the message, for callers without their own prompt"""
+    from intent_router import classify
+    from prompt_sections import build_system_prompt
+    route = classify(user_message)
+    prompt = build_system_prompt(route.mode, route.category)
+    return [
+        {"role": "system", "content": prompt.text},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def event_text(event):
+    """Best-effort text of one ADK runner event"""
+    content = getattr(event, 'content', None)
+    parts = getattr(content, 'parts', None)
+    if parts is not None:
+        return ''.join(getattr(part, 'text', None) or '' for part in parts)
+    if content is not None:
+        return str(content)
+    if hasattr(event, 'text'):
+        return str(event.text)
+    if hasattr(event, 'message'):
+        return str(event.message)
+    if isinstance(event, dict):
+        for key in ['content', 'text', 'message', 'response']:
+            if key in event:
+                return str(event[key])
+    if isinstance(event, str):
+        return event
+    return ''
+
+
+def clip_args(args, limit=200):
+    """Tool-call arguments for progress events, long strings clipped"""
+    return {k: (v[:limit] if isinstance(v, str) else v) for k, v in (args or {}).items()}
+
+
+def agent_tree(agent):
+    """An ADK agent, its sub-agents and the agents behind its AgentTools (depth first)"""
+    if agent is None:
+        return
+    yield agent
+    for sub_agent in getattr(agent, 'sub_agents', None) or []:
+        yield from agent_tree(sub_agent)
+    for tool in getattr(agent, 'tools', None) or []:
+        yield from agent_tree(getattr(tool, 'agent', None))
+
+
+class OpenAIProvider:
+    """OpenAI chat completions, streamed so the router sees the first token"""
+
+    name = 'openai'
+
+    def __init__(self, model=OPENAI_MODEL, temperature=0.7, max_tokens=1000, client_factory=None):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.client_factory = client_factory
+        # AsyncOpenAI pools are bound to the loop that created them
+        self._clients = weakref.WeakKeyDictionary()
+
+    def available(self):
+        return bool(os.getenv('OPENAI_API_KEY'))
+
+    def _client(self):
+        if self.client_factory is not None:
+            return self.client_factory()
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = make_async_openai_client()
+        return client
+
+    async def warm_up(self, connect=True, timeout=10.0):
+        """Build the client on this loop; with connect, leave a pooled connection to the API open"""
+        client = self._client()
+        if connect:
+            await asyncio.wait_for(client.models.retrieve(self.model), timeout)
+
+    async def stream(self, request, meta):
+        """Yield text deltas; fills meta['finish_reason'] and meta['usage']"""
+        options = {'response_format': request.response_format} if request.response_format else {}
+        stream = await self._client().chat.completions.create(
+            model=self.model,
+            messages=request.messages or default_messages(request.user_message),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options
+        )
+        try:
+            async for chunk in stream:
+                # The usage chunk arrives last with an empty choices list
+                if chunk.usage is not None:
+                    meta['usage'] = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    yield choice.delta.content
+                if choice.finish_reason:
+                    meta['finish_reason'] = choice.finish_reason
+        finally:
+            await stream.close()
+
+
+class ADKProvider:
+    """Google ADK Runner around the GoodKid agents (keeps its own per-session history)"""
+
+    name = 'adk'
+
+    def __init__(self, runner=None, app_name=ADK_APP_NAME):
+        self.runner = runner
+        self.app_name = app_name
+        self._sessions = set()
+        self._importable = None
+        self._stream_config = None
+
+    @property
+    def model(self):
+        agent = getattr(self.runner, 'agent', None)
+        model = getattr(agent, 'model', None)
+        # A model name, or a shared BaseLlm instance carrying one
+        model = getattr(model, 'model', model)
+        return str(model) if model else self.name
+
+    def available(self):
+        if self.runner is not None:
+            return True
+        if self._importable is None:
+            try:
+                import google.adk  # noqa: F401
+                self._importable = True
+            except ImportError:
+                self._importable = False
+        return self._importable
+
+    def _runner(self):
+        if self.runner is None:
+            from google.adk.runners import Runner
+            from adk_sessions import BoundedSessionService
+            from good_kid_agent import root_agent
+            self.runner = Runner(
+                agent=root_agent,
+                session_service=BoundedSessionService(),
+                app_name=self.app_name
+            )
+        return self.runner
+
+    async def warm_up(self, connect=True, timeout=10.0):
+        """Build the runner and its agents' model clients; with connect, open a connection to the model API"""
+        clients = {}
+        for agent in agent_tree(getattr(self._runner(), 'agent', None)):
+            model = agent.canonical_model
+            client = getattr(model, 'api_client', None)
+            if client is not None:
+                clients[id(client)] = (client, model.model)
+        if connect:
+            for client, model in clients.values():
+                await asyncio.wait_for(client.aio.models.get(model=model), timeout)
+
+    async def _ensure_session(self, runner, user_id, session_id):
+        key = (user_id, session_id)
+        service = getattr(runner, 'session_service', None)
+        if service is None:
+            return
+        ensure = getattr(service, 'ensure_session', None)
+        if ensure is not None:
+            # Bounded services evict sessions, so they are asked every turn instead of cached here
+            await ensure(app_name=self.app_name, user_id=user_id, session_id=session_id)
+            return
+        if key in self._sessions:
+            return
+        if len(self._sessions) > ADK_KNOWN_SESSIONS:
+            self._sessions.clear()
+        # Session service methods are coroutines in current ADK releases, plain calls in older ones
+        session = service.get_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+        if inspect.isawaitable(session):
+            session = await session
+        if session is None:
+            created = service.create_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+            if inspect.isawaitable(created):
+                await created
+        self._sessions.add(key)
+
+    async def _drop_session(self, runner, user_id, session_id):
+        self._sessions.discard((user_id, session_id))
+        service = getattr(runner, 'session_service', None)
+        if service is None:
+            return
+        try:
+            deleted = service.delete_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+            if inspect.isawaitable(deleted):
+                await deleted
+        except Exception as e:
+            logger.warning(f"Could not delete ADK session {session_id}: {e}")
+
+    def _message(self, text):
+        try:
+            from google.genai import types
+        except ImportError:
+            return text
+        return types.Content(role='user', parts=[types.Part(text=text)])
+
+    def _run_kwargs(self, request):
+        """Extra run_async arguments: SSE streaming mode for streamed requests"""
+        if not request.stream:
+            return {}
+        if self._stream_config is None:
+            try:
+                from google.adk.agents.run_config import RunConfig, StreamingMode
+            except ImportError:
+                return {}
+            self._stream_config = RunConfig(streaming_mode=StreamingMode.SSE)
+        return {'run_config': self._stream_config}
+
+    def _progress(self, event, turn):
+        """Progress items for the hand-offs, tool calls and tool results in one final event"""
+        author = getattr(event, 'author', None)
+        if author and author != 'user' and author != turn['author']:
+            turn['author'] = author
+            yield Progress('agent_transfer', author, {})
+        get_calls = getattr(event, 'get_function_calls', None)
+        for call in get_calls() if get_calls else []:
+            turn['calls'][call.id or call.name] = time.perf_counter()
+            yield Progress('tool_call', call.name, {
+                'args': clip_args(call.args), 'subAgent': call.name in turn['agent_tools']
+            })
+        get_responses = getattr(event, 'get_function_responses', None)
+        for response in get_responses() if get_responses else []:
+            started = turn['calls'].pop(response.id or response.name, None)
+            detail = {'subAgent': response.name in turn['agent_tools']}
+            if started is not None:
+                detail['ms'] = round((time.perf_counter() - started) * 1000, 1)
+            yield Progress('tool_result', response.name, detail)
+
+    async def _events(self, runner, **kwargs):
+        """
+        runner.run_async(**kwargs), iterated by a single task
+
+        The router advances a stream from different tasks (race, then reads),
+        but ADK keeps tracing context open across its yields, which must be
+        entered and left in the same task, so one task pumps the events here.
+        """
+        events = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for event in runner.run_async(**kwargs):
+                    events.put_nowait(('event', event))
+                events.put_nowait(('done', None))
+            except Exception as e:
+                events.put_nowait(('error', e))
+
+        task = asyncio.ensure_future(pump())
+        try:
+            while True:
+                kind, value = await events.get()
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise value
+                yield value
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def stream(self, request, meta):
+        """
+        Yield the text of each agent event; fills meta['usage'] with prompt tokens
+
+        With request.stream the runner streams partial text (ADK SSE mode) and
+        tool calls (the search / URL-context sub-agents), their results and
+        agent hand-offs are yielded as Progress items in between.
+        """
+        runner = self._runner()
+        user_id = request.user_id or 'anonymous'
+        session_id = request.session_id or f"turn-{uuid.uuid4().hex}"
+        await self._ensure_session(runner, user_id, session_id)
+        agent = getattr(runner, 'agent', None)
+        turn = {
+            'author': getattr(agent, 'name', None),
+            'calls': {},
+            # AgentTool wraps a sub-agent; its calls are reported with subAgent set
+            'agent_tools': {t.name for t in getattr(agent, 'tools', None) or [] if getattr(t, 'agent', None)},
+        }
+        prompt_tokens = 0
+        streamed = False
+        try:
+            async for event in self._events(
+                runner,
+                user_id=user_id,
+                session_id=session_id,
+                new_message=self._message(request.user_message),
+                **self._run_kwargs(request)
+            ):
+                text = event_text(event)
+                if getattr(event, 'partial', False):
+                    streamed = True
+                    if text:
+                        yield text
+                    continue
+                usage = getattr(event, 'usage_metadata', None)
+                prompt_tokens += getattr(usage, 'prompt_token_count', None) or 0
+                # A final event after partial ones repeats their text in full
+                if streamed:
+                    streamed = False
+                elif text:
+                    yield text
+                if request.stream:
+                    for item in self._progress(event, turn):
+                        yield item
+        finally:
+            if request.session_id is None:
+                await self._drop_session(runner, user_id, session_id)
+        meta['finish_reason'] = 'stop'
+        meta['usage'] = {'prompt_tokens': prompt_tokens}
+
+
+PROVIDER_TYPES = {
+    'openai': OpenAIProvider,
+    'adk': ADKProvider,
+}
+
+
+class _Attempt:
+    """One provider's stream inside a race, started up to its first token"""
+
+    def __init__(self, provider, request, hedge):
+        self.provider = provider
+        self.hedge = hedge
+        self.meta = {'finish_reason': None, 'usage': None}
+        self.iterator = provider.stream(request, self.meta).__aiter__()
+        self.started = time.perf_counter()
+        self.task = asyncio.ensure_future(self._first())
+
+    async def _first(self):
+        """(has_text, first delta) - an empty answer counts as finished, not failed"""
+        try:
+            return True, await self.iterator.__anext__()
+        except StopAsyncIteration:
+            return False, None
+
+    async def discard(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        try:
+            await self.iterator.aclose()
+        except Exception:
+            pass
+
+
+class LLMStream:
+    """
+    Async iterator of text deltas from whichever provider wins the race
+
+    provider, model, hedged, ttft, elapsed, finish_reason and usage are
+    filled in as it runs. For stream requests agent providers also yield
+    Progress items; the first of them wins the race, but ttft is the time to
+    the first text.
+    """
+
+    def __init__(self, router, request, deadline=None):
+        self.router = router
+        self.request = request
+        self.deadline = deadline
+        self.provider = None
+        self.model = None
+        self.hedged = False
+        self.ttft = None
+        self.elapsed = None
+        self._started = None
+        self._winner = None
+        self._first = None
+        self._exhausted = False
+        # Providers still waiting for their first token during the race
+        self._pending = set()
+
+    @property
+    def finish_reason(self):
+        return self._winner.meta['finish_reason'] if self._winner else None
+
+    @property
+    def usage(self):
+        return self._winner.meta['usage'] if self._winner else None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._next()
+        if self.ttft is None and isinstance(item, str):
+            self.ttft = time.perf_counter() - self._started
+        return item
+
+    async def _next(self):
+        if self._winner is None:
+            self._started = time.perf_counter()
+            self._winner, has_text, self._first = await self._guard(self.router._race(self), racing=True)
+            self.provider = self._winner.provider.name
+            self.model = getattr(self._winner.provider, 'model', None) or self.provider
+            if not has_text:
+                self._exhausted = True
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        if self._exhausted:
+            self._finish()
+            raise StopAsyncIteration
+        try:
+            return await self._guard(self._winner.iterator.__anext__(), racing=False)
+        except StopAsyncIteration:
+            self._finish()
+            raise
+
+    def _finish(self):
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self._started
+
+    async def _guard(self, awaitable, racing):
+        """
+        Await under the deadline; mid-stream errors and slow calls count against the breaker
+
+        A deadline that expires sooner than CIRCUIT_SLOW_CALL_MS is the caller's
+        choice, not a provider failure, and leaves the breaker as it was.
+        """
+        scope = asyncio.timeout(self.deadline.remaining() if self.deadline else None)
+        try:
+            async with scope:
+                return await awaitable
+        except TimeoutError:
+            if not scope.expired():
+                raise
+            self.router.deadline_exceeded += 1
+            names = set(self._pending) if racing else {self._winner.provider.name}
+            slow = time.perf_counter() - self._started >= CIRCUIT_SLOW_CALL_MS / 1000
+            for name in names:
+                if slow:
+                    self.router.breakers[name].record_failure()
+                else:
+                    self.router.breakers[name].release()
+            logger.warning(f"LLM deadline of {self.deadline.timeout:.1f}s exceeded waiting on {sorted(names)}")
+            raise DeadlineExceeded(f"LLM call exceeded its {self.deadline.timeout:.1f}s deadline") from None
+        except StopAsyncIteration:
+            raise
+        except Exception:
+            if not racing:
+                self.router.errors[self.provider] += 1
+                self.router.breakers[self.provider].record_failure()
+            raise
+
+    async def aclose(self):
+        if self._winner is not None:
+            await self._winner.iterator.aclose()
+
+
+class ProviderRouter:
+    """Ordered providers with failover and capped, latency-triggered hedging"""
+
+    def __init__(self, providers, hedging=LLM_HEDGING, hedge_after_ms=LLM_HEDGE_AFTER_MS,
+                 hedge_max_ratio=LLM_HEDGE_MAX_RATIO):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = list(providers)
+        self.hedging = hedging
+        self.hedge_after = float(hedge_after_ms) / 1000 if hedge_after_ms else None
+        self.hedge_max_ratio = hedge_max_ratio
+        self._ttft = {p.name: deque(maxlen=TTFT_WINDOW) for p in self.providers}
+        self._cleanup = set()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.wins = {p.name: 0 for p in self.providers}
+        self.errors = {p.name: 0 for p in self.providers}
+        self.breakers = {p.name: CircuitBreaker(p.name) for p in self.providers}
+        self.short_circuits = 0
+        self.deadline_exceeded = 0
+
+    @classmethod
+    def from_env(cls, default, **provider_options):
+        """
+        Providers named in LLM_PROVIDERS (comma-separated, primary first), else default
+
+        provider_options maps a provider name to its constructor kwargs.
+        """
+        names = [n.strip() for n in os.getenv('LLM_PROVIDERS', default).split(',') if n.strip()]
+        unknown = [n for n in names if n not in PROVIDER_TYPES]
+        if unknown:
+            raise ValueError(f"Unknown LLM provider(s) {unknown}, expected {sorted(PROVIDER_TYPES)}")
+        return cls([PROVIDER_TYPES[n](**provider_options.get(n, {})) for n in names])
+
+    def get(self, name):
+        return next((p for p in self.providers if p.name == name), None)
+
+    def available(self):
+        return [p for p in self.providers if p.available()]
+
+    def open(self, request, deadline=None):
+        """LLMStream for a request; the race starts on the first read"""
+        return LLMStream(self, request, deadline)
+
+    async def complete(self, request, deadline=None):
+        stream = self.open(request, deadline)
+        text = ''.join([delta async for delta in stream if isinstance(delta, str)])
+        return Completion(text, stream.provider, stream.finish_reason, stream.usage, stream.hedged,
+                          stream.model, stream.ttft, stream.elapsed)
+
+    def hedge_delay(self, provider):
+        """Seconds to wait for the primary's first token before hedging"""
+        if self.hedge_after is not None:
+            return self.hedge_after
+        samples = self._ttft[provider.name]
+        if len(samples) < TTFT_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_MS / 1000
+        ordered = sorted(samples)
+        p95 = ordered[int(0.95 * (len(ordered) - 1))]
+        return max(p95, LLM_HEDGE_MIN_MS / 1000)
+
+    def _may_hedge(self):
+        return self.hedging and self.hedges < self.hedge_max_ratio * self.requests + HEDGE_BURST
+
+    def _retire(self, attempt):
+        """Cancel a losing attempt in the background so the winner is not delayed"""
+        task = asyncio.ensure_future(attempt.discard())
+        self._cleanup.add(task)
+        task.add_done_callback(self._cleanup.discard)
+
+    async def _race(self, stream):
+        """Return (winning attempt, has_text, first delta) or raise the last provider error"""
+        providers = self.available()
+        if not providers:
+            raise ValueError("No LLM provider is configured")
+        loop = asyncio.get_running_loop()
+        queue = list(providers)
+
+        def next_allowed():
+            """Next provider whose circuit lets a call through (claims a half-open probe)"""
+            while queue:
+                provider = queue.pop(0)
+                if self.breakers[provider.name].allow():
+                    return provider
+            return None
+
+        primary = next_allowed()
+        if primary is None:
+            self.short_circuits += 1
+            raise CircuitOpenError(f"Circuit open for all LLM providers {[p.name for p in providers]}")
+        self.requests += 1
+        attempts = {}
+
+        def start(provider, hedge):
+            attempt = _Attempt(provider, stream.request, hedge)
+            attempts[attempt.task] = attempt
+            stream._pending.add(provider.name)
+            return attempt
+
+        start(primary, hedge=False)
+        hedge_at = loop.time() + self.hedge_delay(primary) if queue and self.hedging else None
+        last_error = None
+        try:
+            while attempts:
+                timeout = max(hedge_at - loop.time(), 0) if hedge_at is not None else None
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    hedge = next_allowed() if self._may_hedge() else None
+                    if hedge is not None:
+                        self.hedges += 1
+                        stream.hedged = True
+                        logger.info(f"Hedging: {primary.name} has no first token yet, starting {hedge.name}")
+                        start(hedge, hedge=True)
+                    continue
+                for task in done:
+                    attempt = attempts.pop(task)
+                    name = attempt.provider.name
+                    stream._pending.discard(name)
+                    if task.exception() is None:
+                        has_text, first = task.result()
+                        self.breakers[name].record_success()
+                        self._ttft[name].append(time.perf_counter() - attempt.started)
+                        self.wins[name] += 1
+                        if attempt.hedge:
+                            self.hedge_wins += 1
+                        for loser in attempts.values():
+                            self._retire(loser)
+                        attempts.clear()
+                        return attempt, has_text, first
+                    last_error = task.exception()
+                    self.errors[name] += 1
+                    self.breakers[name].record_failure()
+                    logger.warning(f"LLM provider {name} failed: {last_error}")
+                    fallback = next_allowed() if not attempts else None
+                    if fallback is not None:
+                        self.failovers += 1
+                        hedge_at = None
+                        logger.info(f"Failing over from {name} to {fallback.name}")
+                        start(fallback, hedge=False)
+            raise last_error
+        finally:
+            # Cancelled (client gone) or failed: nothing may keep running upstream
+            for attempt in attempts.values():
+                self._retire(attempt)
+
+    def stats(self):
+        return {
+            'providers': [p.name for p in self.providers],
+            'available': [p.name for p in self.available()],
+            'requests': self.requests,
+            'wins': dict(self.wins),
+            'errors': dict(self.errors),
+            'hedges': self.hedges,
+            'hedgeWins': self.hedge_wins,
+            'failovers': self.failovers,
+            'shortCircuits': self.short_circuits,
+            'deadlineExceeded': self.deadline_exceeded,
+            'circuits': {name: breaker.stats() for name, breaker in self.breakers.items()},
+            'hedgeDelayMs': round(self.hedge_delay(self.providers[0]) * 1000, 1),
+        }
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+HTTP load generator for /chat and /chat/stream
+Drives a running server at a fixed concurrency (closed loop) or a fixed arrival
+rate (open loop, Poisson arrivals) and reports latency percentiles, time to
+first token, throughput and, against fake_llm.py, per-request server overhead.
+
+Start the server under test with ADMISSION_ENABLED=false (the default): all load
+comes from one address, so per-client rate limits would turn most of it into 429s.
+
+Usage: python loadgen.py http://127.0.0.1:8080 --endpoint /chat/stream --concurrency 50 --duration 30
+       python loadgen.py http://127.0.0.1:8080 --rate 20 --requests 500 --json result.json
+"""
+
+from collections import namedtuple
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import re
+import time
+
+import httpx
+
+from fake_llm import UPSTREAM_MARKER
+
+# LLM-bound questions (not answered by the local intent router templates)
+MESSAGES = [
+    "apakah token PEPE aman untuk dibeli sekarang?",
+    "0x0c54fccd2e384b4bb6f2e405bf5cbc15a017aafb aman gak? kontraknya udah di-renounce belum",
+    "cek https://example-airdrop.xyz scam gak, disuruh approve semua token",
+    "Can you explain the risk of staking ETH on Lido versus Rocket Pool?",
+    "airdrop ZKsync minta connect wallet dan sign permit, aman?",
+    "analisis risiko token BONK di solana dong",
+]
+
+UPSTREAM_RE = re.compile(re.escape(UPSTREAM_MARKER) + r'([\d.]+)')
+
+Sample = namedtuple('Sample', ['status', 'latency', 'ttft', 'upstream', 'error'])
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def upstream_seconds(text):
+    match = UPSTREAM_RE.search(text or '')
+    return float(match.group(1)) / 1000 if match else None
+
+
+class LoadGenerator:
+    def __init__(self, base_url, endpoint='/chat', unique=True, session_turns=0, timeout=120.0):
+        self.url = base_url.rstrip('/') + endpoint
+        self.stream = endpoint.endswith('/stream')
+        self.unique = unique
+        self.session_turns = session_turns
+        self.timeout = timeout
+        self._counter = itertools.count()
+        self.samples = []
+
+    def _payload(self, n):
+        message = MESSAGES[n % len(MESSAGES)]
+        payload = {'message': f"{message} (ref {n})" if self.unique else message}
+        if self.session_turns:
+            payload['sessionId'] = f"loadgen-{n // self.session_turns}"
+        return payload
+
+    async def one(self, client):
+        n = next(self._counter)
+        # Unique messages plus a cache bypass keep every request on the upstream path
+        headers = {'X-Cache-Bypass': '1'} if self.unique else {}
+        started = time.perf_counter()
+        ttft = None
+        try:
+            if self.stream:
+                text = []
+                async with client.stream('POST', self.url, json=self._payload(n), headers=headers) as response:
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data: '):
+                            continue
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        text.append(line)
+                    status = response.status_code
+                body = '\n'.join(text)
+                error = None if status == 200 and '"error"' not in body else body[-200:]
+            else:
+                response = await client.post(self.url, json=self._payload(n), headers=headers)
+                status = response.status_code
+                body = response.text
+                error = None if status == 200 else body[:200]
+            latency = time.perf_counter() - started
+        except httpx.HTTPError as e:
+            self.samples.append(Sample(0, time.perf_counter() - started, None, None, repr(e)))
+            return
+        self.samples.append(Sample(status, latency, ttft if ttft is not None else latency,
+                                   upstream_seconds(body), error))
+
+    async def closed_loop(self, concurrency, duration=None, requests=None):
+        """concurrency workers, each sending its next request when the last one finishes"""
+        deadline = time.perf_counter() + duration if duration else None
+        budget = itertools.count() if requests else None
+
+        async def worker(client):
+            while True:
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                if budget is not None and next(budget) >= requests:
+                    return
+                await self.one(client)
+
+        async with self._client(concurrency) as client:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+
+    async def open_loop(self, rate, duration=None, requests=None, seed=None):
+        """Poisson arrivals at rate req/s regardless of how fast responses come back"""
+        rng = random.Random(seed)
+        total = requests or int(rate * duration)
+        tasks = []
+        async with self._client(None) as client:
+            next_at = time.perf_counter()
+            for _ in range(total):
+                next_at += rng.expovariate(rate)
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self.one(client)))
+            await asyncio.gather(*tasks)
+
+    def _client(self, connections):
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        return httpx.AsyncClient(limits=limits, timeout=self.timeout)
+
+    def report(self, wall_time):
+        ok = [s for s in self.samples if s.error is None]
+        latencies = [s.latency for s in ok]
+        ttfts = [s.ttft for s in ok]
+        overheads = [s.latency - s.upstream for s in ok if s.upstream is not None]
+
+        def ms(values, pct):
+            value = percentile(values, pct)
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            'url': self.url,
+            'requests': len(self.samples),
+            'errors': len(self.samples) - len(ok),
+            'rps': round(len(ok) / wall_time, 2) if wall_time else 0.0,
+            'latencyMs': {p: ms(latencies, int(p[1:])) for p in ('p50', 'p95', 'p99')},
+            'ttftMs': {p: ms(ttfts, int(p[1:])) for p in ('p50', 'p95', 'p99')},
+            'overheadMs': {p: ms(overheads, int(p[1:])) for p in ('p50', 'p95', 'p99')},
+            'wallTimeSec': round(wall_time, 2),
+        }
+
+
+def run(base_url, endpoint='/chat', concurrency=None, rate=None, duration=None, requests=None,
+        unique=True, session_turns=0, warmup=0, seed=None):
+    """Run one load pass and return its report dict"""
+    if not duration and not requests:
+        raise ValueError("Set duration or requests")
+    generator = LoadGenerator(base_url, endpoint, unique, session_turns)
+    if warmup:
+        # Lazy imports, client pools and connections are set up by the first requests;
+        # keep that cold start out of the steady-state numbers
+        asyncio.run(generator.closed_loop(min(concurrency or warmup, warmup), requests=warmup))
+        generator.samples = []
+    started = time.perf_counter()
+    if rate:
+        asyncio.run(generator.open_loop(rate, duration, requests, seed))
+    else:
+        asyncio.run(generator.closed_loop(concurrency or 1, duration, requests))
+    report = generator.report(time.perf_counter() - started)
+    report['mode'] = f"rate={rate}/s" if rate else f"concurrency={concurrency or 1}"
+    report['warmup'] = warmup
+    return report
+
+
+def format_report(report):
+    def row(name, values):
+        return f"  {name:<10} " + "  ".join(f"{p}={values[p]}" for p in ('p50', 'p95', 'p99'))
+
+    return "\n".join([
+        f"{report['url']} [{report['mode']}]",
+        f"  requests   {report['requests']} ({report['errors']} errors) in {report['wallTimeSec']}s"
+        f" -> {report['rps']} req/s",
+        row('latency', report['latencyMs']),
+        row('ttft', report['ttftMs']),
+        row('overhead', report['overheadMs']),
+    ])
+
+
+def add_load_args(parser):
+    """Load shape flags shared by loadgen.py and bench_servers.py"""
+    shape = parser.add_mutually_exclusive_group()
+    shape.add_argument('--concurrency', type=int, default=10, help='closed loop: requests in flight')
+    shape.add_argument('--rate', type=float, help='open loop: Poisson arrivals per second')
+    parser.add_argument('--duration', type=float, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='total requests (default 200 if no duration)')
+    parser.add_argument('--endpoint', default='/chat', help='/chat or /chat/stream')
+    parser.add_argument('--repeat', action='store_true',
+                        help='resend the same messages (lets caches answer) instead of unique ones')
+    parser.add_argument('--session-turns', type=int, default=0,
+                        help='send a sessionId, switching to a new session every N requests')
+    parser.add_argument('--warmup', type=int, default=10, help='requests sent first and left out of the report')
+    parser.add_argument('--json', help='write the report to this file')
+
+
+def load_kwargs(args):
+    return {
+        'endpoint': args.endpoint,
+        'concurrency': None if args.rate else args.concurrency,
+        'rate': args.rate,
+        'duration': args.duration,
+        'requests': args.requests or (None if args.duration else 200),
+        'unique': not args.repeat,
+        'session_turns': args.session_turns,
+        'warmup': args.warmup,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('base_url')
+    add_load_args(parser)
+    args = parser.parse_args()
+    report = run(args.base_url, **load_kwargs(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
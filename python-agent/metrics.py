@@ -0,0 +1,320 @@
+"""
+Prometheus metrics for the agent servers
+Self-contained counters, gauges and histograms rendered in the Prometheus text
+format (0.0.4) at /metrics, so no client library is needed. Recording is a
+dict lookup plus a short lock per sample, cheap enough for every request.
+Per-request metrics go through RequestObservation, which carries the
+endpoint, model and response mode labels.
+"""
+
+from bisect import bisect_left
+import functools
+import math
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; chat turns range from cache hits (ms) to long completions (tens of seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 20)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child for one label combination (created on first use)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', 'lock', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+        self.function = None
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead"""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'goodkid_request_duration_seconds', 'Total time to answer a request, streams until the last event',
+    ['endpoint', 'model', 'mode', 'source', 'status']
+))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    'goodkid_llm_upstream_duration_seconds', 'Time from starting an upstream LLM call to its last token',
+    ['endpoint', 'model', 'mode', 'provider']
+))
+TTFT_SECONDS = REGISTRY.register(Histogram(
+    'goodkid_llm_time_to_first_token_seconds', 'Time from starting an upstream LLM call to its first token',
+    ['endpoint', 'model', 'mode', 'provider'], buckets=TTFT_BUCKETS
+))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    'goodkid_llm_prompt_tokens_total', 'Prompt tokens reported in upstream usage',
+    ['endpoint', 'model', 'mode', 'provider']
+))
+COMPLETION_TOKENS = REGISTRY.register(Counter(
+    'goodkid_llm_completion_tokens_total', 'Completion tokens reported in upstream usage',
+    ['endpoint', 'model', 'mode', 'provider']
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'goodkid_cache_lookups_total', 'Response cache lookups by result (hit, similar, miss, bypass)',
+    ['endpoint', 'model', 'mode', 'result']
+))
+ERRORS = REGISTRY.register(Counter(
+    'goodkid_errors_total', 'Failed or degraded requests by error type',
+    ['endpoint', 'model', 'mode', 'type']
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'goodkid_requests_in_flight', 'Requests currently being handled',
+    ['endpoint']
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'goodkid_queue_depth', 'Work waiting for a worker or for another request\'s upstream call',
+    ['queue']
+))
+
+
+class RequestObservation:
+    """
+    Metrics for one request: in-flight while open, latency on finish()
+
+    Handlers fill in mode / source / model as they learn them; every sample
+    recorded through the observation carries the same labels. A streaming
+    handler sets streaming = True and the request is finished when the
+    stream ends.
+    """
+
+    __slots__ = ('endpoint', 'model', 'mode', 'source', 'streaming', 'errored', 'started', 'finished')
+
+    def __init__(self, endpoint, model):
+        self.endpoint = endpoint
+        self.model = model
+        self.mode = 'none'
+        self.source = 'none'
+        self.streaming = False
+        self.errored = False
+        self.started = time.perf_counter()
+        self.finished = False
+        IN_FLIGHT.labels(endpoint).inc()
+
+    def cache(self, status):
+        CACHE_LOOKUPS.labels(self.endpoint, self.model, self.mode, status.lower()).inc()
+
+    def upstream(self, result):
+        """Latency, TTFT and token usage of a finished Completion or LLMStream"""
+        model = result.model or self.model
+        labels = (self.endpoint, model, self.mode, result.provider or 'none')
+        if result.elapsed is not None:
+            UPSTREAM_SECONDS.labels(*labels).observe(result.elapsed)
+        if result.ttft is not None:
+            TTFT_SECONDS.labels(*labels).observe(result.ttft)
+        usage = result.usage or {}
+        if usage.get('prompt_tokens'):
+            PROMPT_TOKENS.labels(*labels).inc(usage['prompt_tokens'])
+        if usage.get('completion_tokens'):
+            COMPLETION_TOKENS.labels(*labels).inc(usage['completion_tokens'])
+        self.model = model
+
+    def error(self, kind):
+        self.errored = True
+        ERRORS.labels(self.endpoint, self.model, self.mode, kind).inc()
+
+    def finish(self, status):
+        """Record total latency once (later calls are ignored); error responses count as http_<status>"""
+        if self.finished:
+            return
+        self.finished = True
+        if status >= 400 and not self.errored:
+            self.error(f"http_{status}")
+        IN_FLIGHT.labels(self.endpoint).dec()
+        REQUEST_SECONDS.labels(self.endpoint, self.model, self.mode, self.source, str(status)).observe(
+            time.perf_counter() - self.started
+        )
+
+
+def render():
+    return REGISTRY.render()
+
+
+def _tag_replay(observation, response):
+    if response.headers.get('Idempotent-Replayed'):
+        observation.source = 'replay'
+
+
+def flask_observed(endpoint, model):
+    """
+    Decorator for Flask views: a RequestObservation in flask.g.observation
+
+    Streamed responses are finished when the WSGI server closes them, so the
+    latency covers the whole stream (or ends at the client disconnect).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import g, make_response
+            observation = g.observation = RequestObservation(endpoint, model)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException as e:
+                observation.error(type(e).__name__)
+                observation.finish(500)
+                raise
+            _tag_replay(observation, response)
+            if observation.streaming:
+                response.call_on_close(lambda: observation.finish(response.status_code))
+            else:
+                observation.finish(response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+
+def quart_observed(endpoint, model):
+    """Async counterpart of flask_observed; a streaming view's body generator calls finish()"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            from quart import g, make_response
+            observation = g.observation = RequestObservation(endpoint, model)
+            try:
+                response = await make_response(await view(*args, **kwargs))
+            except BaseException as e:
+                observation.error(type(e).__name__)
+                observation.finish(500)
+                raise
+            _tag_replay(observation, response)
+            if not observation.streaming:
+                observation.finish(response.status_code)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,368 @@
+"""
+On-chain context for messages with contract addresses
+The analysis prompt asks for ownership, mint privileges, supply and the like,
+but the model has none of it: it either guesses HIGH RISK or (ADK) runs search
+sub-agents one after another. Before the LLM call, the 0x addresses in a
+message are looked up over JSON-RPC instead:
+- bytecode (contract or wallet, size, privileged functions such as mint,
+  pause or blacklist found by their selectors)
+- owner(), and ERC-20 name / symbol / decimals / totalSupply
+- the EIP-1967 implementation slot (upgradeable proxies)
+All reads for a chain go out as one JSON-RPC batch; chains are queried
+concurrently, so the lookup takes about one round trip to the slowest node.
+The answers become a compact fact block in the prompt. Results are cached per
+(chain, address) for ONCHAIN_CACHE_TTL, and the lookup is bounded by
+ONCHAIN_TIMEOUT, after which the turn goes ahead without facts.
+
+ONCHAIN_RPC_URLS="base=https://...,ethereum=https://..." enables it; without a
+chain hint in the message every configured chain is asked. Liquidity, holder
+distribution and source verification need an indexer or explorer API and are
+reported as not checked.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import weakref
+
+from evm_utils import keccak256, to_checksum_address
+from intent_router import ANALYSIS
+from response_cache import ResponseCache
+from whale_registry import whale_registry
+
+logger = logging.getLogger(__name__)
+
+ONCHAIN_RPC_URLS = os.getenv('ONCHAIN_RPC_URLS', '')
+# Seconds the whole lookup may take before the turn goes ahead without facts
+ONCHAIN_TIMEOUT = float(os.getenv('ONCHAIN_TIMEOUT', 1.5))
+ONCHAIN_CACHE_TTL = float(os.getenv('ONCHAIN_CACHE_TTL', 60))
+# Addresses looked up per message (the rest are left to the model)
+ONCHAIN_MAX_ADDRESSES = int(os.getenv('ONCHAIN_MAX_ADDRESSES', 3))
+ONCHAIN_MAX_CONNECTIONS = int(os.getenv('ONCHAIN_MAX_CONNECTIONS', 50))
+
+# Calls per JSON-RPC batch request (public nodes reject very large batches)
+RPC_BATCH_SIZE = 100
+
+TIMEOUT_ERRORS = (asyncio.TimeoutError, concurrent.futures.TimeoutError)
+
+ZERO_ADDRESS = '0x' + '0' * 40
+EIP1967_IMPLEMENTATION_SLOT = '0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc'
+
+
+def selector(signature):
+    """4-byte function selector (hex, no 0x) of a Solidity signature"""
+    return keccak256(signature.encode('ascii'))[:4].hex()
+
+
+# eth_call reads per address: field -> calldata
+READS = {
+    'name': '0x' + selector('name()'),
+    'symbol': '0x' + selector('symbol()'),
+    'decimals': '0x' + selector('decimals()'),
+    'totalSupply': '0x' + selector('totalSupply()'),
+    'owner': '0x' + selector('owner()'),
+}
+
+# Privileged functions, recognized by a PUSH4 of their selector in the bytecode
+PRIVILEGED_FUNCTIONS = {
+    selector(signature): name for signature, name in (
+        ('mint(address,uint256)', 'mint'),
+        ('mint(uint256)', 'mint'),
+        ('pause()', 'pause'),
+        ('blacklist(address)', 'blacklist'),
+        ('addBlackList(address)', 'blacklist'),
+        ('setFee(uint256)', 'setFee'),
+        ('setTaxFee(uint256)', 'setFee'),
+        ('setMaxTxAmount(uint256)', 'setMaxTx'),
+        ('upgradeTo(address)', 'upgrade'),
+    )
+}
+
+
+def parse_rpc_urls(value):
+    """{chain: url} from "chain=url,chain=url" """
+    urls = {}
+    for entry in value.split(','):
+        chain, _, url = entry.partition('=')
+        if chain.strip() and url.strip():
+            urls[chain.strip().lower()] = url.strip()
+    return urls
+
+
+def decode_uint(result):
+    if not result or result == '0x' or len(result) < 66:
+        return None
+    return int(result[2:66], 16)
+
+
+def decode_address(result):
+    value = decode_uint(result)
+    return None if value is None or value >> 160 else to_checksum_address('0x' + f"{value:040x}")
+
+
+def decode_string(result):
+    """ABI string, or a bytes32 string (older tokens such as MKR)"""
+    if not result or result == '0x':
+        return None
+    data = bytes.fromhex(result[2:])
+    try:
+        if len(data) >= 64 and int.from_bytes(data[:32], 'big') == 32:
+            length = int.from_bytes(data[32:64], 'big')
+            text = data[64:64 + length].decode('utf-8')
+        else:
+            text = data[:32].rstrip(b'\x00').decode('utf-8')
+    except (UnicodeDecodeError, OverflowError):
+        return None
+    return text.strip()[:64] or None
+
+
+def contract_facts(chain, address, replies):
+    """Facts about one address from its {field: raw result} replies"""
+    code = replies.get('code')
+    facts = {'chain': chain, 'address': address, 'contract': bool(code and code != '0x')}
+    if not facts['contract']:
+        return facts
+    facts['codeSize'] = (len(code) - 2) // 2
+    functions = {name for sel, name in PRIVILEGED_FUNCTIONS.items() if '63' + sel in code}
+    facts['functions'] = sorted(functions)
+    implementation = decode_address(replies.get('implementation'))
+    if implementation and implementation != ZERO_ADDRESS:
+        facts['implementation'] = implementation
+    for field in ('name', 'symbol'):
+        value = decode_string(replies.get(field))
+        if value:
+            facts[field] = value
+    decimals = decode_uint(replies.get('decimals'))
+    if decimals is not None and decimals <= 36:
+        facts['decimals'] = decimals
+    total_supply = decode_uint(replies.get('totalSupply'))
+    if total_supply is not None:
+        facts['totalSupply'] = str(total_supply)
+    owner = decode_address(replies.get('owner'))
+    if owner is not None:
+        facts['owner'] = owner
+    return facts
+
+
+def format_supply(raw, decimals):
+    value = int(raw) / 10 ** (decimals or 0)
+    return f"{value:,.0f}" if value >= 1 else f"{value:.6g}"
+
+
+def render_facts(facts_list):
+    """Compact fact block for the prompt (None when there is nothing to say)"""
+    contracts = [f for f in facts_list if f['contract']]
+    lines = []
+    for f in contracts:
+        parts = [f"contract, {f['codeSize']} bytes of code"]
+        if 'symbol' in f or 'name' in f:
+            parts.append(f"token {f.get('name', '?')} ({f.get('symbol', '?')})")
+        if 'totalSupply' in f:
+            parts.append(f"total supply {format_supply(f['totalSupply'], f.get('decimals'))}"
+                         + (f", {f['decimals']} decimals" if 'decimals' in f else ''))
+        if 'owner' in f:
+            parts.append('owner renounced (zero address)' if f['owner'] == ZERO_ADDRESS else f"owner {f['owner']}")
+        else:
+            parts.append('no owner() function')
+        if f.get('functions'):
+            parts.append(f"privileged functions in bytecode: {', '.join(f['functions'])}")
+        if 'implementation' in f:
+            parts.append(f"upgradeable proxy (EIP-1967) to {f['implementation']}")
+        lines.append(f"- {f['address']} on {whale_registry.chains.get(f['chain'], f['chain'])}: " + '; '.join(parts))
+    found = {f['address'] for f in contracts}
+    for address in dict.fromkeys(f['address'] for f in facts_list if f['address'] not in found):
+        chains = ', '.join(whale_registry.chains.get(f['chain'], f['chain']) for f in facts_list if f['address'] == address)
+        lines.append(f"- {address}: no contract code on {chains} (a wallet, or a contract on another chain)")
+    if not lines:
+        return None
+    return (
+        "ON-CHAIN DATA (read from the chain just now; use as facts. Liquidity, holder distribution and "
+        "source verification were not checked, treat them as unknown):\n" + '\n'.join(lines)
+    )
+
+
+class OnChainContext:
+    """Cached, concurrent JSON-RPC lookups of the addresses in a message"""
+
+    def __init__(self, rpc_urls=None, timeout=ONCHAIN_TIMEOUT, ttl=ONCHAIN_CACHE_TTL,
+                 max_addresses=ONCHAIN_MAX_ADDRESSES, shared=None):
+        self.rpc_urls = parse_rpc_urls(ONCHAIN_RPC_URLS) if rpc_urls is None else dict(rpc_urls)
+        self.timeout = timeout
+        self.max_addresses = max_addresses
+        self.cache = ResponseCache(ttl=ttl, shared=shared, namespace='onchain')
+        # httpx pools are bound to the loop that created them
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.batches = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self):
+        return bool(self.rpc_urls)
+
+    def targets(self, addresses, chains=()):
+        """(chain, checksummed address) pairs to look up: hinted chains if configured, else all"""
+        if not self.enabled or not addresses:
+            return []
+        chains = [c for c in chains if c in self.rpc_urls] or list(self.rpc_urls)
+        unique = list(dict.fromkeys(to_checksum_address(a) for a in addresses))[:self.max_addresses]
+        return [(chain, address) for address in unique for chain in chains]
+
+    def route_targets(self, route):
+        """Targets for an analysis question that names contract addresses ([] for anything else)"""
+        return self.targets(route.addresses, route.chains) if route.mode == ANALYSIS else []
+
+    def _client(self):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("On-chain lookups need httpx. Run: pip install httpx")
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=ONCHAIN_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 1.0))
+            )
+        return client
+
+    async def warm_up(self, connect=True, timeout=10):
+        """Build this loop's client and open a connection to every chain's node"""
+        self._client()
+        if connect:
+            await asyncio.wait_for(asyncio.gather(
+                *(self._batch(url, [('eth_chainId', [])]) for url in self.rpc_urls.values())
+            ), timeout)
+
+    async def _batch(self, url, calls):
+        """POST one JSON-RPC batch; {id: result} for the calls that succeeded"""
+        payload = [{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+                   for i, (method, params) in enumerate(calls)]
+        response = await self._client().post(url, json=payload)
+        response.raise_for_status()
+        replies = response.json()
+        if isinstance(replies, dict):
+            # Nodes without batch support answer with a single error object
+            raise ValueError(replies.get('error') or 'JSON-RPC batch not supported')
+        with self._lock:
+            self.batches += 1
+        return {r.get('id'): r.get('result') for r in replies if 'result' in r}
+
+    async def _lookup_chain(self, chain, addresses):
+        """Facts for every address on one chain: all reads in as few batches as possible"""
+        calls, owners = [], []
+        for address in addresses:
+            calls.append(('eth_getCode', [address, 'latest']))
+            owners.append((address, 'code'))
+            calls.append(('eth_getStorageAt', [address, EIP1967_IMPLEMENTATION_SLOT, 'latest']))
+            owners.append((address, 'implementation'))
+            for field, data in READS.items():
+                calls.append(('eth_call', [{'to': address, 'data': data}, 'latest']))
+                owners.append((address, field))
+        url = self.rpc_urls[chain]
+        chunks = [range(i, min(i + RPC_BATCH_SIZE, len(calls))) for i in range(0, len(calls), RPC_BATCH_SIZE)]
+        results = await asyncio.gather(*(self._batch(url, [calls[i] for i in chunk]) for chunk in chunks))
+        replies = {address: {} for address in addresses}
+        for chunk, result in zip(chunks, results):
+            for offset, i in enumerate(chunk):
+                if offset in result:
+                    address, field = owners[i]
+                    replies[address][field] = result[offset]
+        # An address whose bytecode could not be read is not known either way
+        return [contract_facts(chain, address, replies[address])
+                for address in addresses if 'code' in replies[address]]
+
+    async def fetch(self, targets):
+        """Facts for (chain, address) targets; chains are queried concurrently"""
+        by_chain = {}
+        for chain, address in targets:
+            by_chain.setdefault(chain, []).append(address)
+        results = await asyncio.gather(
+            *(self._lookup_chain(chain, addresses) for chain, addresses in by_chain.items()),
+            return_exceptions=True
+        )
+        facts = []
+        for chain, result in zip(by_chain, results):
+            if isinstance(result, Exception):
+                with self._lock:
+                    self.errors += 1
+                logger.warning(f"On-chain lookup on {chain} failed: {type(result).__name__}: {result}")
+                continue
+            facts.extend(result)
+        return facts
+
+    def _cached(self, targets):
+        """({target: facts} already cached, [targets to fetch])"""
+        found, missing = {}, []
+        for chain, address in targets:
+            facts = self.cache.get(f"{chain}:{address}")
+            if facts is None:
+                missing.append((chain, address))
+            else:
+                found[(chain, address)] = facts
+        return found, missing
+
+    def _store(self, found, fetched):
+        for facts in fetched:
+            self.cache.set(f"{facts['chain']}:{facts['address']}", facts)
+            found[(facts['chain'], facts['address'])] = facts
+        return found
+
+    def _failed(self, missing, e):
+        with self._lock:
+            if isinstance(e, TIMEOUT_ERRORS):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+        if isinstance(e, TIMEOUT_ERRORS):
+            logger.warning(f"On-chain lookup of {len(missing)} targets took over {self.timeout}s, going ahead without")
+        else:
+            logger.warning(f"On-chain lookup failed, going ahead without: {type(e).__name__}: {e}")
+
+    def lookup(self, targets, run):
+        """
+        Facts for targets, in target order, from a sync thread
+
+        run(coro, timeout) drives the fetch (background_loop.run). Never raises:
+        targets that could not be read in time are left out.
+        """
+        with self._lock:
+            self.lookups += 1
+        found, missing = self._cached(targets)
+        if missing:
+            try:
+                fetched = run(asyncio.wait_for(self.fetch(missing), self.timeout), self.timeout + 1)
+            except Exception as e:
+                self._failed(missing, e)
+                fetched = []
+            self._store(found, fetched)
+        return [found[target] for target in targets if target in found]
+
+    async def lookup_async(self, targets):
+        """lookup() for code already on an event loop"""
+        with self._lock:
+            self.lookups += 1
+        found, missing = self._cached(targets)
+        if missing:
+            try:
+                fetched = await asyncio.wait_for(self.fetch(missing), self.timeout)
+            except Exception as e:
+                self._failed(missing, e)
+                fetched = []
+            self._store(found, fetched)
+        return [found[target] for target in targets if target in found]
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'chains': list(self.rpc_urls),
+            'lookups': self.lookups,
+            'batches': self.batches,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cache': self.cache.stats(),
+        }
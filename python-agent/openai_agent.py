@@ -3,11 +3,53 @@ Simple AI Agent Server using OpenAI GPT-4
 Much simpler and more reliable than Google ADK
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hmac
 import os
+import json
 import logging
 
+from response_cache import ResponseCache, make_cache_key, is_bypass_requested
+from semantic_cache import SemanticCache
+from intent_router import classify, prompt_route, ANALYSIS, CLARIFICATION, INFORMATION, WHALE_LIST
+from whale_registry import whale_registry
+from prompt_sections import build_system_prompt
+from tokenizer import TOKENS_PER_MESSAGE, TOKENS_PER_REPLY
+from history_window import select_history, token_counts
+from session_store import (
+    SessionStore,
+    SharedSessionStore,
+    build_summary_messages,
+    fallback_summary,
+    is_valid_session_id,
+)
+from single_flight import IdempotencyStore, SingleFlight, flask_idempotent
+from llm_providers import ChatRequest, ProviderRouter
+from resilience import UpstreamUnavailable, request_deadline
+from demo_responses import DEMO_RESPONSES, get_demo_response
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, QUEUE_DEPTH, flask_observed, render as render_metrics
+from tracing import exporter as trace_exporter, flask_traced
+from admission import AdmissionController, RateLimiter, flask_admitted
+from analysis import (
+    ANALYZE_CACHE_MAX_ENTRIES,
+    ANALYZE_CACHE_TTL,
+    InvalidAnalysis,
+    analysis_key,
+    analysis_prompt,
+    analysis_result,
+    build_analysis_messages,
+    parse_analysis,
+    parse_target,
+)
+from onchain import OnChainContext, render_facts
+from batch import NDJSON_MIMETYPE, BatchWriter, batch_cost, fan_out, group_duplicates, parse_batch
+from shared_state import shared_state
+from warmup import WarmUp, local_stages, onchain_stages, provider_stages
+import background_loop
+
 app = Flask(__name__)
 CORS(app)
 
@@ -32,250 +74,64 @@ def get_openai_client():
             raise ImportError("OpenAI package not installed. Run: pip install openai")
     return openai_client
 
-# System prompt - Kid's personality and instructions
-SYSTEM_PROMPT = """Your name is Kid. You are an AI Customer Support and Risk Analysis Agent for a crypto wallet and DeFi tracking application.
-
-ABOUT THE APPLICATION:
-The application you serve is called Middlekid. Middlekid is a crypto wallet and DeFi tracking application designed to help users monitor their wallets, track DeFi positions, analyze tokens, and understand on-chain risk across multiple blockchain networks. The app provides visibility into portfolio activity, DeFi exposure, token safety indicators, and potential security or economic risks.
-
-As the AI customer support agent for Middlekid, your role is to help users understand how the application works, explain on-chain data and risk analysis results, and assist users in interpreting information related to wallets, tokens, DeFi protocols, and airdrops in a clear, neutral, and safety-focused manner.
-
-CORE RESPONSIBILITY:
-Your job is to analyze cryptocurrencies, DeFi protocols, tokens, and airdrops strictly based on factual on-chain and off-chain data, then clearly explain the associated risk levels to users. You are NOT a financial advisor and must NEVER provide buy, sell, or investment instructions.
-
-LANGUAGE RULE:
-Always respond in Indonesian, unless the user explicitly uses another language.
-
-IMPORTANT RESPONSE LOGIC (CRITICAL):
-Before answering, you MUST determine the response mode.
-
-There are THREE response modes:
-
-1. CLARIFICATION MODE  
-Use this mode when:
-- The user provides insufficient data (no link, no contract, no clear identifier)
-- The user only briefly mentions a token, airdrop, or project
-- More information is required before analysis
-
-Rules for Clarification Mode:
-- Ask short and direct questions in natural language
-- DO NOT use the analysis template
-- DO NOT assign scores or risk levels
-- DO NOT assume conclusions
-- Maximum 1–3 short sentences
-
-2. INFORMATION MODE  
-Use this mode when:
-- The user asks about Middlekid features or how the app works
-- The user asks general questions that do NOT require risk analysis
-
-Rules for Information Mode:
-- Answer naturally like a customer support agent
-- DO NOT use the analysis template
-- DO NOT include risk scoring unless explicitly asked
-
-3. ANALYSIS MODE  
-Use this mode ONLY when:
-- The user explicitly asks about risk, safety, legitimacy, or scam
-- OR sufficient data has already been provided to perform analysis
-
-Only in this mode are you allowed to assign risk levels or scores.
-
-GENERAL RULES:
-- Always prioritize user safety over hype or speculation.
-- If data is missing, incomplete, or unclear DURING ANALYSIS MODE, assume HIGH RISK.
-- Never use words such as "guaranteed", "sure profit", "must buy", "100% safe", or similar claims.
-- Clearly separate factual data from analytical interpretation.
-- Be highly skeptical of small, new, or trending projects.
-- If something appears suspicious or risky, state it clearly and directly.
-
-WORKFLOW (MANDATORY IN ANALYSIS MODE ONLY):
-1. Classify the project:
-   - Large or established coin / Layer-1
-   - Established DeFi protocol
-   - Small-cap or new token
-   - Meme token
-   - Airdrop
-
-2. Collect and analyze relevant data based on the category.
-
-DATA COLLECTION REQUIREMENTS:
-
-For large coins or established DeFi protocols:
-- Market capitalization
-- Total Value Locked (TVL), if applicable
-- Trading volume and liquidity
-- Project age and historical development
-- Number of validators or nodes (if applicable)
-- Developer activity and ecosystem growth
-- Audit history and past security incidents
-- Real-world usage or ecosystem adoption
-- Level of decentralization
-
-For small-cap or new tokens:
-- Smart contract verification status
-- Ownership status (renounced or not)
-- Minting, blacklist, or privileged functions
-- Token supply, distribution, and allocation
-- Liquidity size and whether liquidity is locked
-- Holder concentration and wallet relationship patterns
-- Indicators of real versus artificial volume
-- Team transparency and online presence
-
-For airdrops:
-- Whether the core project actually exists and has functionality
-- Whether interaction requires dangerous or excessive approvals
-- Never trust any request for private keys or seed phrases
-- Smart contract behavior must be minimal and readable
-- Website, domain age, and legitimacy checks
-
-SCORING AND RISK ASSESSMENT (ANALYSIS MODE ONLY):
-
-For large or established projects, assign a score from 0 to 100 based on:
-- Fundamentals and real use case (30%)
-- Security posture and audit history (25%)
-- Ecosystem strength, developers, and community (20%)
-- On-chain metrics such as TVL and activity (15%)
-- Regulatory and technical risks (10%)
-
-Risk classification:
-- 80–100: Low Risk
-- 60–79: Medium Risk
-- Below 60: High Risk
-
-ANTI-SCAM MODE (Small or New Tokens):
-Immediately classify the project as HIGH RISK if any of the following are detected:
-- Liquidity is not locked or can be removed
-- Owner can mint unlimited tokens
-- Honeypot behavior (users cannot sell)
-- Smart contract is not verified
-- Ownership is not renounced
-- Token supply or tokenomics are unclear or misleading
-
-Classify small projects as:
-- Likely Legit (still high risk)
-- Speculative / High Risk
-- Likely Scam
-
-AIRDROP RISK CLASSIFICATION:
-Always assume risk until proven otherwise.
-Classify airdrops as:
-- Low-risk interaction
-- Experimental
-- High-risk / Avoid
-
-RESPONSE FORMAT (USE ONLY IN ANALYSIS MODE):
-Use the following structure ONLY when performing full analysis:
-
-Summary:
-(1–2 sentences, neutral and factual)
-
-Key Data:
-- Bullet points of objective findings
-
-Risk Analysis:
-- Security risks
-- Technical risks
-- Market or ecosystem risks
-
-Score & Risk Level:
-- Score: X / 100 (if applicable)
-- Risk Level: Low / Medium / High
-
-Important Note:
-- This is not financial advice.
-- All crypto-related activities carry risk.
-
-WHALE WALLET RECOMMENDATIONS:
-When users ask for whale wallet recommendations or want to track successful traders, provide these VERIFIED active whale addresses.
-
-FORMATTING RULES FOR WALLET ADDRESSES:
-- Always put each address on a new line
-- Use clear numbering (1., 2., 3.)
-- Add blank line between different blockchains
-- Keep descriptions short and on same line as address
-- Use this exact format:
-
-Example format:
-**Base Chain:**
-1. Address: 0xabc...
-   Type: Binance Hot Wallet
-   
-2. Address: 0xdef...
-   Type: Large holder
-
-Available whale addresses by blockchain:
-
-**Base Chain:**
-1. 0x0c54fccd2e384b4bb6f2e405bf5cbc15a017aafb
-   Binance Hot Wallet - Very active in DeFi
-   
-2. 0x28c6c06298d514db089934071355e5743bf21d60
-   Binance 14 - Large holder
-   
-3. 0x46340b20830761efd32832a74d7169b29feb9758
-   Known Base whale - Active trader
-
-**Ethereum Mainnet:**
-1. 0x00000000219ab540356cbb839cbe05303d7705fa
-   Eth2 Deposit Contract - Institutional
-   
-2. 0xc882b111a75c0c657fc507c04fbfcd2cc984f071
-   Alameda Research wallet - Historical data
-   
-3. 0x8315177ab297ba92a06054ce80a67ed4dbd7ed3a
-   Arbitrage bot - Active
-   
-4. 0xf977814e90da44bfa03b6295a0616a897441acec
-   Binance - High activity
-
-**Arbitrum:**
-1. 0xb38e8c17e38363af6ebdcb3dae12e0243582891d
-   Binance Arbitrum Bridge
-   
-2. 0x489ee077994b6658eafa855c308275ead8097c4a
-   GMX whale
-
-**Optimism:**
-1. 0x99c9fc46f92e8a1c0dec1b1747d010903e884be1
-   Optimism Bridge
-   
-2. 0x4200000000000000000000000000000000000010
-   L2 Standard Bridge
-
-**Polygon:**
-1. 0x7d1afa7b718fb893db30a3abc0cfc608aacfebb0
-   Polygon Bridge
-   
-2. 0xba12222222228d8ba445958a75a0704d566bf2c8
-   Balancer Vault
-
-**BSC:**
-1. 0x8894e0a0c962cb723c1976a4421c95949be2d4e3
-   Binance Hot 6
-   
-2. 0xf977814e90da44bfa03b6295a0616a897441acec
-   Binance 8
-
-**Avalanche:**
-1. 0x9f8c163cba728e99993abe7495f06c0a3c8ac8b9
-   Trader Joe Treasury
-   
-2. 0x2fbab5d3f57b8e68e7377b3f5eb5d03b091249c6
-   AVAX Whale
-
-When recommending wallets:
-1. Always mention which blockchain the address is on
-2. Explain what type of whale it is (exchange, DeFi protocol, trader, etc.)
-3. Warn that tracking institutional wallets may show different patterns than individual traders
-4. Suggest users can copy any address and paste into Middlekid to track it
-5. Remind them: "Tracking whale wallets untuk edukasi, bukan copy trading. Past performance ≠ future results."
-
-FINAL BEHAVIOR RULES:
-- Never encourage FOMO or urgency.
-- Never downplay risks.
-- Never act promotional or persuasive.
-- Always prioritize user protection and clarity."""
+# Completion settings shared by /chat and /chat/stream
+MODEL = "gpt-4o-mini"  # Fast and cheap version
+TEMPERATURE = 0.7
+MAX_TOKENS = 1000
+
+# Upstream model(s): LLM_PROVIDERS="openai,adk" adds the ADK agent as failover/hedge target
+llm = ProviderRouter.from_env('openai', openai={
+    'model': MODEL, 'temperature': TEMPERATURE, 'max_tokens': MAX_TOKENS
+})
+
+# Cache of completed answers for identical turns
+response_cache = ResponseCache(shared=shared_state)
+
+# Second tier: near-duplicate first-turn questions ("whale wallet base?" ~ "Whale wallets on Base")
+semantic_cache = SemanticCache(shared=shared_state)
+
+# Structured /analyze results by (chain, checksummed address | project, language, prompt version)
+analysis_cache = ResponseCache(max_entries=ANALYZE_CACHE_MAX_ENTRIES, ttl=ANALYZE_CACHE_TTL,
+                               shared=shared_state, namespace='analysis')
+analysis_flights = SingleFlight()
+
+# Contract facts read over JSON-RPC before analysis turns (ONCHAIN_RPC_URLS)
+onchain = OnChainContext(shared=shared_state)
+
+# Required in X-Admin-Key to invalidate cached analyses (unset = invalidation disabled)
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
+
+# Server-side conversations for clients that send a sessionId (in the shared store with several workers)
+session_store = SharedSessionStore(shared_state) if shared_state is not None else SessionStore()
+summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='session-summary')
+SUMMARY_MAX_TOKENS = 300
+
+# Identical turns already in flight share one upstream call (retry storms from the proxy)
+chat_flights = SingleFlight()
+
+# Completed /chat responses by Idempotency-Key, replayed to retries
+idempotency_store = IdempotencyStore(shared=shared_state)
+idempotency_flights = SingleFlight()
+
+# Per-client rate limits and a cap on concurrent chat requests
+admission = AdmissionController(rate_limiter=RateLimiter(shared=shared_state))
+
+QUEUE_DEPTH.labels('admission').set_function(lambda: admission.limiter.waiting)
+QUEUE_DEPTH.labels('session_summary').set_function(lambda: summary_executor._work_queue.qsize())
+QUEUE_DEPTH.labels('coalesced').set_function(lambda: chat_flights.waiting)
+
+# Tokenizer, prompts and the OpenAI clients, built before /ready reports ready
+warm_up = WarmUp()
+
+def warm_up_stages():
+    stages = local_stages() + [('analysis_prompt', analysis_prompt)]
+    if os.getenv('OPENAI_API_KEY'):
+        stages.append(('summary_client', get_openai_client))
+    return stages + provider_stages(llm, run=background_loop.run) + onchain_stages(onchain, run=background_loop.run)
+
+def start_warm_up():
+    """Warm up on a background thread (once per process; gunicorn.conf.py calls it in each worker)"""
+    warm_up.start(warm_up_stages())
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -283,127 +139,822 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'GoodKid Agent (OpenAI)',
-        'version': '2.0.0'
+        'version': '2.0.0',
+        'cache': response_cache.stats(),
+        'semanticCache': semantic_cache.stats(),
+        'analysisCache': analysis_cache.stats(),
+        'analysisFlights': analysis_flights.stats(),
+        'onchain': onchain.stats(),
+        'sessions': session_store.stats(),
+        'singleFlight': chat_flights.stats(),
+        'idempotency': idempotency_store.stats(),
+        'llm': llm.stats(),
+        'admission': admission.stats(),
+        'tracing': trace_exporter.stats(),
+        'sharedState': shared_state.stats() if shared_state is not None else None
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until warm-up has finished (starts it under other WSGI servers)"""
+    start_warm_up()
+    return jsonify(warm_up.status()), 200 if warm_up.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+# Everything derived for one LLM-bound turn before calling upstream
+ChatTurn = namedtuple('ChatTurn', ['route', 'prompt', 'history', 'messages', 'prompt_tokens', 'cache_key'])
+
+def build_messages(user_message, history_messages, system_prompt, summary=None, facts=None):
+    """Build the OpenAI messages array for a chat turn"""
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    # Running summary of older turns (server-side sessions)
+    if summary:
+        messages.append({"role": "system", "content": f"Conversation summary so far:\n{summary}"})
+    
+    # On-chain facts about the contracts in the message
+    if facts:
+        messages.append({"role": "system", "content": facts})
+    
+    # Conversation history, already trimmed to the token budget
+    messages.extend(history_messages)
+    
+    # Add current user message
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+def earlier_user_text(history_messages, summary=None):
+    """Session summary and user messages of the history, for intent_router.prompt_route"""
+    earlier = [summary] if summary else []
+    return earlier + [m['content'] for m in history_messages if m['role'] == 'user' and m['content']]
+
+def prepare_turn(user_message, conversation_history, route, summary=None, facts=None):
+    """Assemble the mode-aware system prompt and token-budgeted messages for an LLM-bound turn"""
+    history = select_history(conversation_history)
+    prompt = build_system_prompt(*prompt_route(route, earlier_user_text(history.messages, summary)))
+    messages = build_messages(user_message, history.messages, prompt.text, summary, facts)
+    cache_key = make_cache_key(MODEL, TEMPERATURE, prompt.version, messages[1:])
+    prompt_tokens = (
+        prompt.tokens + history.tokens + token_counts.count(user_message)
+        + 2 * TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+    )
+    if summary:
+        prompt_tokens += token_counts.count(summary) + TOKENS_PER_MESSAGE
+    if facts:
+        prompt_tokens += token_counts.count(facts) + TOKENS_PER_MESSAGE
+    return ChatTurn(route, prompt, history, messages, prompt_tokens, cache_key)
+
+def onchain_facts(route, trace=None):
+    """On-chain fact block for the contract addresses in an analysis question (None if there are none)"""
+    targets = onchain.route_targets(route)
+    if not targets:
+        return None
+    if trace is not None:
+        trace.stage('onchain', targets=len(targets))
+    return render_facts(onchain.lookup(targets, background_loop.run))
+
+def history_report(turn):
+    """What the token budget kept, dropped and truncated from the client's history"""
+    return {
+        'kept': turn.history.kept,
+        'dropped': turn.history.dropped,
+        'truncated': turn.history.truncated,
+        'tokens': turn.history.tokens
+    }
+
+def turn_headers(turn, cache_status):
+    """Response headers describing how a turn was served"""
+    return {
+        'X-Cache': cache_status,
+        'X-Intent': turn.route.mode,
+        'X-Prompt-Sections': ','.join(turn.prompt.sections),
+        'X-Prompt-Tokens': str(turn.prompt_tokens),
+        'X-History-Dropped': str(turn.history.dropped),
+        'X-History-Truncated': str(turn.history.truncated)
+    }
+
+def resolve_conversation(data):
+    """
+    Return (session, conversation_history, summary, error) for a chat request body
+    
+    With a sessionId the server-side session is authoritative and any
+    conversationHistory in the body is ignored.
+    """
+    session_id = data.get('sessionId')
+    if session_id is None:
+        return None, data.get('conversationHistory', []), None, None
+    if not is_valid_session_id(session_id):
+        return None, None, None, {'error': 'sessionId must be 1-128 characters of [A-Za-z0-9_-:.]'}
+    session = session_store.get_or_create(session_id)
+    summary, turns = session_store.snapshot(session)
+    return session, turns, summary, None
+
+def with_session(body, session):
+    """Echo the sessionId back to session-mode clients"""
+    if session is not None:
+        body['sessionId'] = session.id
+    return body
+
+def summarize_fold(fold):
+    """Fold older turns into the running summary (previous summary + new turns only)"""
+    try:
+        client = get_openai_client()
+    except ValueError:
+        return fallback_summary(fold)
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=build_summary_messages(fold),
+        temperature=0.2,
+        max_tokens=SUMMARY_MAX_TOKENS
+    )
+    return response.choices[0].message.content.strip()
+
+def run_summary_fold(session, fold):
+    try:
+        summary = summarize_fold(fold)
+    except Exception as e:
+        logger.warning(f"Session summary failed, using extractive fallback: {e}")
+        summary = fallback_summary(fold)
+    session_store.complete_fold(session, fold, summary)
+    logger.info(f"Session {session.id}: folded {len(fold.turns)} messages into summary")
+
+def record_session_turn(session, user_message, assistant_message):
+    """Append a finished turn to its session and fold old turns in the background"""
+    if session is None:
+        return
+    session_store.append_turn(session, user_message, assistant_message)
+    fold = session_store.begin_fold(session)
+    if fold is not None:
+        summary_executor.submit(run_summary_fold, session, fold)
+
+def parse_whale_filters(chain_arg):
+    """Return (chain ids, error body) for a ?chain= query value"""
+    if not chain_arg:
+        return None, None
+    chains = [c.strip().lower() for c in chain_arg.split(',') if c.strip()]
+    unknown = [c for c in chains if c not in whale_registry.chains]
+    if unknown:
+        return None, {
+            'error': f"Unknown chain: {', '.join(unknown)}",
+            'supportedChains': list(whale_registry.chains)
+        }
+    return chains, None
+
+def semantic_namespace(turn):
+    """Near-duplicate matches are only valid for the same model and prompt"""
+    return f"{MODEL}:{TEMPERATURE}:{turn.prompt.version}"
+
+def is_first_turn(turn):
+    """Only system prompt + user message: no history that could change the answer"""
+    return len(turn.messages) == 2
+
+def lookup_cached_response(turn, headers):
+    """
+    Return (cached_value, cache_status) for a prepared turn
+    
+    Exact matches come from response_cache; first-turn questions then fall back
+    to the near-duplicate index (status SIMILAR).
+    """
+    if is_bypass_requested(headers):
+        response_cache.record_bypass()
+        return None, 'BYPASS'
+    cached = response_cache.get(turn.cache_key)
+    if cached is not None:
+        return cached, 'HIT'
+    if is_first_turn(turn):
+        cached, similarity = semantic_cache.get(semantic_namespace(turn), turn.messages[-1]['content'],
+                                                 turn.route.subjects)
+        if cached is not None:
+            logger.info(f"Near-duplicate cache hit (similarity={similarity:.2f})")
+            return cached, 'SIMILAR'
+    return None, 'MISS'
+
+def store_cached_response(turn, result):
+    """Store a fresh answer in both cache tiers"""
+    response_cache.set(turn.cache_key, result)
+    if is_first_turn(turn):
+        semantic_cache.set(semantic_namespace(turn), turn.messages[-1]['content'], result, turn.route.subjects)
+
+def llm_request(turn, user_message, session):
+    """Provider request for a turn; agent-style providers keep history per sessionId"""
+    return ChatRequest(
+        messages=turn.messages,
+        user_message=user_message,
+        user_id='middlekid',
+        # Without a server-side session the client resends history, so the agent gets a one-off session
+        session_id=session.id if session is not None else None
+    )
+
+def provider_headers(headers, provider, hedged):
+    headers['X-LLM-Provider'] = provider
+    if hedged:
+        headers['X-Hedged'] = 'true'
+    return headers
+
+def degraded_response(user_message, error, session, observation):
+    """
+    (body, headers) answering from the demo responses when the LLM timed out or its circuit is open
+
+    Not cached, stored for idempotent replay, or added to the session.
+    """
+    logger.warning(f"Serving degraded answer ({error.reason}): {error}")
+    observation.source = 'degraded'
+    observation.error(error.reason)
+    body = with_session({'response': get_demo_response(user_message, degraded=True), 'degraded': error.reason}, session)
+    return body, {'X-Degraded': error.reason, 'Cache-Control': 'no-store'}
+
+def complete_turn(turn, llm_req, deadline, observation):
+    """Run the upstream completion for a turn within its deadline and cache its answer"""
+    # The router enforces the deadline; the extra second only guards against a wedged loop
+    completion = background_loop.run(llm.complete(llm_req, deadline), timeout=deadline.remaining() + 1)
+    observation.upstream(completion)
+    result = {'response': completion.text}
+    store_cached_response(turn, result)
+    return result, completion
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/whales', methods=['GET'])
+def list_whales():
+    """
+    Whale wallet registry
+    
+    Query: ?chain=base&type=exchange (both optional, chain may be comma-separated)
+    Response: {"chains": {...}, "types": [...], "whales": [{chain, address, label, description, type}]}
+    """
+    chains, error = parse_whale_filters(request.args.get('chain'))
+    if error:
+        return jsonify(error), 400
+    whales = whale_registry.find(chains, request.args.get('type'))
+    return jsonify({
+        'chains': whale_registry.chains,
+        'types': whale_registry.types,
+        'whales': [w._asdict() for w in whales]
     })
 
 @app.route('/chat', methods=['POST'])
+@flask_observed('/chat', MODEL)
+@flask_traced
+@flask_admitted(admission)
+@flask_idempotent(idempotency_store, idempotency_flights)
 def chat():
     """
     Chat endpoint using OpenAI GPT-4
     
     Request: {"message": "user message", "conversationHistory": [...]}
+         or: {"message": "user message", "sessionId": "client-generated id"}
+    Optional headers: Idempotency-Key (retries replay the first response),
+                      X-Request-Timeout-Ms (deadline for the upstream call)
     Response: {"response": "agent response"}
+          or: {"response": "fallback answer", "degraded": "deadline" | "circuit-open"}
+          or: 429 / 503 {"error": "...", "retryAfter": seconds} with Retry-After (admission control)
+    Stage timings are returned in the Server-Timing header.
     """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    trace = g.trace
     try:
+        trace.stage('parse')
         data = request.get_json()
         
         if not data or 'message' not in data:
             return jsonify({'error': 'Message is required'}), 400
         
         user_message = data['message']
-        conversation_history = data.get('conversationHistory', [])
+        session, conversation_history, summary, error = resolve_conversation(data)
+        if error:
+            return jsonify(error), 400
         
         logger.info(f"Received message: {user_message[:100]}...")
         
-        # Get OpenAI client
-        try:
-            client = get_openai_client()
-        except ValueError as e:
-            # OpenAI key not set - use demo mode
-            logger.warning("OpenAI key not set, using demo mode")
-            return jsonify({
-                'response': get_demo_response(user_message)
-            })
+        trace.stage('route')
+        route = classify(user_message)
+        observation.mode = route.mode
+        routed = get_routed_response(route, conversation_history)
+        if routed is not None:
+            logger.info(f"Answered locally by intent router ({route.mode}/{route.topic})")
+            observation.source = 'template'
+            record_session_turn(session, user_message, routed)
+            return jsonify(with_session({'response': routed}, session)), 200, {
+                'X-Intent': route.mode,
+                'X-Intent-Route': 'template'
+            }
         
-        # Build messages array for OpenAI
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if not llm.available():
+            # No provider configured (OpenAI key not set) - use demo mode
+            logger.warning("No LLM provider configured, using demo mode")
+            observation.source = 'demo'
+            demo = get_demo_response(user_message)
+            record_session_turn(session, user_message, demo)
+            return jsonify(with_session({'response': demo}, session))
         
-        # Add conversation history (last 10 messages to avoid token limits)
-        for msg in conversation_history[-10:]:
-            if msg.get('role') in ['user', 'assistant']:
-                messages.append({
-                    "role": msg['role'],
-                    "content": msg.get('content', '')
-                })
+        facts = onchain_facts(route, trace)
+        trace.stage('prompt')
+        turn = prepare_turn(user_message, conversation_history, route, summary, facts)
         
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
+        trace.stage('cache')
+        cached, cache_status = lookup_cached_response(turn, request.headers)
+        observation.cache(cache_status)
+        if cached is not None:
+            logger.info("Serving cached response")
+            observation.source = 'cache'
+            record_session_turn(session, user_message, cached['response'])
+            body = with_session({**cached, 'history': history_report(turn)}, session)
+            return jsonify(body), 200, turn_headers(turn, cache_status)
         
-        # Call OpenAI API
-        logger.info("Calling OpenAI API...")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Fast and cheap version
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
+        # Call the LLM (identical turns already in flight share the call)
+        logger.info("Calling LLM provider...")
+        llm_req = llm_request(turn, user_message, session)
+        upstream = trace.stage('upstream')
+        (result, completion), shared = chat_flights.do(
+            turn.cache_key, lambda: complete_turn(turn, llm_req, deadline, observation)
         )
+        observation.source = 'coalesced' if shared else 'llm'
+        observation.model = completion.model
+        trace.upstream(upstream, completion, shared)
+        trace.stage('respond')
+        
+        assistant_message = result['response']
+        logger.info(f"{completion.provider} response{' (coalesced)' if shared else ''}: {assistant_message[:100]}...")
+        record_session_turn(session, user_message, assistant_message)
         
-        assistant_message = response.choices[0].message.content
-        logger.info(f"OpenAI response: {assistant_message[:100]}...")
+        headers = provider_headers(turn_headers(turn, cache_status), completion.provider, completion.hedged)
+        if shared:
+            headers['X-Coalesced'] = 'true'
+        body = with_session({**result, 'history': history_report(turn)}, session)
+        return jsonify(body), 200, headers
         
-        return jsonify({'response': assistant_message})
+    except UpstreamUnavailable as e:
+        body, headers = degraded_response(user_message, e, session, observation)
+        return jsonify(body), 200, headers
         
     except Exception as e:
         logger.error(f"Chat error: {str(e)}", exc_info=True)
+        observation.error(type(e).__name__)
+        trace.error = type(e).__name__
         return jsonify({
             'error': 'Failed to get AI response',
             'details': str(e)
         }), 500
 
-def get_demo_response(message):
-    """Fallback demo responses if OpenAI key not configured"""
-    msg_lower = message.lower()
+@app.route('/chat/stream', methods=['POST'])
+@flask_observed('/chat/stream', MODEL)
+@flask_traced
+@flask_admitted(admission)
+def chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events)
     
-    if any(word in msg_lower for word in ['help', 'cara', 'bagaimana', 'fitur']):
-        return """Middlekid adalah aplikasi portfolio tracker untuk Base chain yang membantu Anda:
-
-💰 **Track Token Holdings** - Lihat semua token Anda di 17+ blockchain
-🖼️ **View NFT Collections** - Galeri NFT Anda
-📊 **Monitor DeFi Positions** - Posisi staking, LP, lending
-⚡ **Real-time Analytics** - Data portfolio real-time
-
-Masukkan wallet address di search bar untuk memulai!"""
+    Request: same body as /chat
+    Response: text/event-stream of
+        data: {"delta": "..."}                                   (one per token chunk)
+        event: done
+        data: {"finishReason": "stop", "usage": {...}}           (final event)
+        event: error
+        data: {"error": "...", "details": "..."}                 (on failure)
+    If the deadline (X-Request-Timeout-Ms) passes or every provider's circuit is
+    open, the fallback answer is sent as the delta and done carries "degraded".
+    Stage timings (ms) are sent in done as "timing".
+    """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    trace = g.trace
+    trace.stage('parse')
+    data = request.get_json(silent=True)
     
-    elif any(word in msg_lower for word in ['defi', 'staking', 'lp', 'liquidity']):
-        return """DeFi Positions menampilkan posisi DeFi Anda seperti:
-
-• **Staking positions** - Token yang di-stake
-• **Liquidity pool positions** - LP token Anda
-• **Lending/borrowing** - Posisi di Aave, Compound, dll
-
-Anda bisa melihatnya di tab "DeFi" setelah memasukkan wallet address.
-
-App ini otomatis mendeteksi DeFi positions di Stargate, Beethoven X, dan protokol lainnya."""
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    user_message = data['message']
+    session, conversation_history, summary, error = resolve_conversation(data)
+    if error:
+        return jsonify(error), 400
+    
+    logger.info(f"Received stream message: {user_message[:100]}...")
     
-    elif any(word in msg_lower for word in ['token', 'analisis', 'kontrak', 'scam', 'aman']):
-        return """Untuk analisis token lengkap, saya perlu OpenAI API key.
-
-Dalam mode lengkap, saya bisa:
-• Cek keamanan smart contract
-• Analisis risiko token (score 0-100)
-• Deteksi honeypot dan scam
-• Review tokenomics
-• Verifikasi team & project
-
-**Setup OpenAI API:**
-1. Dapatkan key di https://platform.openai.com
-2. Set environment variable: `OPENAI_API_KEY=sk-...`
-3. Restart server
-
-Cost: ~$0.01 per conversation"""
+    headers = dict(request.headers)
+    trace.stage('route')
+    route = classify(user_message)
+    observation.mode = route.mode
+    observation.streaming = True
     
-    else:
-        return """Halo! Saya Kid, asisten AI untuk Middlekid. 👋
+    def generate():
+        try:
+            routed = get_routed_response(route, conversation_history)
+            if routed is not None:
+                logger.info(f"Answered locally by intent router ({route.mode}/{route.topic})")
+                observation.source = 'template'
+                record_session_turn(session, user_message, routed)
+                yield sse_event({'delta': routed})
+                yield sse_event(with_session({
+                    'finishReason': 'stop', 'usage': None, 'mode': route.mode, 'timing': trace.timings()
+                }, session), event='done')
+                return
+            
+            if not llm.available():
+                # No provider configured (OpenAI key not set) - stream the demo answer as a single delta
+                logger.warning("No LLM provider configured, using demo mode")
+                observation.source = 'demo'
+                demo = get_demo_response(user_message)
+                record_session_turn(session, user_message, demo)
+                yield sse_event({'delta': demo})
+                yield sse_event(with_session({'finishReason': 'stop', 'usage': None, 'timing': trace.timings()}, session), event='done')
+                return
+            
+            facts = onchain_facts(route, trace)
+            trace.stage('prompt')
+            turn = prepare_turn(user_message, conversation_history, route, summary, facts)
+            
+            trace.stage('cache')
+            cached, cache_status = lookup_cached_response(turn, headers)
+            observation.cache(cache_status)
+            if cached is not None:
+                logger.info("Serving cached response (stream)")
+                observation.source = 'cache'
+                record_session_turn(session, user_message, cached['response'])
+                yield sse_event({'delta': cached['response']})
+                yield sse_event(with_session({
+                    'finishReason': 'stop',
+                    'usage': None,
+                    'cached': True,
+                    'mode': route.mode,
+                    'promptTokens': turn.prompt_tokens,
+                    'history': history_report(turn),
+                    'timing': trace.timings()
+                }, session), event='done')
+                return
+            
+            logger.info("Calling LLM provider (stream)...")
+            observation.source = 'llm'
+            stream = llm.open(llm_request(turn, user_message, session), deadline)
+            upstream = trace.stage('upstream')
+            
+            parts = []
+            try:
+                # Client disconnects close this generator, which closes the upstream stream
+                for delta in background_loop.iterate(stream):
+                    parts.append(delta)
+                    yield sse_event({'delta': delta})
+            except UpstreamUnavailable as e:
+                body, _ = degraded_response(user_message, e, session, observation)
+                done = {'finishReason': 'stop', 'usage': None, 'degraded': e.reason, 'mode': route.mode}
+                if parts:
+                    # Cut off mid-answer: end what was sent rather than appending the fallback
+                    done.update(finishReason=e.reason, provider=stream.provider)
+                else:
+                    yield sse_event({'delta': body['response']})
+                yield sse_event(with_session({**done, 'timing': trace.timings()}, session), event='done')
+                return
+            
+            finish_reason = stream.finish_reason
+            logger.info(f"{stream.provider} stream finished: {finish_reason}")
+            observation.upstream(stream)
+            trace.upstream(upstream, stream)
+            trace.stage('respond')
+            if finish_reason:
+                answer = ''.join(parts)
+                store_cached_response(turn, {'response': answer})
+                record_session_turn(session, user_message, answer)
+            yield sse_event(with_session({
+                'finishReason': finish_reason,
+                'usage': stream.usage,
+                'provider': stream.provider,
+                'hedged': stream.hedged,
+                'mode': route.mode,
+                'promptTokens': turn.prompt_tokens,
+                'history': history_report(turn),
+                'timing': trace.timings()
+            }, session), event='done')
+        
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
+            trace.error = type(e).__name__
+            yield sse_event({
+                'error': 'Failed to get AI response',
+                'details': str(e)
+            }, event='error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so tokens flush immediately
+        }
+    )
+
+def answer_locally(user_message, conversation_history, headers, observation):
+    """
+    (result, turn) for one batch item: result is a finished answer (template, demo,
+    cache hit), else None and turn is the prepared turn to send upstream
+    """
+    route = classify(user_message)
+    routed = get_routed_response(route, conversation_history)
+    if routed is not None:
+        return {'response': routed, 'source': 'template'}, None
+    if not llm.available():
+        return {'response': get_demo_response(user_message), 'source': 'demo'}, None
+    turn = prepare_turn(user_message, conversation_history, route, facts=onchain_facts(route))
+    cached, cache_status = lookup_cached_response(turn, headers)
+    observation.cache(cache_status)
+    if cached is not None:
+        return {**cached, 'source': 'cache', 'cache': cache_status}, turn
+    return None, turn
+
+def batch_limiter():
+    """Admission slots for batch items: the batch hands back its own slot and each running item holds one"""
+    g.admission.release()
+    return admission.limiter if admission.enabled else None
+
+@app.route('/chat/batch', methods=['POST'])
+@flask_observed('/chat/batch', MODEL)
+@flask_traced
+@flask_admitted(admission, cost=batch_cost)
+def chat_batch():
+    """
+    Batch of independent chat turns, answered concurrently
+    
+    Request: {"items": ["message", {"id": "optional", "message": "...", "conversationHistory": [...]}, ...],
+              "concurrency": 8, "ordered": false}       (concurrency and ordered optional)
+    Response: application/x-ndjson, one line per item as soon as it is answered
+        {"index": 0, "id": "...", "response": "...", "source": "llm", "cache": "MISS", "provider": "openai"}
+        {"index": 3, "response": "fallback answer", "source": "degraded", "degraded": "deadline"}
+        {"index": 5, "error": "Failed to get AI response", "details": "..."}
+        {"done": true, "items": 6, "unique": 5, "failed": 1, "timing": {...}}    (final line)
+    Identical items are answered once. With "ordered": true lines are sent in
+    input order. X-Request-Timeout-Ms applies to each upstream call. For
+    admission control every unique item costs a rate-limit token and holds a
+    concurrency slot while it runs.
+    """
+    timeout = request_deadline(request.headers).timeout
+    observation = g.observation
+    trace = g.trace
+    trace.stage('parse')
+    items, concurrency, ordered, error = parse_batch(request.get_json(silent=True), ('conversationHistory',))
+    if error:
+        return jsonify(error), 400
+    
+    headers = dict(request.headers)
+    observation.streaming = True
+    observation.source = 'batch'
+    groups = group_duplicates(
+        json.dumps([item['message'], item.get('conversationHistory') or []], sort_keys=True) for item in items
+    )
+    logger.info(f"Received batch of {len(items)} items ({len(groups)} unique)")
+    
+    def generate():
+        writer = BatchWriter(items, ordered)
+        try:
+            # Read every item's contracts up front, at once; items below find them cached
+            targets = list(dict.fromkeys(
+                target for indexes in groups.values() for target in onchain.route_targets(classify(items[indexes[0]]['message']))
+            ))
+            if targets:
+                trace.stage('onchain', targets=len(targets))
+                onchain.lookup(targets, background_loop.run)
+            
+            trace.stage('prepare')
+            jobs = []
+            for key, indexes in groups.items():
+                item = items[indexes[0]]
+                try:
+                    result, turn = answer_locally(item['message'], item.get('conversationHistory') or [],
+                                                  headers, observation)
+                except Exception as e:
+                    logger.warning(f"Batch item {indexes[0]} failed: {e}")
+                    yield from writer.add(indexes, {'error': 'Failed to get AI response', 'details': str(e)}, error=True)
+                    continue
+                if result is not None:
+                    yield from writer.add(indexes, result)
+                else:
+                    jobs.append((key, (item['message'], turn)))
+            
+            trace.stage('upstream', items=len(jobs))
+            
+            async def run(job, deadline):
+                user_message, turn = job
+                return await llm.complete(llm_request(turn, user_message, None), deadline)
+            
+            pending = dict(jobs)
+            for key, completion, e in background_loop.iterate(fan_out(jobs, run, concurrency, timeout, batch_limiter())):
+                indexes = groups[key]
+                user_message, turn = pending.pop(key)
+                if isinstance(e, UpstreamUnavailable):
+                    observation.error(e.reason)
+                    result = {'response': get_demo_response(user_message, degraded=True),
+                              'source': 'degraded', 'degraded': e.reason}
+                    yield from writer.add(indexes, result)
+                elif e is not None:
+                    logger.warning(f"Batch item {indexes[0]} failed: {e}")
+                    observation.error(type(e).__name__)
+                    yield from writer.add(indexes, {'error': 'Failed to get AI response', 'details': str(e)}, error=True)
+                else:
+                    observation.upstream(completion)
+                    store_cached_response(turn, {'response': completion.text})
+                    yield from writer.add(indexes, {'response': completion.text, 'source': 'llm', 'cache': 'MISS',
+                                                    'provider': completion.provider})
+            trace.stage('respond')
+            logger.info(f"Batch finished: {len(items)} items, {len(jobs)} upstream calls, {writer.failed} failed")
+            yield writer.summary(len(groups), timing=trace.timings())
+        
+        except Exception as e:
+            logger.error(f"Chat batch error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
+            trace.error = type(e).__name__
+            yield json.dumps({'error': 'Failed to get AI response', 'details': str(e)}) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype=NDJSON_MIMETYPE,
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so each line flushes when it is ready
+        }
+    )
+
+def analysis_facts(target):
+    """On-chain fact block for an /analyze contract (None for a project)"""
+    if not target.address:
+        return None
+    return render_facts(onchain.lookup(onchain.targets([target.address], [target.chain]), background_loop.run))
+
+def run_analysis(target, prompt, key, deadline, observation):
+    """One structured analysis completion, validated and cached; raises InvalidAnalysis"""
+    llm_req = ChatRequest(
+        messages=build_analysis_messages(target, prompt, analysis_facts(target)),
+        user_message=None,
+        user_id='middlekid',
+        session_id=None,
+        response_format={'type': 'json_object'}
+    )
+    completion = background_loop.run(llm.complete(llm_req, deadline), timeout=deadline.remaining() + 1)
+    observation.upstream(completion)
+    result = analysis_result(target, parse_analysis(completion.text), completion.model or MODEL, prompt.version)
+    analysis_cache.set(key, result)
+    return result, completion
+
+@app.route('/analyze', methods=['POST'])
+@flask_observed('/analyze', MODEL)
+@flask_traced
+@flask_admitted(admission)
+def analyze():
+    """
+    Structured risk analysis of a contract or project, cached per target
+    
+    Request: {"chain": "base", "address": "0x..."} or {"project": "Uniswap", "chain": "ethereum"}
+             (chain optional with a project; optional "lang": "id" | "en", default "id")
+    Response: {"chain", "address" | "project", "lang", "summary", "category", "score", "riskLevel",
+               "keyFindings": [...], "scamFlags": [...], "model", "promptVersion", "analyzedAt"}
+          or: 400 invalid target, 502 invalid model output, 503 LLM unavailable
+    Identical targets are answered from the cache (X-Cache: HIT) until
+    ANALYZE_CACHE_TTL or POST /analyze/invalidate; concurrent misses share one
+    completion.
+    """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    observation.mode = ANALYSIS
+    trace = g.trace
+    trace.stage('parse')
+    target, error = parse_target(request.get_json(silent=True))
+    if error:
+        return jsonify(error), 400
+    if not llm.available():
+        return jsonify({'error': 'No LLM provider is configured'}), 503
+    
+    trace.stage('cache')
+    prompt = analysis_prompt()
+    key = analysis_key(target, MODEL, prompt.version)
+    cached = analysis_cache.get(key)
+    observation.cache('HIT' if cached is not None else 'MISS')
+    if cached is not None:
+        observation.source = 'cache'
+        return jsonify(cached), 200, {'X-Cache': 'HIT'}
+    
+    logger.info(f"Analyzing {target.address or target.project} ({target.chain or 'any chain'})")
+    upstream = trace.stage('upstream')
+    try:
+        (result, completion), shared = analysis_flights.do(
+            key, lambda: run_analysis(target, prompt, key, deadline, observation)
+        )
+    except UpstreamUnavailable as e:
+        logger.warning(f"Analysis unavailable ({e.reason}): {e}")
+        observation.source = 'degraded'
+        observation.error(e.reason)
+        return jsonify({'error': 'Analysis is temporarily unavailable', 'degraded': e.reason}), 503, {
+            'Retry-After': '5', 'Cache-Control': 'no-store'
+        }
+    except InvalidAnalysis as e:
+        logger.warning(f"Invalid analysis from the model: {e}")
+        observation.error('invalid_output')
+        return jsonify({'error': 'The model returned an invalid analysis', 'details': str(e)}), 502
+    except Exception as e:
+        logger.error(f"Analyze error: {str(e)}", exc_info=True)
+        observation.error(type(e).__name__)
+        return jsonify({'error': 'Failed to get AI response', 'details': str(e)}), 500
+    
+    observation.source = 'coalesced' if shared else 'llm'
+    observation.model = completion.model
+    trace.upstream(upstream, completion, shared)
+    headers = provider_headers({'X-Cache': 'MISS'}, completion.provider, completion.hedged)
+    if shared:
+        headers['X-Coalesced'] = 'true'
+    return jsonify(result), 200, headers
+
+@app.route('/analyze/invalidate', methods=['POST'])
+def invalidate_analysis():
+    """
+    Drop the cached analysis of a target (in every worker), so the next /analyze runs fresh
+    
+    Request: same body as /analyze, with the X-Admin-Key header set to ADMIN_API_KEY
+    Response: {"invalidated": true, "key": "..."}
+    """
+    if not ADMIN_API_KEY:
+        return jsonify({'error': 'Invalidation is disabled (ADMIN_API_KEY not set)'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Key', ''), ADMIN_API_KEY):
+        return jsonify({'error': 'Invalid admin key'}), 403
+    target, error = parse_target(request.get_json(silent=True))
+    if error:
+        return jsonify(error), 400
+    key = analysis_key(target, MODEL, analysis_prompt().version)
+    analysis_cache.invalidate(key)
+    logger.info(f"Invalidated analysis {key}")
+    return jsonify({'invalidated': True, 'key': key})
+
+# Templated answers for plain INFORMATION / CLARIFICATION turns, keyed by (topic, language)
+ROUTED_RESPONSES = {
+    ('help', 'id'): DEMO_RESPONSES['help'],
+    ('help', 'en'): """Middlekid is a crypto wallet and DeFi tracker that helps you:
+
+💰 **Track Token Holdings** - See all your tokens across 17+ blockchains
+🖼️ **View NFT Collections** - Your NFT gallery
+📊 **Monitor DeFi Positions** - Staking, LP and lending positions
+⚡ **Real-time Analytics** - Live portfolio data
+
+Paste a wallet address into the search bar to get started!""",
+    ('defi', 'id'): DEMO_RESPONSES['defi'],
+    ('defi', 'en'): """DeFi Positions shows your DeFi exposure, such as:
+
+• **Staking positions** - Tokens you have staked
+• **Liquidity pool positions** - Your LP tokens
+• **Lending/borrowing** - Positions on Aave, Compound, etc.
+
+Open the "DeFi" tab after entering a wallet address.
+
+Middlekid detects positions on Stargate, Beethoven X and other protocols automatically.""",
+    ('greeting', 'id'): """Halo! Saya Kid, asisten AI untuk Middlekid. 👋
 
 Saya bisa bantu dengan:
 • Penjelasan fitur Middlekid
 • Cara pakai app
 • Informasi DeFi positions
-• Analisis token (perlu OpenAI API key)
+• Analisis risiko token, DeFi protocol, dan airdrop
+
+Ada yang bisa saya bantu?""",
+    ('greeting', 'en'): """Hi! I'm Kid, the AI assistant for Middlekid. 👋
+
+I can help with:
+• Explaining Middlekid features
+• How to use the app
+• Your DeFi positions
+• Risk analysis of tokens, DeFi protocols and airdrops
 
-Ada yang bisa saya bantu?"""
+How can I help?""",
+    ('token', 'id'): "Token atau project mana yang ingin dicek? Kirimkan contract address, nama lengkap project, atau link resminya supaya saya bisa menganalisis risikonya.",
+    ('token', 'en'): "Which token or project would you like me to check? Please share the contract address, the full project name, or its official link so I can analyze the risk.",
+}
+
+# Answer plain INFORMATION / CLARIFICATION turns locally instead of calling the LLM
+INTENT_SHORTCUT_ENABLED = os.getenv('INTENT_SHORTCUT_ENABLED', 'true').lower() == 'true'
+
+def get_routed_response(route, conversation_history):
+    """
+    Templated answer for a plainly classified turn, or None to use the LLM
+    
+    Clarification templates are only used on the first turn: later in a
+    conversation the identifier may already be in the history. Whale-list
+    requests are rendered from the registry only when they just ask for the
+    list; any other question about whales goes to the LLM.
+    """
+    if not INTENT_SHORTCUT_ENABLED or not route.plain:
+        return None
+    if route.mode == WHALE_LIST:
+        return whale_registry.render(route.chains, route.lang)
+    if route.mode == INFORMATION:
+        return ROUTED_RESPONSES.get((route.topic, route.lang))
+    if route.mode == CLARIFICATION and not conversation_history:
+        return ROUTED_RESPONSES.get((route.topic, route.lang))
+    return None
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 8080))
     logger.info(f"Starting GoodKid Agent (OpenAI) on port {port}")
+    start_warm_up()
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,440 @@
+"""
+AsyncIO serving mode for the OpenAI agent
+Same /health, /chat and /chat/stream contract as openai_agent.py, served by an
+ASGI app on one shared AsyncOpenAI client with a pooled keep-alive connection set.
+
+Run with:
+    uvicorn openai_agent_asgi:app --host 0.0.0.0 --port 8080
+"""
+
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+import asyncio
+import os
+import logging
+
+from openai_agent import (
+    MODEL,
+    TEMPERATURE,
+    MAX_TOKENS,
+    SUMMARY_MAX_TOKENS,
+    prepare_turn,
+    degraded_response,
+    get_demo_response,
+    get_routed_response,
+    history_report,
+    idempotency_store,
+    llm_request,
+    provider_headers,
+    parse_whale_filters,
+    resolve_conversation,
+    session_store,
+    with_session,
+    lookup_cached_response,
+    onchain,
+    response_cache,
+    semantic_cache,
+    sse_event,
+    store_cached_response,
+    turn_headers,
+)
+from intent_router import classify
+from onchain import render_facts
+from session_store import build_summary_messages, fallback_summary
+from single_flight import AsyncSingleFlight, quart_idempotent
+from llm_providers import OPENAI_MAX_CONNECTIONS, ProviderRouter, make_async_openai_client
+from resilience import UpstreamUnavailable, request_deadline
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, QUEUE_DEPTH, quart_observed, render as render_metrics
+from tracing import exporter as trace_exporter, quart_traced
+from admission import AdmissionController, AsyncConcurrencyLimiter, RateLimiter, quart_admitted
+from shared_state import run_blocking, shared_state
+from whale_registry import whale_registry
+from warmup import WarmUp, local_stages, onchain_stages, provider_stages
+
+app = cors(Quart(__name__), allow_origin=os.getenv("ALLOWED_ORIGINS", "*").split(","))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shared AsyncOpenAI client (created on first use, closed on shutdown)
+async_openai_client = None
+
+def get_async_openai_client():
+    """Initialize the shared AsyncOpenAI client with a tuned connection pool"""
+    global async_openai_client
+    if async_openai_client is None:
+        async_openai_client = make_async_openai_client()
+        logger.info(f"AsyncOpenAI client initialized (pool={OPENAI_MAX_CONNECTIONS})")
+    return async_openai_client
+
+# Upstream model(s) on the shared pooled client, see openai_agent.llm
+llm = ProviderRouter.from_env('openai', openai={
+    'model': MODEL, 'temperature': TEMPERATURE, 'max_tokens': MAX_TOKENS,
+    'client_factory': get_async_openai_client
+})
+
+# Identical turns in flight share one upstream call; Idempotency-Key retries wait for the first
+chat_flights = AsyncSingleFlight()
+idempotency_flights = AsyncSingleFlight()
+
+async def complete_turn(turn, llm_req, deadline, observation):
+    """Run the upstream completion for a turn within its deadline and cache its answer"""
+    completion = await llm.complete(llm_req, deadline)
+    observation.upstream(completion)
+    result = {'response': completion.text}
+    await run_blocking(shared_state, store_cached_response, turn, result)
+    return result, completion
+
+# Running summary folds; references are kept so tasks are not garbage collected mid-flight
+summary_tasks = set()
+
+# Per-client rate limits and a cap on concurrent chat requests, see openai_agent.admission
+admission = AdmissionController(rate_limiter=RateLimiter(shared=shared_state), limiter=AsyncConcurrencyLimiter())
+
+QUEUE_DEPTH.labels('admission').set_function(lambda: admission.limiter.waiting)
+QUEUE_DEPTH.labels('session_summary').set_function(lambda: len(summary_tasks))
+QUEUE_DEPTH.labels('coalesced').set_function(lambda: chat_flights.waiting)
+
+async def run_summary_fold(session, fold):
+    """Async counterpart of openai_agent.run_summary_fold"""
+    try:
+        try:
+            client = get_async_openai_client()
+        except ValueError:
+            summary = fallback_summary(fold)
+        else:
+            response = await client.chat.completions.create(
+                model=MODEL,
+                messages=build_summary_messages(fold),
+                temperature=0.2,
+                max_tokens=SUMMARY_MAX_TOKENS
+            )
+            summary = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.warning(f"Session summary failed, using extractive fallback: {e}")
+        summary = fallback_summary(fold)
+    await run_blocking(shared_state, session_store.complete_fold, session, fold, summary)
+    logger.info(f"Session {session.id}: folded {len(fold.turns)} messages into summary")
+
+async def onchain_facts(route, trace):
+    """On-chain fact block for the contract addresses in an analysis question (None if there are none)"""
+    targets = onchain.route_targets(route)
+    if not targets:
+        return None
+    trace.stage('onchain', targets=len(targets))
+    return render_facts(await onchain.lookup_async(targets))
+
+async def record_session_turn(session, user_message, assistant_message):
+    """Append a finished turn to its session and fold old turns in a background task"""
+    if session is None:
+        return
+    await run_blocking(shared_state, session_store.append_turn, session, user_message, assistant_message)
+    fold = await run_blocking(shared_state, session_store.begin_fold, session)
+    if fold is not None:
+        task = asyncio.create_task(run_summary_fold(session, fold))
+        summary_tasks.add(task)
+        task.add_done_callback(summary_tasks.discard)
+
+# Readiness of this app (openai_agent.warm_up belongs to the Flask app); the task is kept referenced
+warm_up = WarmUp()
+warm_up_tasks = set()
+
+@app.before_serving
+async def start_warm_up():
+    """Warm up in a task, so the server already answers /health while /ready is 503"""
+    task = asyncio.create_task(warm_up.run_async(local_stages() + provider_stages(llm) + onchain_stages(onchain)))
+    warm_up_tasks.add(task)
+    task.add_done_callback(warm_up_tasks.discard)
+
+@app.after_serving
+async def close_openai_client():
+    """Release pooled upstream connections on shutdown"""
+    global async_openai_client
+    if async_openai_client is not None:
+        await async_openai_client.close()
+        async_openai_client = None
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'status': 'healthy',
+        'service': 'GoodKid Agent (OpenAI, ASGI)',
+        'version': '2.0.0',
+        'cache': response_cache.stats(),
+        'semanticCache': semantic_cache.stats(),
+        'onchain': onchain.stats(),
+        'sessions': session_store.stats(),
+        'singleFlight': chat_flights.stats(),
+        'idempotency': idempotency_store.stats(),
+        'llm': llm.stats(),
+        'admission': admission.stats(),
+        'tracing': trace_exporter.stats(),
+        'sharedState': shared_state.stats() if shared_state is not None else None
+    })
+
+@app.route('/ready', methods=['GET'])
+async def readiness_check():
+    """Readiness probe: 503 until warm-up has finished"""
+    return jsonify(warm_up.status()), 200 if warm_up.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/whales', methods=['GET'])
+async def list_whales():
+    """Whale wallet registry, see openai_agent.list_whales"""
+    chains, error = parse_whale_filters(request.args.get('chain'))
+    if error:
+        return jsonify(error), 400
+    whales = whale_registry.find(chains, request.args.get('type'))
+    return jsonify({
+        'chains': whale_registry.chains,
+        'types': whale_registry.types,
+        'whales': [w._asdict() for w in whales]
+    })
+
+@app.route('/chat', methods=['POST'])
+@quart_observed('/chat', MODEL)
+@quart_traced
+@quart_admitted(admission)
+@quart_idempotent(idempotency_store, idempotency_flights)
+async def chat():
+    """
+    Chat endpoint using the shared AsyncOpenAI client
+
+    Request: {"message": "user message", "conversationHistory": [...]}
+         or: {"message": "user message", "sessionId": "client-generated id"}
+    Optional headers: Idempotency-Key, X-Request-Timeout-Ms (see openai_agent.chat)
+    Response: {"response": "agent response"}
+          or: {"response": "fallback answer", "degraded": "deadline" | "circuit-open"}
+    """
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    trace = g.trace
+    try:
+        trace.stage('parse')
+        data = await request.get_json()
+
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Message is required'}), 400
+
+        user_message = data['message']
+        session, conversation_history, summary, error = await run_blocking(shared_state, resolve_conversation, data)
+        if error:
+            return jsonify(error), 400
+
+        logger.info(f"Received message: {user_message[:100]}...")
+
+        trace.stage('route')
+        route = classify(user_message)
+        observation.mode = route.mode
+        routed = get_routed_response(route, conversation_history)
+        if routed is not None:
+            logger.info(f"Answered locally by intent router ({route.mode}/{route.topic})")
+            observation.source = 'template'
+            await record_session_turn(session, user_message, routed)
+            body = with_session({'response': routed}, session)
+            return jsonify(body), 200, {'X-Intent': route.mode, 'X-Intent-Route': 'template'}
+
+        if not llm.available():
+            # No provider configured (OpenAI key not set) - use demo mode
+            logger.warning("No LLM provider configured, using demo mode")
+            observation.source = 'demo'
+            demo = get_demo_response(user_message)
+            await record_session_turn(session, user_message, demo)
+            return jsonify(with_session({'response': demo}, session))
+
+        facts = await onchain_facts(route, trace)
+        trace.stage('prompt')
+        turn = prepare_turn(user_message, conversation_history, route, summary, facts)
+
+        trace.stage('cache')
+        cached, cache_status = await run_blocking(shared_state, lookup_cached_response, turn, request.headers)
+        observation.cache(cache_status)
+        if cached is not None:
+            logger.info("Serving cached response")
+            observation.source = 'cache'
+            await record_session_turn(session, user_message, cached['response'])
+            body = with_session({**cached, 'history': history_report(turn)}, session)
+            return jsonify(body), 200, turn_headers(turn, cache_status)
+
+        logger.info("Calling LLM provider...")
+        llm_req = llm_request(turn, user_message, session)
+        upstream = trace.stage('upstream')
+        (result, completion), shared = await chat_flights.do(
+            turn.cache_key, lambda: complete_turn(turn, llm_req, deadline, observation)
+        )
+        observation.source = 'coalesced' if shared else 'llm'
+        observation.model = completion.model
+        trace.upstream(upstream, completion, shared)
+        trace.stage('respond')
+
+        assistant_message = result['response']
+        logger.info(f"{completion.provider} response{' (coalesced)' if shared else ''}: {assistant_message[:100]}...")
+        await record_session_turn(session, user_message, assistant_message)
+
+        headers = provider_headers(turn_headers(turn, cache_status), completion.provider, completion.hedged)
+        if shared:
+            headers['X-Coalesced'] = 'true'
+        body = with_session({**result, 'history': history_report(turn)}, session)
+        return jsonify(body), 200, headers
+
+    except UpstreamUnavailable as e:
+        body, headers = degraded_response(user_message, e, session, observation)
+        return jsonify(body), 200, headers
+
+    except Exception as e:
+        logger.error(f"Chat error: {str(e)}", exc_info=True)
+        observation.error(type(e).__name__)
+        trace.error = type(e).__name__
+        return jsonify({
+            'error': 'Failed to get AI response',
+            'details': str(e)
+        }), 500
+
+@app.route('/chat/stream', methods=['POST'])
+@quart_observed('/chat/stream', MODEL)
+@quart_traced
+@quart_admitted(admission)
+async def chat_stream():
+    """Streaming chat endpoint (Server-Sent Events), see openai_agent.chat_stream"""
+    deadline = request_deadline(request.headers)
+    observation = g.observation
+    trace = g.trace
+    ticket = g.admission
+    trace.stage('parse')
+    data = await request.get_json(silent=True)
+
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+
+    user_message = data['message']
+    session, conversation_history, summary, error = await run_blocking(shared_state, resolve_conversation, data)
+    if error:
+        return jsonify(error), 400
+
+    logger.info(f"Received stream message: {user_message[:100]}...")
+
+    headers = request.headers
+    trace.stage('route')
+    route = classify(user_message)
+    observation.mode = route.mode
+    observation.streaming = True
+
+    async def generate():
+        try:
+            routed = get_routed_response(route, conversation_history)
+            if routed is not None:
+                logger.info(f"Answered locally by intent router ({route.mode}/{route.topic})")
+                observation.source = 'template'
+                await record_session_turn(session, user_message, routed)
+                yield sse_event({'delta': routed})
+                yield sse_event(with_session({
+                    'finishReason': 'stop', 'usage': None, 'mode': route.mode, 'timing': trace.timings()
+                }, session), event='done')
+                return
+
+            if not llm.available():
+                logger.warning("No LLM provider configured, using demo mode")
+                observation.source = 'demo'
+                demo = get_demo_response(user_message)
+                await record_session_turn(session, user_message, demo)
+                yield sse_event({'delta': demo})
+                yield sse_event(with_session({'finishReason': 'stop', 'usage': None, 'timing': trace.timings()}, session), event='done')
+                return
+
+            facts = await onchain_facts(route, trace)
+            trace.stage('prompt')
+            turn = prepare_turn(user_message, conversation_history, route, summary, facts)
+
+            trace.stage('cache')
+            cached, cache_status = await run_blocking(shared_state, lookup_cached_response, turn, headers)
+            observation.cache(cache_status)
+            if cached is not None:
+                logger.info("Serving cached response (stream)")
+                observation.source = 'cache'
+                await record_session_turn(session, user_message, cached['response'])
+                yield sse_event({'delta': cached['response']})
+                yield sse_event(with_session({
+                    'finishReason': 'stop',
+                    'usage': None,
+                    'cached': True,
+                    'mode': route.mode,
+                    'promptTokens': turn.prompt_tokens,
+                    'history': history_report(turn),
+                    'timing': trace.timings()
+                }, session), event='done')
+                return
+
+            logger.info("Calling LLM provider (stream)...")
+            observation.source = 'llm'
+            stream = llm.open(llm_request(turn, user_message, session), deadline)
+            upstream = trace.stage('upstream')
+
+            parts = []
+            try:
+                async for delta in stream:
+                    parts.append(delta)
+                    yield sse_event({'delta': delta})
+            except UpstreamUnavailable as e:
+                body, _ = degraded_response(user_message, e, session, observation)
+                done = {'finishReason': 'stop', 'usage': None, 'degraded': e.reason, 'mode': route.mode}
+                if parts:
+                    done.update(finishReason=e.reason, provider=stream.provider)
+                else:
+                    yield sse_event({'delta': body['response']})
+                yield sse_event(with_session({**done, 'timing': trace.timings()}, session), event='done')
+                return
+            finally:
+                await stream.aclose()
+
+            finish_reason = stream.finish_reason
+            logger.info(f"{stream.provider} stream finished: {finish_reason}")
+            observation.upstream(stream)
+            trace.upstream(upstream, stream)
+            trace.stage('respond')
+            if finish_reason:
+                answer = ''.join(parts)
+                await run_blocking(shared_state, store_cached_response, turn, {'response': answer})
+                await record_session_turn(session, user_message, answer)
+            yield sse_event(with_session({
+                'finishReason': finish_reason,
+                'usage': stream.usage,
+                'provider': stream.provider,
+                'hedged': stream.hedged,
+                'mode': route.mode,
+                'promptTokens': turn.prompt_tokens,
+                'history': history_report(turn),
+                'timing': trace.timings()
+            }, session), event='done')
+
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            observation.error(type(e).__name__)
+            trace.error = type(e).__name__
+            yield sse_event({
+                'error': 'Failed to get AI response',
+                'details': str(e)
+            }, event='error')
+        finally:
+            ticket.release()
+            observation.finish(200)
+            trace.finish(200)
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.getenv('PORT', 8080))
+    logger.info(f"Starting GoodKid Agent (OpenAI, ASGI) on port {port}")
+    uvicorn.run(app, host='0.0.0.0', port=port, timeout_keep_alive=75)
@@ -0,0 +1,140 @@
+"""
+Request deadlines and per-provider circuit breakers
+A Deadline is fixed when a request arrives (X-Request-Timeout-Ms or the
+default) and bounds every upstream call made for it, so no work continues
+after the caller has given up. A CircuitBreaker opens after consecutive
+upstream failures or timeouts, fails fast while open, and lets a single probe
+through after a cool-down to check recovery. A caller's own deadline is not the
+provider's fault: only calls left unanswered for CIRCUIT_SLOW_CALL_MS count as
+timeouts, so a client sending a 100 ms X-Request-Timeout-Ms cannot open the
+circuit for everyone.
+"""
+
+import os
+import threading
+import time
+
+# The Next.js route gives up after 30s; answer (degraded if needed) before that
+REQUEST_TIMEOUT_MS = float(os.getenv('REQUEST_TIMEOUT_MS', 25000))
+REQUEST_TIMEOUT_MIN_MS = 100
+REQUEST_TIMEOUT_MAX_MS = float(os.getenv('REQUEST_TIMEOUT_MAX_MS', 120000))
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+# A call still unanswered after this long counts as a provider timeout
+CIRCUIT_SLOW_CALL_MS = float(os.getenv('CIRCUIT_SLOW_CALL_MS', REQUEST_TIMEOUT_MS))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class UpstreamUnavailable(Exception):
+    """No upstream answer can be had in time; callers serve a degraded answer"""
+
+    reason = 'unavailable'
+
+
+class DeadlineExceeded(UpstreamUnavailable, TimeoutError):
+    reason = 'deadline'
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    reason = 'circuit-open'
+
+
+class Deadline:
+    """Absolute point (monotonic clock) by which a request must be answered"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def request_deadline(headers):
+    """Deadline from the X-Request-Timeout-Ms header (clamped), else REQUEST_TIMEOUT_MS"""
+    timeout_ms = REQUEST_TIMEOUT_MS
+    value = headers.get(DEADLINE_HEADER)
+    if value:
+        try:
+            timeout_ms = min(max(float(value), REQUEST_TIMEOUT_MIN_MS), REQUEST_TIMEOUT_MAX_MS)
+        except ValueError:
+            pass
+    return Deadline(timeout_ms / 1000)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker (thread-safe)
+
+    closed: calls pass; failure_threshold consecutive failures open it.
+    open: calls are refused until reset_timeout has passed.
+    half-open: one probe call at a time; success closes, failure re-opens.
+    A probe that never reports back stops blocking after reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.rejected = 0
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go upstream now (in half-open, claims the probe slot)"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probe_started_at = None
+            if self.state == HALF_OPEN and (
+                self.probe_started_at is None or now - self.probe_started_at >= self.reset_timeout
+            ):
+                self.probe_started_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probe_started_at = None
+
+    def release(self):
+        """A call ended without a verdict on the provider (caller gave up): free the probe slot"""
+        with self._lock:
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opens += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutiveFailures': self.failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,185 @@
+"""
+In-process response cache for repeated chat turns
+Bounded LRU with per-entry TTL, capped both by entry count and stored bytes.
+With a shared store (shared_state.py) answers are also written there, and a
+local miss is looked up in it, so workers answer each other's repeats. An
+invalidation is published to a feed that every worker applies to its local
+copies within INVALIDATION_SYNC_INTERVAL.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+from shared_state import failed
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 600))
+
+# Seconds between checks of the shared invalidation feed
+INVALIDATION_SYNC_INTERVAL = 1.0
+
+# Request header that skips the cache lookup (the fresh answer is still stored)
+CACHE_BYPASS_HEADER = 'X-Cache-Bypass'
+
+
+def make_cache_key(model, temperature, prompt_version, messages):
+    """
+    Canonical hash of everything that determines a completion
+
+    `messages` is the conversation window actually sent upstream (without the
+    system prompt, which is represented by `prompt_version`).
+    """
+    payload = json.dumps(
+        {
+            'model': model,
+            'temperature': temperature,
+            'prompt': prompt_version,
+            'messages': [[m['role'], m['content']] for m in messages],
+        },
+        ensure_ascii=False,
+        separators=(',', ':'),
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_bypass_requested(headers):
+    """True if the client asked to skip the cache (X-Cache-Bypass or Cache-Control: no-cache)"""
+    if headers.get(CACHE_BYPASS_HEADER, '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'no-cache' in headers.get('Cache-Control', '').lower()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of chat responses"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, shared=None, namespace='response'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self.namespace = namespace
+        self._cursor = None
+        self._synced_at = 0.0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None on miss/expiry"""
+        now = time.monotonic()
+        if self.shared is not None and now - self._synced_at >= INVALIDATION_SYNC_INTERVAL:
+            self._sync(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            if self.shared is None:
+                self.misses += 1
+                return None
+        # Stored by another worker? (its copy stays in the shared store, which owns the TTL)
+        try:
+            value = self.shared.get(self.namespace, key)
+        except Exception as e:
+            failed(self.shared, 'response cache get', e)
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.shared_hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serializable value, evicting least recently used entries"""
+        size = len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl
+        if self.shared is not None:
+            try:
+                self.shared.set(self.namespace, key, value, ttl)
+            except Exception as e:
+                failed(self.shared, 'response cache set', e)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop key here, in the shared store and (via the feed) in every other worker"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self.invalidations += 1
+        if self.shared is not None:
+            try:
+                self.shared.delete(self.namespace, key)
+                self.shared.publish(f"{self.namespace}.invalidate", key, self.ttl)
+            except Exception as e:
+                failed(self.shared, 'response cache invalidate', e)
+
+    def _sync(self, now):
+        """Apply the invalidations other workers published since the last sync"""
+        self._synced_at = now
+        try:
+            keys, self._cursor = self.shared.read(f"{self.namespace}.invalidate", self._cursor)
+        except Exception as e:
+            failed(self.shared, 'response cache sync', e)
+            return
+        with self._lock:
+            for key, _ in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'sharedHits': self.shared_hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
@@ -20,7 +20,7 @@ source venv/bin/activate
 
 # Install dependencies
 echo "📚 Installing Python packages..."
-pip install -q flask==3.0.0 flask-cors==4.0.0 openai
+pip install -q -r requirements-openai.txt
 
 # Load environment variables from .env file if it exists
 ENV_FILE="../.env"
@@ -46,5 +46,11 @@ echo "🤖 Starting GoodKid AI Agent on http://localhost:8080"
 echo "Press Ctrl+C to stop"
 echo ""
 
-# Run the agent
-python3 openai_agent.py
+# Run the agent (SERVER_MODE=asgi serves the asyncio app on uvicorn, SERVER_MODE=gunicorn pre-forks workers)
+if [ "$SERVER_MODE" = "asgi" ]; then
+    python3 openai_agent_asgi.py
+elif [ "$SERVER_MODE" = "gunicorn" ]; then
+    gunicorn -c gunicorn.conf.py openai_agent:app
+else
+    python3 openai_agent.py
+fi
@@ -0,0 +1,265 @@
+"""
+Near-duplicate query cache
+Normalizes first-turn questions (case, punctuation, Indonesian/English stopwords,
+0x addresses) and finds previously answered ones with MinHash + LSH banding, so
+"whale wallet base?" and "kasih wallet whale di base dong" share one answer.
+Similarity alone cannot tell "is PEPE safe?" from "is BRETT safe?", so matches
+also need the same addresses and the same subjects (the project names and
+chain hints the intent router found).
+With a shared store (shared_state.py) every answer is also published to a
+feed; each worker indexes the entries of the others before a lookup, so all
+workers match against the same questions.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import os
+import re
+import struct
+import threading
+import time
+
+from shared_state import failed, process_id
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 100000))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', 3600))
+
+# 16 bands x 4 rows: pairs above ~0.5 Jaccard usually share a bucket, above 0.8 almost always
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Popular buckets are capped so a lookup never scans more than BANDS * MAX_BUCKET_SIZE candidates
+MAX_BUCKET_SIZE = 32
+
+ADDRESS_RE = re.compile(r'0x[a-fA-F0-9]{40}(?:[a-fA-F0-9]{24})?')
+NON_WORD_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an the is are was were be been am do does did of on in at to for from with by and or
+i me my you your we our it its this that these those please can could would will
+what which who whom how any some there here just about give show tell list
+yang di ke dari dan atau itu ini ada adalah untuk dengan pada dalam saya aku gue gw
+kamu anda kita kami dong deh sih ya yah nih kah lah tolong kasih minta mohon coba
+bisa boleh mau ingin apa apakah gimana bagaimana berapa mana tuh aja saja juga
+""".split())
+
+
+def stem(token):
+    """Light stemming: wallets -> wallet, walletnya -> wallet"""
+    if len(token) > 5 and token.endswith('nya'):
+        return token[:-3]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def normalize_query(text):
+    """
+    Return (tokens, addresses) for a user message
+
+    Addresses and hashes are replaced by a placeholder token and returned
+    separately (lowercased) so they can be matched exactly.
+    """
+    addresses = tuple(sorted({a.lower() for a in ADDRESS_RE.findall(text)}))
+    text = ADDRESS_RE.sub(' addr ', text.lower())
+    tokens = []
+    for token in NON_WORD_RE.split(text):
+        if not token or token in STOPWORDS:
+            continue
+        tokens.append(stem(token))
+    return tokens, addresses
+
+
+def shingles(tokens):
+    """Word unigrams plus in-word character trigrams (order-invariant, typo tolerant)"""
+    result = set(tokens)
+    for token in tokens:
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            result.add('~' + padded[i:i + 3])
+    return frozenset(result)
+
+
+_HASH_FORMAT = f'>{NUM_PERM}I'
+
+
+@lru_cache(maxsize=65536)
+def _shingle_hashes(shingle):
+    """NUM_PERM independent 32-bit hashes of one shingle (one SHAKE call, cached per shingle)"""
+    return struct.unpack(_HASH_FORMAT, hashlib.shake_128(shingle.encode('utf-8')).digest(NUM_PERM * 4))
+
+
+def minhash(shingle_set):
+    """MinHash signature (NUM_PERM values) of a shingle set"""
+    if not shingle_set:
+        return (0,) * NUM_PERM
+    return tuple(map(min, zip(*map(_shingle_hashes, shingle_set))))
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ('exact_key', 'shingles', 'identity', 'bucket_keys', 'value', 'expires_at')
+
+    def __init__(self, exact_key, shingles, identity, bucket_keys, value, expires_at):
+        self.exact_key = exact_key
+        self.shingles = shingles
+        self.identity = identity
+        self.bucket_keys = bucket_keys
+        self.value = value
+        self.expires_at = expires_at
+
+
+class SemanticCache:
+    """Thread-safe MinHash/LSH index of answered first-turn queries"""
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL, shared=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._cursor = None
+        self._sync_lock = threading.Lock()
+        self._entries = OrderedDict()  # entry id -> _Entry
+        self._buckets = {}  # (namespace, identity, band, band values) -> [entry ids]
+        self._exact = {}  # (namespace, identity, shingles) -> entry id, so re-asks replace
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.replicated = 0
+
+    def _prepare(self, namespace, text, subjects):
+        """
+        (shingles, identity, bucket keys)
+        
+        identity = addresses + subjects (project / ticker names and chain hints,
+        case- and plural-folded) and must match exactly; the rest of the wording
+        is left to the MinHash similarity.
+        """
+        tokens, addresses = normalize_query(text)
+        shingle_set = shingles(tokens)
+        signature = minhash(shingle_set)
+        identity = (addresses, tuple(sorted({stem(s.lower()) for s in subjects})))
+        bucket_keys = tuple(
+            (namespace, identity, band, signature[band * ROWS:(band + 1) * ROWS])
+            for band in range(BANDS)
+        )
+        return shingle_set, identity, bucket_keys
+
+    def get(self, namespace, text, subjects=()):
+        """Return (value, similarity) of the closest cached query above threshold, else (None, 0)"""
+        shingle_set, identity, bucket_keys = self._prepare(namespace, text, subjects)
+        if not shingle_set:
+            return None, 0.0
+        self._sync()
+        now = time.monotonic()
+        best_id, best_score = None, 0.0
+        with self._lock:
+            seen = set()
+            for key in bucket_keys:
+                for entry_id in self._buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry = self._entries[entry_id]
+                    # Bucket keys already include the identity; double-check anyway
+                    if entry.expires_at <= now or entry.identity != identity:
+                        continue
+                    score = jaccard(shingle_set, entry.shingles)
+                    if score > best_score:
+                        best_id, best_score = entry_id, score
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None, best_score
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].value, best_score
+
+    def set(self, namespace, text, value, subjects=()):
+        if self._insert(namespace, text, subjects, value, time.monotonic() + self.ttl) and self.shared is not None:
+            try:
+                self.shared.publish('semantic', {'origin': process_id(), 'namespace': namespace, 'text': text,
+                                                 'subjects': list(subjects), 'value': value}, self.ttl)
+            except Exception as e:
+                failed(self.shared, 'semantic cache publish', e)
+
+    def _sync(self):
+        """Index the entries other workers have published since the last sync"""
+        if self.shared is None or not self._sync_lock.acquire(blocking=False):
+            # Another thread is syncing; this lookup goes ahead with the index as it is
+            return
+        try:
+            items, self._cursor = self.shared.read('semantic', self._cursor)
+            offset = time.time() - time.monotonic()
+            origin = process_id()
+            for item, expires_at in items:
+                if item['origin'] != origin:
+                    self._insert(item['namespace'], item['text'], item.get('subjects', ()), item['value'],
+                                 expires_at - offset)
+                    self.replicated += 1
+        except Exception as e:
+            failed(self.shared, 'semantic cache sync', e)
+        finally:
+            self._sync_lock.release()
+
+    def _insert(self, namespace, text, subjects, value, expires_at):
+        """Index an answer until expires_at (monotonic); False if the text has no usable tokens"""
+        shingle_set, identity, bucket_keys = self._prepare(namespace, text, subjects)
+        if not shingle_set:
+            return False
+        exact_key = (namespace, identity, shingle_set)
+        with self._lock:
+            previous_id = self._exact.get(exact_key)
+            if previous_id is not None:
+                self._unindex(previous_id, self._entries.pop(previous_id))
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(exact_key, shingle_set, identity, bucket_keys, value, expires_at)
+            self._exact[exact_key] = entry_id
+            for key in bucket_keys:
+                bucket = self._buckets.setdefault(key, [])
+                bucket.append(entry_id)
+                if len(bucket) > MAX_BUCKET_SIZE:
+                    bucket.pop(0)
+            while len(self._entries) > self.max_entries:
+                oldest_id, oldest = self._entries.popitem(last=False)
+                self._unindex(oldest_id, oldest)
+                self.evictions += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'buckets': len(self._buckets),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'replicated': self.replicated,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'threshold': self.threshold,
+            }
+
+    def _unindex(self, entry_id, entry):
+        self._exact.pop(entry.exact_key, None)
+        for key in entry.bucket_keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(entry_id)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._buckets[key]
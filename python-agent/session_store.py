@@ -0,0 +1,222 @@
+"""
+Server-side conversation sessions
+Bounded in-process store (idle TTL + LRU eviction) so clients can send a
+sessionId instead of the whole history. Once a session grows past a threshold,
+its oldest turns are folded into a running summary. Each fold only sends the
+previous summary plus the newly folded turns, never the whole conversation.
+SharedSessionStore keeps the same sessions in a shared store (shared_state.py),
+so a conversation can continue on any worker.
+"""
+
+from collections import OrderedDict, namedtuple
+import os
+import re
+import threading
+import time
+
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', 10000))
+SESSION_TTL = float(os.getenv('SESSION_TTL', 3600))
+# Fold older turns into the summary once a session holds more than this many messages
+SESSION_SUMMARY_TRIGGER = int(os.getenv('SESSION_SUMMARY_TRIGGER', 16))
+# Messages kept verbatim after a fold
+SESSION_KEEP_RECENT = int(os.getenv('SESSION_KEEP_RECENT', 8))
+SESSION_SUMMARY_MAX_CHARS = int(os.getenv('SESSION_SUMMARY_MAX_CHARS', 2000))
+# Seconds a worker may hold a shared session's fold before another may start one
+SESSION_FOLD_LEASE = 120
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_\-:.]{1,128}$')
+
+SummaryFold = namedtuple('SummaryFold', ['previous_summary', 'turns'])
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a support conversation between a user and Kid, "
+    "the Middlekid crypto risk assistant. Update the summary with the new messages. Keep every "
+    "token name, contract address, chain, URL, risk conclusion and open question. Drop greetings "
+    "and chit-chat. Answer with the updated summary only, at most 150 words, in the user's language."
+)
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_RE.match(session_id))
+
+
+def build_summary_messages(fold):
+    """Chat messages asking the model to fold new turns into the previous summary"""
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in fold.turns)
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTION},
+        {"role": "user", "content": (
+            f"Previous summary:\n{fold.previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )},
+    ]
+
+
+def fallback_summary(fold):
+    """Extractive summary used when no model is available: clipped user turns appended"""
+    lines = [fold.previous_summary] if fold.previous_summary else []
+    lines += [f"- user: {t['content'][:200]}" for t in fold.turns if t['role'] == 'user']
+    return "\n".join(lines)[-SESSION_SUMMARY_MAX_CHARS:]
+
+
+class ChatSession:
+    """One conversation: running summary plus the recent verbatim turns"""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.summary = ''
+        self.turns = []
+        self.folded = 0
+        self.folding = False
+        self.touched_at = time.monotonic()
+
+
+class SessionStore:
+    """Thread-safe bounded session store with idle TTL and LRU eviction"""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl=SESSION_TTL,
+                 summary_trigger=SESSION_SUMMARY_TRIGGER, keep_recent=SESSION_KEEP_RECENT):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.summary_trigger = summary_trigger
+        self.keep_recent = keep_recent
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get_or_create(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touched_at = now
+            return session
+
+    def snapshot(self, session):
+        """(summary, turns copy) for building a prompt"""
+        with self._lock:
+            return session.summary, list(session.turns)
+
+    def append_turn(self, session, user_message, assistant_message):
+        with self._lock:
+            session.turns.append({"role": "user", "content": user_message})
+            session.turns.append({"role": "assistant", "content": assistant_message})
+            session.touched_at = time.monotonic()
+
+    def begin_fold(self, session):
+        """Reserve the oldest turns for summarization, or None if not needed / already running"""
+        with self._lock:
+            if session.folding or len(session.turns) <= self.summary_trigger:
+                return None
+            count = len(session.turns) - self.keep_recent
+            session.folding = True
+            return SummaryFold(session.summary, session.turns[:count])
+
+    def complete_fold(self, session, fold, summary):
+        """Replace the folded turns with the updated summary"""
+        with self._lock:
+            session.summary = summary[:SESSION_SUMMARY_MAX_CHARS]
+            del session.turns[:len(fold.turns)]
+            session.folded += len(fold.turns)
+            session.folding = False
+
+    def abort_fold(self, session):
+        with self._lock:
+            session.folding = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'evictions': self.evictions,
+            }
+
+    def _evict_expired(self, now):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched_at < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
+
+
+class SharedSessionStore(SessionStore):
+    """
+    SessionStore on a shared store: every change is an atomic update of the session's record
+
+    A ChatSession holds the record as last read, so snapshot() right after
+    get_or_create() costs nothing. A fold is leased for SESSION_FOLD_LEASE
+    seconds, so a worker that dies mid-fold does not block summaries forever.
+    Sessions expire after the idle TTL; there is no LRU bound.
+    """
+
+    namespace = 'session'
+
+    def __init__(self, shared, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = shared
+
+    def _update(self, session, fn):
+        def apply(record):
+            record = record or {'summary': '', 'turns': [], 'folded': 0, 'foldingUntil': 0}
+            fn(record)
+            return record
+        record = self.shared.update(self.namespace, session.id, apply, self.ttl)
+        with self._lock:
+            session.summary = record['summary']
+            session.turns = record['turns']
+            session.folded = record['folded']
+            session.folding = record['foldingUntil'] > time.time()
+            session.touched_at = time.monotonic()
+        return record
+
+    def get_or_create(self, session_id):
+        session = ChatSession(session_id)
+        # An empty update still refreshes the idle TTL
+        self._update(session, lambda record: None)
+        return session
+
+    def append_turn(self, session, user_message, assistant_message):
+        self._update(session, lambda record: record['turns'].extend([
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message},
+        ]))
+
+    def begin_fold(self, session):
+        fold = []
+
+        def begin(record):
+            # Cleared first: an optimistic backend may run this more than once
+            fold.clear()
+            if record['foldingUntil'] > time.time() or len(record['turns']) <= self.summary_trigger:
+                return
+            count = len(record['turns']) - self.keep_recent
+            record['foldingUntil'] = time.time() + SESSION_FOLD_LEASE
+            fold.append(SummaryFold(record['summary'], record['turns'][:count]))
+        self._update(session, begin)
+        return fold[0] if fold else None
+
+    def complete_fold(self, session, fold, summary):
+        def complete(record):
+            # Turns are only ever appended, so the folded ones are still at the front
+            record['summary'] = summary[:SESSION_SUMMARY_MAX_CHARS]
+            del record['turns'][:len(fold.turns)]
+            record['folded'] += len(fold.turns)
+            record['foldingUntil'] = 0
+        self._update(session, complete)
+
+    def abort_fold(self, session):
+        self._update(session, lambda record: record.update(foldingUntil=0))
+
+    def stats(self):
+        return {
+            'shared': self.shared.name,
+        }
@@ -0,0 +1,282 @@
+"""
+Cross-process shared state for multi-worker serving
+Behind a pre-fork server (gunicorn.conf.py) every in-process cache, session
+store and rate limiter would exist once per worker and drift apart: a session
+continued on another worker loses its history, every worker warms its own
+caches and each one grants the full rate limit. SHARED_STATE_URL points them
+at one store instead:
+- sqlite:////var/lib/goodkid/state.db: a SQLite file in WAL mode, shared by
+  the workers on one machine with no extra service
+- redis://host:6379/0: Redis (pip install redis), also shared across machines
+Unset, everything stays in-process.
+
+The store has three primitives: JSON values with a TTL per (namespace, key),
+an atomic read-modify-write of one value (update), and an append-only feed
+per channel that workers tail to replicate what cannot be looked up by key
+(the near-duplicate index). Connections are opened per process on first use,
+so a store created before the fork is safe in every worker.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_URL = os.getenv('SHARED_STATE_URL')
+# Feed entries kept per channel by the Redis backend (SQLite keeps them until they expire)
+SHARED_FEED_MAX_LEN = int(os.getenv('SHARED_FEED_MAX_LEN', 100000))
+
+# URL schemes served by the Redis backend; anything else is a SQLite file
+REDIS_SCHEMES = ('redis://', 'rediss://', 'unix://')
+
+# Expired rows are deleted from the SQLite file at most this often (seconds)
+PRUNE_INTERVAL = 60
+# Feed entries returned per read
+FEED_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at);
+CREATE TABLE IF NOT EXISTS feed (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feed_channel ON feed (channel, seq);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class SQLiteState:
+    """Shared state in one SQLite file (WAL mode) for the processes of one machine"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self.errors = 0
+
+    def _connect(self):
+        # Called with the lock held. A connection inherited across fork must not be used
+        if self._pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA busy_timeout=5000')
+            db.executescript(SCHEMA)
+            self._db, self._pid = db, os.getpid()
+        return self._db
+
+    def get(self, namespace, key):
+        """The value for (namespace, key), or None if missing or expired"""
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?',
+                (namespace, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl):
+        with self._lock:
+            db = self._connect()
+            db.execute('INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                       (namespace, key, _dumps(value), time.time() + ttl))
+            self._prune(db)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._connect().execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def update(self, namespace, key, fn, ttl):
+        """
+        Atomically replace the value with fn(current value or None); returns the new value
+
+        fn returning None deletes the key. The write lock is taken before the
+        read, so concurrent updates from other processes wait their turn.
+        """
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute(
+                    'SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?',
+                    (namespace, key, time.time())
+                ).fetchone()
+                value = fn(json.loads(row[0]) if row else None)
+                if value is None:
+                    db.execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+                else:
+                    db.execute('INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                               (namespace, key, _dumps(value), time.time() + ttl))
+            self._prune(db)
+        return value
+
+    def publish(self, channel, value, ttl):
+        """Append value to a channel's feed; readers see it until it expires"""
+        with self._lock:
+            db = self._connect()
+            db.execute('INSERT INTO feed (channel, value, expires_at) VALUES (?, ?, ?)',
+                       (channel, _dumps(value), time.time() + ttl))
+            self._prune(db)
+
+    def read(self, channel, cursor=None):
+        """([(value, expires_at wall-clock)], cursor) of unexpired feed entries after cursor"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT seq, value, expires_at FROM feed WHERE channel = ? AND seq > ? AND expires_at > ? '
+                'ORDER BY seq LIMIT ?', (channel, cursor or 0, time.time(), FEED_BATCH)
+            ).fetchall()
+        if not rows:
+            return [], cursor
+        return [(json.loads(value), expires_at) for _, value, expires_at in rows], rows[-1][0]
+
+    def stats(self):
+        return {'backend': self.name, 'path': self.path, 'errors': self.errors}
+
+    def _prune(self, db):
+        """Delete expired rows (at most every PRUNE_INTERVAL seconds per process)"""
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        cutoff = time.time()
+        db.execute('DELETE FROM kv WHERE expires_at < ?', (cutoff,))
+        db.execute('DELETE FROM feed WHERE expires_at < ?', (cutoff,))
+
+
+class RedisState:
+    """Shared state in Redis; redis-py reconnects by itself after a fork"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='goodkid'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("Redis shared state needs the redis package. Run: pip install redis")
+        self._redis = redis
+        self._client = redis.Redis.from_url(url)
+        self.url = url
+        self.prefix = prefix
+        self.errors = 0
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def get(self, namespace, key):
+        raw = self._client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace, key, value, ttl):
+        self._client.set(self._key(namespace, key), _dumps(value), px=max(1, int(ttl * 1000)))
+
+    def delete(self, namespace, key):
+        self._client.delete(self._key(namespace, key))
+
+    def update(self, namespace, key, fn, ttl):
+        """Optimistic read-modify-write (WATCH / MULTI), retried when another writer got there first"""
+        name = self._key(namespace, key)
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(name)
+                    raw = pipe.get(name)
+                    value = fn(json.loads(raw) if raw is not None else None)
+                    pipe.multi()
+                    if value is None:
+                        pipe.delete(name)
+                    else:
+                        pipe.set(name, _dumps(value), px=max(1, int(ttl * 1000)))
+                    pipe.execute()
+                    return value
+                except self._redis.WatchError:
+                    continue
+
+    def publish(self, channel, value, ttl):
+        self._client.xadd(self._key('feed', channel),
+                          {'value': _dumps(value), 'expires_at': repr(time.time() + ttl)},
+                          maxlen=SHARED_FEED_MAX_LEN, approximate=True)
+
+    def read(self, channel, cursor=None):
+        # "(" makes the range start exclusive (Redis 6.2+)
+        entries = self._client.xrange(self._key('feed', channel), min=f"({cursor}" if cursor else '-',
+                                      count=FEED_BATCH)
+        if not entries:
+            return [], cursor
+        now = time.time()
+        items = []
+        for _, fields in entries:
+            expires_at = float(fields[b'expires_at'])
+            if expires_at > now:
+                items.append((json.loads(fields[b'value']), expires_at))
+        return items, entries[-1][0].decode()
+
+    def stats(self):
+        return {'backend': self.name, 'url': self.url.split('@')[-1], 'errors': self.errors}
+
+
+_process = (None, None)
+
+
+def process_id():
+    """Random id of this process, new after every fork (pids can be reused)"""
+    global _process
+    pid = os.getpid()
+    if _process[0] != pid:
+        _process = (pid, uuid.uuid4().hex[:12])
+    return _process[1]
+
+
+def failed(store, action, error):
+    """Count and log a shared-state failure the caller recovers from (cache miss, fail open)"""
+    store.errors += 1
+    logger.warning(f"Shared state {action} failed ({store.name}): {error}")
+
+
+async def run_blocking(store, fn, *args):
+    """Await fn(*args) from a coroutine, in a worker thread when it may do shared-store I/O"""
+    if store is None:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+def sqlite_path(url):
+    """File path of a sqlite:/// URL (or a bare path), else None"""
+    if not url or url.startswith(REDIS_SCHEMES):
+        return None
+    return url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+
+
+def open_state(url=SHARED_STATE_URL):
+    """Shared store for a SHARED_STATE_URL, or None for in-process state"""
+    if not url:
+        return None
+    if url.startswith(REDIS_SCHEMES):
+        store = RedisState(url)
+    else:
+        store = SQLiteState(sqlite_path(url))
+    logger.info(f"Shared state: {store.name} ({url.split('@')[-1]})")
+    return store
+
+
+shared_state = open_state()
@@ -0,0 +1,328 @@
+"""
+Request coalescing and idempotency keys
+Concurrent identical upstream calls share one flight, so a retry that arrives
+while the first call is still running waits for its result instead of paying
+for a second completion. Completed responses for an Idempotency-Key are kept
+for a short window and replayed to later retries. With a shared store
+(shared_state.py) stored responses are replayed by every worker; coalescing
+of calls still in flight stays per process.
+"""
+
+from collections import OrderedDict, namedtuple
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from shared_state import failed, run_blocking
+
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 300))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', 10000))
+
+IDEMPOTENCY_KEY_RE = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+# A finished HTTP response that can be replayed: body bytes, status code, header list
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'body', 'status', 'headers'])
+
+
+def is_valid_idempotency_key(key):
+    return bool(IDEMPOTENCY_KEY_RE.match(key))
+
+
+def request_fingerprint(data):
+    """Hash of the request body, so a reused key with a different payload is detected"""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based call coalescing: one caller per key runs fn, the rest wait for it"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.flights = 0
+        self.coalesced = 0
+        # Callers currently waiting on another caller's flight
+        self.waiting = 0
+
+    def do(self, key, fn):
+        """Return (result, shared); re-raises the leader's exception in every waiter"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                self.waiting += 1
+                leader = False
+            else:
+                call = _Call(threading.Event())
+                self._calls[key] = call
+                self.flights += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                self.waiting -= 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'inFlight': len(self._calls),
+                'waiting': self.waiting,
+                'flights': self.flights,
+                'coalesced': self.coalesced,
+            }
+
+
+class _Flight:
+    __slots__ = ('task', 'callers')
+
+    def __init__(self, task):
+        self.task = task
+        self.callers = 0
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight (one event loop)
+
+    fn runs in its own task that every caller awaits through asyncio.shield,
+    so a caller being cancelled (a client disconnecting) never cancels the
+    call for the others. The task is cancelled once no callers are left.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.flights = 0
+        self.coalesced = 0
+        # Callers currently waiting on another caller's flight
+        self.waiting = 0
+
+    async def do(self, key, fn):
+        """Await fn() once per key; concurrent callers share the result. Returns (result, shared)"""
+        flight = self._calls.get(key)
+        shared = flight is not None
+        if shared:
+            self.coalesced += 1
+            self.waiting += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._calls[key] = flight
+            self.flights += 1
+            flight.task.add_done_callback(functools.partial(self._finished, key, flight))
+        flight.callers += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.callers -= 1
+            if shared:
+                self.waiting -= 1
+            if flight.callers == 0 and not flight.task.done():
+                # Every caller went away; later callers start a new flight
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+
+    def _finished(self, key, flight, task):
+        self._forget(key, flight)
+        if not task.cancelled():
+            # Mark retrieved so a flight without callers does not log "exception never retrieved"
+            task.exception()
+
+    def stats(self):
+        return {
+            'inFlight': len(self._calls),
+            'waiting': self.waiting,
+            'flights': self.flights,
+            'coalesced': self.coalesced,
+        }
+
+
+class IdempotencyStore:
+    """Bounded TTL map of Idempotency-Key -> StoredResponse"""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES, shared=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (expires_at, StoredResponse)
+        self._lock = threading.Lock()
+        self.replays = 0
+        self.conflicts = 0
+
+    def get(self, key, fingerprint):
+        """Return (stored, conflict): the stored response for key, or conflict=True if the payload differs"""
+        if self.shared is not None:
+            stored = self._shared_get(key)
+            if stored is None:
+                return None, False
+        else:
+            now = time.monotonic()
+            with self._lock:
+                item = self._entries.get(key)
+                if item is None:
+                    return None, False
+                expires_at, stored = item
+                if expires_at <= now:
+                    del self._entries[key]
+                    return None, False
+        with self._lock:
+            if stored.fingerprint != fingerprint:
+                self.conflicts += 1
+                return None, True
+            self.replays += 1
+            return stored, False
+
+    def set(self, key, stored):
+        if self.shared is not None:
+            try:
+                self.shared.set('idempotency', key, {
+                    'fingerprint': stored.fingerprint,
+                    'body': base64.b64encode(stored.body).decode('ascii'),
+                    'status': stored.status,
+                    'headers': stored.headers,
+                }, self.ttl)
+            except Exception as e:
+                failed(self.shared, 'idempotency set', e)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _shared_get(self, key):
+        try:
+            item = self.shared.get('idempotency', key)
+        except Exception as e:
+            failed(self.shared, 'idempotency get', e)
+            return None
+        if item is None:
+            return None
+        return StoredResponse(item['fingerprint'], base64.b64decode(item['body']), item['status'],
+                              [tuple(header) for header in item['headers']])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'replays': self.replays,
+                'conflicts': self.conflicts,
+            }
+
+
+def storable(response):
+    """Whether a view response may be kept for replay"""
+    return response.status_code < 500 and 'no-store' not in response.headers.get('Cache-Control', '')
+
+
+def flask_idempotent(store, flights):
+    """
+    Decorator for Flask POST views honouring an optional Idempotency-Key header
+
+    The first request with a key runs the view; concurrent retries wait for it,
+    later retries within the TTL get the stored response with
+    Idempotent-Replayed: true. Reusing a key with another payload is a 422.
+    5xx and Cache-Control: no-store responses (degraded answers) are not
+    stored, so a failed call can be retried.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import Response, jsonify, make_response, request
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view(*args, **kwargs)
+            if not is_valid_idempotency_key(key):
+                return jsonify({'error': 'Idempotency-Key must be 1-255 printable ASCII characters'}), 400
+            fingerprint = request_fingerprint(request.get_json(silent=True))
+            stored, conflict = store.get(key, fingerprint)
+            if conflict:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request body'}), 422
+            replayed = stored is not None
+            if stored is None:
+                def run():
+                    response = make_response(view(*args, **kwargs))
+                    result = StoredResponse(
+                        fingerprint,
+                        response.get_data(),
+                        response.status_code,
+                        [(k, v) for k, v in response.headers.items() if k.lower() != 'content-length'],
+                    )
+                    if storable(response):
+                        store.set(key, result)
+                    return result
+                stored, replayed = flights.do((key, fingerprint), run)
+            response = Response(stored.body, status=stored.status, headers=stored.headers)
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        return wrapper
+    return decorator
+
+
+def quart_idempotent(store, flights):
+    """Async counterpart of flask_idempotent for Quart views (flights is an AsyncSingleFlight)"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            from quart import Response, jsonify, make_response, request
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return await view(*args, **kwargs)
+            if not is_valid_idempotency_key(key):
+                return jsonify({'error': 'Idempotency-Key must be 1-255 printable ASCII characters'}), 400
+            fingerprint = request_fingerprint(await request.get_json(silent=True))
+            stored, conflict = await run_blocking(store.shared, store.get, key, fingerprint)
+            if conflict:
+                return jsonify({'error': 'Idempotency-Key was already used with a different request body'}), 422
+            replayed = stored is not None
+            if stored is None:
+                async def run():
+                    response = await make_response(await view(*args, **kwargs))
+                    result = StoredResponse(
+                        fingerprint,
+                        await response.get_data(),
+                        response.status_code,
+                        [(k, v) for k, v in response.headers.items() if k.lower() != 'content-length'],
+                    )
+                    if storable(response):
+                        await run_blocking(store.shared, store.set, key, result)
+                    return result
+                stored, replayed = await flights.do((key, fingerprint), run)
+            response = Response(stored.body, status=stored.status, headers=stored.headers)
+            if replayed:
+                response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        return wrapper
+    return decorator
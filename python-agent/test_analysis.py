@@ -0,0 +1,107 @@
+"""
+/analyze input validation and answer parsing (analysis.py)
+Run: python -m pytest test_analysis.py
+"""
+
+import json
+
+import pytest
+
+from analysis import ANALYSIS_SCHEMA, InvalidAnalysis, Target, parse_analysis, parse_target, schema_errors
+
+# EIP-55 test vector
+CHECKSUMMED = '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed'
+
+
+def document(**overrides):
+    doc = {
+        'summary': 'Established token.',
+        'category': 'large',
+        'score': 85,
+        'riskLevel': 'low',
+        'keyFindings': ['Audited'],
+        'scamFlags': [],
+    }
+    doc.update(overrides)
+    return doc
+
+
+def test_address_is_checksummed():
+    target, error = parse_target({'chain': ' Base ', 'address': CHECKSUMMED.lower()})
+    assert error is None
+    assert target == Target('base', CHECKSUMMED, None, 'id')
+
+
+def test_wrong_checksum_is_rejected():
+    typo = CHECKSUMMED[:-1] + 'D'
+    assert parse_target({'chain': 'base', 'address': typo}) == (
+        None, {'error': 'address has an invalid EIP-55 checksum'})
+
+
+@pytest.mark.parametrize('data, error', [
+    (None, 'JSON body with chain and address or project is required'),
+    ({'project': 'pepe', 'address': CHECKSUMMED}, 'Send either address or project'),
+    ({'address': CHECKSUMMED}, 'chain is required with an address'),
+    ({'chain': 'base', 'address': '0x1234'}, 'address must be a 0x-prefixed 40-character hex string'),
+    ({'project': '   '}, 'project must be 1-100 characters'),
+    ({'project': 'pepe', 'chain': ['base']}, 'chain must be a string'),
+    ({'project': 'pepe', 'chain': 8453}, 'chain must be a string'),
+    ({'project': 'pepe', 'lang': ['id']}, "lang must be one of ['id', 'en']"),
+    ({'project': 'pepe', 'lang': {'id': 1}}, "lang must be one of ['id', 'en']"),
+    ({'project': 'pepe', 'lang': 'fr'}, "lang must be one of ['id', 'en']"),
+])
+def test_invalid_targets(data, error):
+    target, result = parse_target(data)
+    assert target is None
+    assert result['error'] == error
+
+
+def test_project_whitespace_is_collapsed():
+    target, error = parse_target({'project': '  Pepe \n Coin ', 'lang': 'en'})
+    assert error is None
+    assert target == Target(None, None, 'Pepe Coin', 'en')
+
+
+def test_valid_document_has_no_errors():
+    assert schema_errors(document(), ANALYSIS_SCHEMA) == []
+
+
+@pytest.mark.parametrize('overrides, error', [
+    ({'score': True}, '$.score: expected integer or null'),
+    ({'score': 101}, '$.score: 101 is out of range'),
+    ({'category': 'nft'}, "$.category: 'nft' is not one of"),
+    ({'scamFlags': ['honeypot', 'honeypot']}, '$.scamFlags: items are not unique'),
+    ({'scamFlags': ['rugged']}, "$.scamFlags[0]: 'rugged' is not one of"),
+    ({'keyFindings': ['x'] * 9}, '$.keyFindings: more than 8 items'),
+    ({'extra': 1}, '$: unexpected extra'),
+])
+def test_schema_violations(overrides, error):
+    errors = schema_errors(document(**overrides), ANALYSIS_SCHEMA)
+    assert any(e.startswith(error) for e in errors), errors
+
+
+def test_missing_field():
+    doc = document()
+    del doc['riskLevel']
+    assert schema_errors(doc, ANALYSIS_SCHEMA) == ['$: missing riskLevel']
+
+
+def test_code_fences_are_stripped():
+    assert parse_analysis('```json\n' + json.dumps(document()) + '\n```')['riskLevel'] == 'low'
+
+
+@pytest.mark.parametrize('text', ['not json', json.dumps(document(score='high'))])
+def test_invalid_answers_raise(text):
+    with pytest.raises(InvalidAnalysis):
+        parse_analysis(text)
+
+
+@pytest.mark.parametrize('overrides, level', [
+    ({'score': 70, 'riskLevel': 'low'}, 'medium'),
+    ({'score': 40, 'riskLevel': 'medium'}, 'high'),
+    ({'score': 90, 'riskLevel': 'high'}, 'high'),
+    ({'score': None, 'riskLevel': 'low'}, 'low'),
+    ({'score': 90, 'riskLevel': 'low', 'scamFlags': ['honeypot']}, 'high'),
+])
+def test_risk_level_floor(overrides, level):
+    assert parse_analysis(json.dumps(document(**overrides)))['riskLevel'] == level
@@ -0,0 +1,110 @@
+"""
+On-chain prefetch against fake_rpc.py: batch parsing, selector-based
+privileged functions, the EIP-1967 proxy slot and the timeout fallback
+Run: python -m pytest test_onchain.py
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import onchain
+from evm_utils import to_checksum_address
+from fake_llm import LatencyProfile
+from fake_rpc import FakeRPCServer
+from onchain import ZERO_ADDRESS, OnChainContext, render_facts
+
+MINTABLE = '0x4200000000000000000000000000000000000A11'
+RENOUNCED = '0x4200000000000000000000000000000000000b0b'
+PROXY = '0x4200000000000000000000000000000000000c0C'
+WALLET = '0x9f3a5b2c7d1e4f60718293a4b5c6d7e8f9012345'
+
+
+@pytest.fixture(scope='module')
+def node():
+    return FakeRPCServer(LatencyProfile(ttft_ms=5, dist='fixed')).start()
+
+
+@pytest.fixture(scope='module')
+def slow_node():
+    return FakeRPCServer(LatencyProfile(ttft_ms=2000, dist='fixed')).start()
+
+
+def context(server, **kwargs):
+    return OnChainContext({'base': server.url('base'), 'ethereum': server.url('ethereum')}, **kwargs)
+
+
+def lookup(ctx, addresses, chains=('base',)):
+    return asyncio.run(ctx.lookup_async(ctx.targets(addresses, chains)))
+
+
+def test_contract_reads_come_back_from_one_batch(node):
+    ctx = context(node)
+    [facts] = lookup(ctx, [MINTABLE])
+    assert facts['contract'] and facts['codeSize'] > 0
+    assert (facts['name'], facts['symbol'], facts['decimals']) == ('Moon Pepe', 'MPEPE', 18)
+    assert facts['totalSupply'] == str(420_690_000_000 * 10 ** 18)
+    assert facts['owner'] == to_checksum_address(WALLET)
+    assert facts['functions'] == ['mint', 'pause']
+    assert 'implementation' not in facts
+    assert ctx.stats()['batches'] == 1
+
+
+def test_results_are_matched_to_calls_across_batches(node, monkeypatch):
+    monkeypatch.setattr(onchain, 'RPC_BATCH_SIZE', 5)
+    ctx = context(node)
+    facts = lookup(ctx, [MINTABLE, RENOUNCED, PROXY])
+    assert [f['symbol'] for f in facts] == ['MPEPE', 'BCAT', 'bUSD']
+    assert [f['decimals'] for f in facts] == [18, 9, 6]
+    # 3 addresses x 7 reads in batches of 5
+    assert ctx.stats()['batches'] == 5
+
+
+def test_renounced_owner_and_no_privileged_functions(node):
+    [facts] = lookup(context(node), [RENOUNCED])
+    assert facts['owner'] == ZERO_ADDRESS
+    assert facts['functions'] == []
+    assert 'owner renounced (zero address)' in render_facts([facts])
+
+
+def test_proxy_implementation_slot(node):
+    [facts] = lookup(context(node), [PROXY])
+    implementation = to_checksum_address('0x4200000000000000000000000000000000000d0d')
+    assert facts['implementation'] == implementation
+    assert facts['functions'] == ['upgrade']
+    assert 'owner' not in facts
+    text = render_facts([facts])
+    assert f'upgradeable proxy (EIP-1967) to {implementation}' in text
+    assert 'no owner() function' in text
+
+
+def test_eoa_has_no_contract_facts(node):
+    facts = lookup(context(node), [WALLET], chains=())
+    assert [(f['chain'], f['contract']) for f in facts] == [('base', False), ('ethereum', False)]
+    text = render_facts(facts)
+    assert 'no contract code on Base Chain, Ethereum Mainnet' in text
+
+
+def test_facts_are_cached(node):
+    ctx = context(node)
+    lookup(ctx, [MINTABLE])
+    lookup(ctx, [MINTABLE])
+    assert ctx.stats()['batches'] == 1
+
+
+def test_sync_lookup(node):
+    ctx = context(node)
+    targets = ctx.targets([MINTABLE], ['base'])
+    [facts] = ctx.lookup(targets, lambda coro, timeout: asyncio.run(coro))
+    assert facts['symbol'] == 'MPEPE'
+
+
+def test_slow_node_times_out_without_facts(slow_node):
+    ctx = context(slow_node, timeout=0.2)
+    started = time.perf_counter()
+    assert lookup(ctx, [MINTABLE]) == []
+    assert time.perf_counter() - started < 1.0
+    stats = ctx.stats()
+    assert (stats['timeouts'], stats['errors']) == (1, 0)
+    assert render_facts([]) is None
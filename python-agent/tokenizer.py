@@ -0,0 +1,49 @@
+"""
+Local token counting
+Uses tiktoken's o200k_base encoding (gpt-4o family) when installed, otherwise a
+~4 characters per token estimate. Never calls the network at request time.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Chat format overhead per message and per request (OpenAI cookbook values)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """Load the tiktoken encoding once; None if tiktoken is unavailable"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding('o200k_base')
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Number of tokens in a string"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return max(1, (len(text) + 3) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    """Prompt tokens for a chat-completions messages array"""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m.get('content') or '') for m in messages) + TOKENS_PER_REPLY
@@ -0,0 +1,230 @@
+"""
+TTL cache for the ADK sub-agent tools
+Popular tokens and protocols are searched and fetched again and again across
+users, each time paying a sub-agent LLM call plus the external fetch. CachedTool
+wraps a tool (the search and URL-context AgentTools) and reuses its answers:
+- keyed by the normalized query (search) or the normalized URLs (URL context)
+- a TTL per tool, and one LRU bound (TOOL_CACHE_MAX_ENTRIES) across tools
+- stale-while-revalidate: for TOOL_CACHE_STALE seconds after the TTL an entry
+  is still served while a single background call refreshes it
+- identical calls in flight share one run
+Empty answers and errors are not cached. With a shared store
+(shared_state.py) answers are also written there and a local miss is looked up
+in it, so workers reuse each other's tool calls.
+"""
+
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import asyncio
+import logging
+import os
+import re
+import time
+
+from google.adk.tools.base_tool import BaseTool
+
+from shared_state import failed, shared_state
+
+logger = logging.getLogger(__name__)
+
+TOOL_CACHE_ENABLED = os.getenv('TOOL_CACHE_ENABLED', 'true').lower() == 'true'
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv('TOOL_CACHE_MAX_ENTRIES', 500))
+TOOL_CACHE_SEARCH_TTL = float(os.getenv('TOOL_CACHE_SEARCH_TTL', 900))
+TOOL_CACHE_URL_TTL = float(os.getenv('TOOL_CACHE_URL_TTL', 3600))
+TOOL_CACHE_STALE = float(os.getenv('TOOL_CACHE_STALE', 600))
+
+URL_RE = re.compile(r'https?://[^\s<>"\'()\[\]]+', re.IGNORECASE)
+TRACKING_PARAMS = {'fbclid', 'gclid', 'ref', 'ref_src'}
+
+
+def normalize_query(text):
+    """Lowercased query with whitespace collapsed and trailing punctuation dropped"""
+    return ' '.join(text.lower().split()).strip(' ?!.')
+
+
+def normalize_url(url):
+    """Canonical URL: lowercase host without www., no fragment or tracking params, sorted query"""
+    parts = urlsplit(url.rstrip('.,;:'))
+    host = (parts.hostname or '').removeprefix('www.')
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip('/') or '/'
+    return f"{parts.scheme.lower()}://{host}{path}" + (f"?{urlencode(query)}" if query else '')
+
+
+def _request_text(args):
+    # AgentTool passes the model's request as {'request': ...}
+    text = (args or {}).get('request')
+    return text if isinstance(text, str) and text.strip() else None
+
+
+def search_key(args):
+    text = _request_text(args)
+    return normalize_query(text) if text else None
+
+
+def url_key(args):
+    """The set of URLs in the request, else the normalized request"""
+    text = _request_text(args)
+    if not text:
+        return None
+    urls = sorted({normalize_url(u) for u in URL_RE.findall(text)})
+    return ' '.join(urls) if urls else normalize_query(text)
+
+
+class ToolCache:
+    """LRU of tool answers with fresh / stale deadlines; used from one event loop"""
+
+    def __init__(self, max_entries=TOOL_CACHE_MAX_ENTRIES, stale=TOOL_CACHE_STALE, shared=None):
+        self.max_entries = max_entries
+        self.stale = stale
+        self.shared = shared
+        self._entries = OrderedDict()  # (tool, key) -> (value, fresh_until, stale_until)
+        self._flights = {}
+        self.hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    async def get(self, tool, key, ttl, call):
+        """Cached answer for (tool, key), else the result of call() (shared by concurrent callers)"""
+        cache_key = (tool, key)
+        entry = self._entries.get(cache_key)
+        if entry is None and self.shared is not None and cache_key not in self._flights:
+            entry = await self._shared_get(cache_key)
+        now = time.monotonic()
+        if entry is not None:
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                self.hits += 1
+                self._entries.move_to_end(cache_key)
+                return value
+            if now < stale_until:
+                self.stale_hits += 1
+                if cache_key not in self._flights:
+                    self.refreshes += 1
+                    self._start(cache_key, ttl, call)
+                return value
+            del self._entries[cache_key]
+        if cache_key in self._flights:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        # shield: a caller cancelled at its deadline must not cancel the call others share
+        return await asyncio.shield(self._start(cache_key, ttl, call))
+
+    def _start(self, cache_key, ttl, call):
+        task = self._flights.get(cache_key)
+        if task is None:
+            task = self._flights[cache_key] = asyncio.ensure_future(self._fill(cache_key, ttl, call))
+            task.add_done_callback(lambda t: self._done(cache_key, t))
+        return task
+
+    def _done(self, cache_key, task):
+        self._flights.pop(cache_key, None)
+        # Background refreshes have no awaiting caller; their errors were logged in _fill
+        if not task.cancelled():
+            task.exception()
+
+    async def _fill(self, cache_key, ttl, call):
+        try:
+            value = await call()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Tool {cache_key[0]} failed for {cache_key[1][:80]!r}: {e}")
+            raise
+        if value:
+            now = time.monotonic()
+            self._store(cache_key, (value, now + ttl, now + ttl + self.stale))
+            if self.shared is not None:
+                wall = time.time()
+                item = {'value': value, 'freshUntil': wall + ttl, 'staleUntil': wall + ttl + self.stale}
+                try:
+                    await asyncio.to_thread(self.shared.set, 'tool', self._shared_key(cache_key), item,
+                                            ttl + self.stale)
+                except Exception as e:
+                    failed(self.shared, 'tool cache set', e)
+        return value
+
+    def _store(self, cache_key, entry):
+        self._entries[cache_key] = entry
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _shared_key(self, cache_key):
+        return f"{cache_key[0]}:{cache_key[1]}"
+
+    async def _shared_get(self, cache_key):
+        """Entry another worker stored, copied into this cache; None if there is none"""
+        try:
+            # In a thread: the store may be a network round trip and this is the agent's event loop
+            item = await asyncio.to_thread(self.shared.get, 'tool', self._shared_key(cache_key))
+        except Exception as e:
+            failed(self.shared, 'tool cache get', e)
+            return None
+        if item is None:
+            return None
+        offset = time.time() - time.monotonic()
+        entry = (item['value'], item['freshUntil'] - offset, item['staleUntil'] - offset)
+        self._store(cache_key, entry)
+        self.shared_hits += 1
+        return entry
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'sharedHits': self.shared_hits,
+            'staleHits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+            'hitRate': round((self.hits + self.stale_hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+tool_cache = ToolCache(shared=shared_state)
+
+
+class CachedTool(BaseTool):
+    """A tool whose answers are cached by key(args) for ttl seconds (key None = not cached)"""
+
+    def __init__(self, tool, key, ttl, cache=tool_cache):
+        super().__init__(name=tool.name, description=tool.description)
+        self.tool = tool
+        self.key = key
+        self.ttl = ttl
+        self.cache = cache
+
+    @property
+    def agent(self):
+        """The wrapped AgentTool's sub-agent (None for plain tools)"""
+        return getattr(self.tool, 'agent', None)
+
+    def _get_declaration(self):
+        return self.tool._get_declaration()
+
+    async def run_async(self, *, args, tool_context):
+        key = self.key(args)
+        if key is None:
+            return await self.tool.run_async(args=args, tool_context=tool_context)
+        # A stale-while-revalidate refresh may outlive the turn that started it; the
+        # wrapped tool then writes to that finished turn's context, which is harmless
+        return await self.cache.get(
+            self.name, key, self.ttl, lambda: self.tool.run_async(args=args, tool_context=tool_context)
+        )
+
+
+def cache_tool(tool, key, ttl):
+    """tool wrapped in CachedTool, or unchanged with TOOL_CACHE_ENABLED=false"""
+    return CachedTool(tool, key, ttl) if TOOL_CACHE_ENABLED else tool
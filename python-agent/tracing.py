@@ -0,0 +1,325 @@
+"""
+Per-stage request tracing
+Handlers mark each stage of a request (parsing, routing, prompt assembly,
+cache lookup, upstream call, ...) on a per-request Trace; each stage runs
+until the next one starts or the response is built. The stages
+are returned in a Server-Timing header, so the Next.js proxy and browser dev
+tools can attribute latency without a profiler. They can also be exported as
+OpenTelemetry spans (OTLP/JSON):
+- TRACE_EXPORT_FILE: one OTLP/JSON document per line, as read by the
+  collector's otlpjsonfile receiver
+- TRACE_EXPORT_URL (or OTEL_EXPORTER_OTLP_TRACES_ENDPOINT): an OTLP/HTTP
+  collector, e.g. http://localhost:4318/v1/traces
+Export runs on a background thread with a bounded queue and never blocks a
+request; an incoming W3C traceparent header joins the caller's trace.
+"""
+
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE')
+TRACE_EXPORT_URL = os.getenv('TRACE_EXPORT_URL') or os.getenv('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'goodkid-agent')
+
+EXPORT_QUEUE_SIZE = 2000
+EXPORT_BATCH_SIZE = 100
+EXPORT_INTERVAL = 1.0
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _random_id(nbytes):
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'start', 'end', 'attributes')
+
+    def __init__(self, name, start, end=None, attributes=None):
+        self.name = name
+        self.span_id = _random_id(8)
+        self.start = start
+        self.end = end
+        self.attributes = attributes or {}
+
+    @property
+    def duration_ms(self):
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    """Stage spans of one request, timed with perf_counter and anchored to wall-clock time"""
+
+    def __init__(self, name, traceparent=None):
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+        self.ended = None
+        self.spans = []
+        self._current = None
+        self.attributes = {}
+        self.error = None
+        self.trace_id = None
+        self.parent_id = None
+        match = TRACEPARENT_RE.match(traceparent or '')
+        if match:
+            self.trace_id, self.parent_id = match.group(1), match.group(2)
+        else:
+            self.trace_id = _random_id(16)
+        self.span_id = _random_id(8)
+
+    def stage(self, name, **attributes):
+        """End the current stage (if any) and start the next; returns its Span"""
+        now = time.perf_counter()
+        if self._current is not None:
+            self._current.end = now
+        self._current = Span(name, now, attributes=attributes)
+        self.spans.append(self._current)
+        return self._current
+
+    def end_stage(self):
+        if self._current is not None:
+            self._current.end = time.perf_counter()
+            self._current = None
+
+    def record(self, name, start, end, **attributes):
+        """Add a span timed elsewhere (perf_counter values)"""
+        self.spans.append(Span(name, start, end, attributes))
+
+    def upstream(self, span, result, shared=False):
+        """Annotate an upstream stage with its provider and first-token time (Completion or LLMStream)"""
+        span.attributes.update(provider=result.provider, model=result.model, coalesced=shared)
+        # A coalesced caller only waited; the first-token time belongs to the leader's call
+        if not shared and result.ttft is not None:
+            self.record('upstream.first_token', span.start, span.start + result.ttft)
+
+    def server_timing(self):
+        """Server-Timing header value for the stages so far plus the total"""
+        entries = [f"{s.name};dur={s.duration_ms:.1f}" for s in self.spans]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(entries)
+
+    def timings(self):
+        """{stage: ms} for response bodies (streams cannot add headers once started)"""
+        result = {}
+        for span in self.spans:
+            result[span.name] = round(result.get(span.name, 0) + span.duration_ms, 1)
+        result['total'] = round((time.perf_counter() - self.started) * 1000, 1)
+        return result
+
+    def finish(self, status=None):
+        """End the request span and hand the trace to the exporter (once)"""
+        if self.ended is not None:
+            return
+        self.end_stage()
+        self.ended = time.perf_counter()
+        if status is not None:
+            self.attributes['http.status_code'] = status
+            if status >= 500 and self.error is None:
+                self.error = f"HTTP {status}"
+        exporter.submit(self)
+
+    def _ns(self, t):
+        return str(self.started_ns + int((t - self.started) * 1e9))
+
+    def to_otlp(self):
+        """OTLP/JSON spans: one SERVER span for the request, INTERNAL spans for its stages"""
+        root = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': SPAN_KIND_SERVER,
+            'startTimeUnixNano': self._ns(self.started),
+            'endTimeUnixNano': self._ns(self.ended),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {'code': STATUS_OK},
+        }
+        if self.parent_id:
+            root['parentSpanId'] = self.parent_id
+        spans = [root]
+        for span in self.spans:
+            spans.append({
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': self.span_id,
+                'name': span.name,
+                'kind': SPAN_KIND_INTERNAL,
+                'startTimeUnixNano': self._ns(span.start),
+                'endTimeUnixNano': self._ns(span.end if span.end is not None else self.ended),
+                'attributes': _otlp_attributes(span.attributes),
+            })
+        return spans
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def otlp_document(traces):
+    """OTLP/JSON ExportTraceServiceRequest for a batch of traces"""
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{
+                'scope': {'name': 'goodkid.tracing'},
+                'spans': [span for trace in traces for span in trace.to_otlp()],
+            }],
+        }],
+    }
+
+
+class SpanExporter:
+    """Background batch export of finished traces to a file and/or an OTLP/HTTP collector"""
+
+    def __init__(self, path=TRACE_EXPORT_FILE, url=TRACE_EXPORT_URL, sample_rate=TRACE_SAMPLE_RATE):
+        self.path = path
+        self.url = url
+        self.sample_rate = sample_rate
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.url)
+
+    def submit(self, trace):
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.export(batch)
+
+    def export(self, batch):
+        payload = json.dumps(otlp_document(batch), separators=(',', ':'))
+        try:
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(payload + '\n')
+            if self.url:
+                req = urllib.request.Request(
+                    self.url, data=payload.encode('utf-8'), headers={'Content-Type': 'application/json'}
+                )
+                urllib.request.urlopen(req, timeout=5).close()
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"Trace export failed ({len(batch)} traces): {e}")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'queued': self._queue.qsize(),
+        }
+
+
+exporter = SpanExporter()
+
+
+def _finish(trace, response):
+    trace.end_stage()
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = trace.server_timing()
+    response.headers["traceresponse"] = f"00-{trace.trace_id}-{trace.span_id}-01"
+
+
+def flask_traced(view):
+    """
+    Decorator for Flask views: a Trace in flask.g.trace, Server-Timing on the response
+
+    A streamed response only carries the stages finished before it started;
+    its trace is completed and exported when the response is closed.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import g, make_response, request
+        trace = g.trace = Trace(f"{request.method} {request.path}", request.headers.get('traceparent'))
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException as e:
+            trace.error = type(e).__name__
+            trace.finish(500)
+            raise
+        _finish(trace, response)
+        if response.is_streamed:
+            response.call_on_close(lambda: trace.finish(response.status_code))
+        else:
+            trace.finish(response.status_code)
+        return response
+    return wrapper
+
+
+def quart_traced(view):
+    """Async counterpart of flask_traced; a streaming view's body generator calls g.trace.finish()"""
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        from quart import g, make_response, request
+        trace = g.trace = Trace(f"{request.method} {request.path}", request.headers.get('traceparent'))
+        try:
+            response = await make_response(await view(*args, **kwargs))
+        except BaseException as e:
+            trace.error = type(e).__name__
+            trace.finish(500)
+            raise
+        _finish(trace, response)
+        if response.mimetype != 'text/event-stream':
+            trace.finish(response.status_code)
+        return response
+    return wrapper
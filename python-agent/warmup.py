@@ -0,0 +1,164 @@
+"""
+Start-up warm-up and readiness
+Cloud Run scales to zero, so the first request after an idle period pays for
+everything the process has not done yet: loading the tokenizer, assembling
+prompts, importing the model SDKs and building their clients, and the TCP/TLS
+handshake to the model API and the RPC nodes. The servers run that work as
+named warm-up stages as soon as they start, and only then report ready:
+- GET /ready is 503 until warm-up has finished, then 200 with the stage timings
+  (point the Cloud Run startup probe at it; /health stays the liveness check)
+- a failed stage is logged and reported but does not hold back readiness; the
+  first request that needs it pays the cost instead
+WARMUP_ENABLED=false skips the stages (ready at once), WARMUP_UPSTREAM=false
+skips opening upstream connections.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_UPSTREAM = os.getenv('WARMUP_UPSTREAM', 'true').lower() == 'true'
+# Seconds an upstream warm-up call may take before it is abandoned
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', 10))
+
+_IMPORTED = time.perf_counter()
+
+
+def process_age():
+    """Seconds since this process started (/proc on Linux, else since this module was imported)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime), counted after the parenthesised command name
+            start_ticks = float(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _IMPORTED
+
+
+def local_stages(include_whales=True, include_tools=False):
+    """Stages every server shares: tokenizer tables, intent router, prompt assembly"""
+    from intent_router import classify
+    from prompt_sections import warm_prompts
+    from tokenizer import count_tokens
+    return [
+        ('tokenizer', lambda: count_tokens('warm up')),
+        ('router', lambda: classify('is this token safe?')),
+        ('prompts', lambda: warm_prompts(include_whales, include_tools)),
+    ]
+
+
+def provider_stages(router, run=None, connect=WARMUP_UPSTREAM, timeout=WARMUP_TIMEOUT):
+    """
+    One stage per available upstream provider: build its client, open a connection
+
+    run(coro, timeout) drives the coroutine from a sync server (background_loop.run,
+    so clients are created on the loop that will use them); without it the stages
+    are coroutine functions for WarmUp.run_async.
+    """
+    stages = []
+    for provider in router.available():
+        if run is None:
+            fn = functools.partial(provider.warm_up, connect, timeout)
+        else:
+            fn = functools.partial(lambda p: run(p.warm_up(connect, timeout), timeout + 1), provider)
+        stages.append((f"llm.{provider.name}", fn))
+    return stages
+
+
+def onchain_stages(context, run=None, connect=WARMUP_UPSTREAM, timeout=WARMUP_TIMEOUT):
+    """The on-chain lookup's stage when RPC URLs are configured (run as in provider_stages)"""
+    if not context.enabled:
+        return []
+    if run is None:
+        return [('onchain', functools.partial(context.warm_up, connect, timeout))]
+    return [('onchain', lambda: run(context.warm_up(connect, timeout), timeout + 1))]
+
+
+class WarmUp:
+    """Runs a server's warm-up stages once and tracks readiness"""
+
+    def __init__(self, enabled=WARMUP_ENABLED):
+        self.enabled = enabled
+        self.stages = {}  # name -> ms
+        self.errors = {}  # name -> error message
+        self.started_at = None  # process age (seconds) when warm-up started
+        self.ready_at = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def _begin(self):
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+        self.started_at = process_age()
+        return True
+
+    def run(self, stages):
+        """Run (name, fn) stages in order in this thread, then mark ready (once per WarmUp)"""
+        if not self._begin():
+            return
+        for name, fn in (stages if self.enabled else []):
+            started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                self._failed(name, e)
+            self.stages[name] = round((time.perf_counter() - started) * 1000, 1)
+        self._finish()
+
+    def start(self, stages):
+        """run() on a background thread, so /health answers while the stages run (no-op once started)"""
+        if not self._started:
+            threading.Thread(target=self.run, args=(stages,), name='warm-up', daemon=True).start()
+
+    async def run_async(self, stages):
+        """run() on an event loop: coroutine functions are awaited, plain ones run in a thread"""
+        if not self._begin():
+            return
+        for name, fn in (stages if self.enabled else []):
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(fn):
+                    await fn()
+                else:
+                    await asyncio.to_thread(fn)
+            except Exception as e:
+                self._failed(name, e)
+            self.stages[name] = round((time.perf_counter() - started) * 1000, 1)
+        self._finish()
+
+    def _failed(self, name, error):
+        self.errors[name] = f"{type(error).__name__}: {error}"
+        logger.warning(f"Warm-up stage {name} failed: {error}")
+
+    def _finish(self):
+        self.ready_at = process_age()
+        self._ready.set()
+        stages = ', '.join(f"{name}={ms:.0f}ms" for name, ms in self.stages.items())
+        logger.info(f"Ready {self.ready_at * 1000:.0f}ms after process start"
+                    + (f" (warm-up: {stages})" if stages else ""))
+
+    def status(self):
+        """Body of GET /ready"""
+        return {
+            'ready': self.ready,
+            'startupMs': round(self.started_at * 1000, 1) if self.started_at is not None else None,
+            'readyMs': round(self.ready_at * 1000, 1) if self.ready_at is not None else None,
+            'stages': dict(self.stages),
+            'errors': dict(self.errors),
+        }
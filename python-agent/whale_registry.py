@@ -0,0 +1,94 @@
+"""
+Whale wallet registry
+Curated whale addresses loaded once from data/whale_wallets.json and indexed by
+chain and type. Used by GET /whales and to answer whale-list questions directly
+instead of sending the whole list to the model on every request.
+"""
+
+from collections import namedtuple
+import json
+import os
+
+WHALE_WALLETS_FILE = os.getenv(
+    'WHALE_WALLETS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'whale_wallets.json')
+)
+
+WhaleWallet = namedtuple('WhaleWallet', ['chain', 'address', 'label', 'description', 'type'])
+
+WHALE_DISCLAIMER = {
+    'id': "⚠️ Wallet institusi (exchange, bridge, treasury) punya pola transaksi yang berbeda dengan trader individu.\n"
+          "Copy address mana pun dan paste ke Middlekid untuk men-track-nya.\n\n"
+          "Tracking whale wallets untuk edukasi, bukan copy trading. Past performance ≠ future results.",
+    'en': "⚠️ Institutional wallets (exchanges, bridges, treasuries) behave differently from individual traders.\n"
+          "Copy any address and paste it into Middlekid to track it.\n\n"
+          "Tracking whale wallets untuk edukasi, bukan copy trading. Past performance ≠ future results.",
+}
+
+WHALE_INTRO = {
+    'id': "Berikut whale wallet aktif yang bisa kamu track:",
+    'en': "Here are active whale wallets you can track:",
+}
+
+
+class WhaleRegistry:
+    """Read-only whale wallets indexed by chain and by type"""
+
+    def __init__(self, chains, wallets):
+        self.chains = dict(chains)  # chain id -> display name, in display order
+        self.wallets = tuple(wallets)
+        self._by_chain = {}
+        self._by_type = {}
+        for wallet in self.wallets:
+            self._by_chain.setdefault(wallet.chain, []).append(wallet)
+            self._by_type.setdefault(wallet.type, []).append(wallet)
+
+    @classmethod
+    def load(cls, path=WHALE_WALLETS_FILE):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        wallets = []
+        for item in data['wallets']:
+            if item['chain'] not in data['chains']:
+                raise ValueError(f"Unknown chain '{item['chain']}' for whale {item['address']}")
+            wallets.append(WhaleWallet(
+                chain=item['chain'],
+                address=item['address'].lower(),
+                label=item['label'],
+                description=item.get('description', ''),
+                type=item['type'],
+            ))
+        return cls(data['chains'], wallets)
+
+    @property
+    def types(self):
+        return sorted(self._by_type)
+
+    def find(self, chains=None, wallet_type=None):
+        """Wallets filtered by chain ids and/or type, in registry order"""
+        if chains:
+            result = [w for chain in self.chains if chain in chains for w in self._by_chain.get(chain, [])]
+        else:
+            result = list(self.wallets)
+        if wallet_type:
+            result = [w for w in result if w.type == wallet_type]
+        return result
+
+    def render(self, chains=None, lang='id'):
+        """Numbered per-chain list in the chat format (blank line between chains)"""
+        wallets = self.find(chains) or self.find()
+        sections = []
+        for chain, name in self.chains.items():
+            chain_wallets = [w for w in wallets if w.chain == chain]
+            if not chain_wallets:
+                continue
+            items = []
+            for number, wallet in enumerate(chain_wallets, 1):
+                wallet_type = f"{wallet.label} - {wallet.description}" if wallet.description else wallet.label
+                items.append(f"{number}. Address: {wallet.address}\n   Type: {wallet_type}")
+            sections.append(f"**{name}:**\n" + "\n\n".join(items))
+        lang = lang if lang in WHALE_INTRO else 'id'
+        return f"{WHALE_INTRO[lang]}\n\n" + "\n\n".join(sections) + f"\n\n{WHALE_DISCLAIMER[lang]}"
+
+
+whale_registry = WhaleRegistry.load()